@@ -0,0 +1,180 @@
+from railwaynet import RailwayNetManager, PathEdgePoint, CONTRACTION_HIERARCHY, default_setup
+from pathfinding import SEARCH_MODES, DEFAULT_PROFILE, DIJKSTRA, WEIGHT_CALLBACKS
+from geograph import distances
+from networkx import NetworkXNoPath, NodeNotFound
+from contextlib import redirect_stdout
+from time import perf_counter
+from typing import Iterable, Iterator
+
+import numpy as np
+import argparse
+import csv
+import sys
+
+# region Constants
+
+# either end is given by its coordinates, the country is optional and narrows the snapping
+INPUT_COLUMNS = ('frm_lat', 'frm_lon', 'to_lat', 'to_lon')
+OUTPUT_COLUMNS = (
+    'id', 'status',
+    'frm_iso3', 'frm_lat', 'frm_lon', 'to_iso3', 'to_lat', 'to_lon',
+    'nodes', 'distance', 'time'
+    )
+
+OK = "ok"
+NO_PATH = "no_path"
+NO_NODE = "no_node"
+INVALID = "invalid"
+
+# rows written between flushes of the output
+FLUSH_ROWS = 100
+
+# endregion
+
+# region Types
+
+class BatchRouter:
+    """ answers origin-destination rows one by one over a manager loaded once """
+
+    # the search modes route a row only through the countries along the country path, a same-country row stays in its country,
+    # ch routes over the whole biggest component, so the two can give different routes and statuses for one row
+
+    # region Construction
+
+    def __init__(self, manager: RailwayNetManager, profile: str = DEFAULT_PROFILE, mode: str = DIJKSTRA):
+        self.manager = manager
+        self.profile = profile
+        self.mode = mode
+
+        self.counts = dict.fromkeys((OK, NO_PATH, NO_NODE, INVALID), 0)
+        self.time = 0.0
+
+        # a hierarchy cached by an earlier run is reused, only a missing or stale one is built
+        if self.mode == CONTRACTION_HIERARCHY and self.manager.get_hierarchy(self.profile) is None:
+            self.manager.prepare_hierarchies((self.profile, ))
+
+    # endregion
+
+    # region PublicMethods
+
+    def route(self, rows: Iterable[dict], with_paths: bool = False) -> Iterator[dict]:
+        """ one result per input row in input order, produced as soon as the row is read """
+        for index, row in enumerate(rows):
+            result = self.route_row(row, with_paths)
+            result['id'] = row.get('id') or index
+            self.counts[result['status']] += 1
+            yield result
+
+    def route_row(self, row: dict, with_paths: bool = False) -> dict:
+        result = dict.fromkeys(OUTPUT_COLUMNS)
+        try:
+            frm_lat, frm_lon, to_lat, to_lon = (float(row[column]) for column in INPUT_COLUMNS)
+        except (KeyError, TypeError, ValueError):
+            result['status'] = INVALID
+            return result
+
+        start = perf_counter()
+        start_node = self.snap(frm_lat, frm_lon, row.get('frm_iso3') or None)
+        finish_node = self.snap(to_lat, to_lon, row.get('to_iso3') or None)
+        if start_node is None or finish_node is None:
+            result['status'] = NO_NODE
+            return result
+
+        result['frm_iso3'], (result['frm_lat'], result['frm_lon']) = start_node.iso3, start_node.node.coord_reverse
+        result['to_iso3'], (result['to_lat'], result['to_lon']) = finish_node.iso3, finish_node.node.coord_reverse
+
+        self.manager.start_node = start_node
+        self.manager.finish_node = finish_node
+        paths = [None, None]
+        try:
+            self.manager.find_path(paths, profile=self.profile, mode=self.mode)
+        except (NetworkXNoPath, NodeNotFound):
+            result['status'] = NO_PATH
+        else:
+            path = paths[1]
+            lat = np.array([point.lat for point in path])
+            lon = np.array([point.lon for point in path])
+            result['status'] = OK
+            result['nodes'] = len(path)
+            result['distance'] = float(distances(lat[:-1], lon[:-1], lat[1:], lon[1:], self.manager.distance_mode).sum())
+            if with_paths:
+                result['path'] = "LINESTRING (" + ", ".join(f"{point.lon} {point.lat}" for point in path) + ")"
+        finally:
+            self.manager.start_node = None
+            self.manager.finish_node = None
+
+        elapsed = perf_counter() - start
+        self.time += elapsed
+        result['time'] = elapsed
+        return result
+
+    def snap(self, lat: float, lon: float, iso3: str = None) -> PathEdgePoint | None:
+        """ nearest rail node, within the country when it is given """
+        if iso3 is not None and iso3 not in self.manager.countries_sorted:
+            return None
+        points = self.manager.snap(lat, lon, iso3=iso3)
+        if not points:
+            return None
+        graph = self.manager.full_compact
+        node_iso3 = iso3 or graph.country(graph.node_country[graph.node_id(points[0])])
+        return PathEdgePoint(points[0], node_iso3)
+
+    # endregion
+
+# endregion
+
+# region Main
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Route origin-destination rows from a CSV file or stdin, results are streamed as CSV"
+        )
+    parser.add_argument("input", nargs="?", default="-", help="CSV with columns frm_lat, frm_lon, to_lat, to_lon "
+                        "and optional id, frm_iso3, to_iso3, '-' reads stdin")
+    parser.add_argument("--output", default="-", help="'-' writes stdout")
+    parser.add_argument("--data", default="./data/trains.csv")
+    parser.add_argument("--mode", choices=list(SEARCH_MODES) + [CONTRACTION_HIERARCHY], default=DIJKSTRA,
+                        help="search modes route rows through the countries along the country path, "
+                        "ch routes over the whole biggest component and may find routes the others do not")
+    parser.add_argument("--profile", choices=list(WEIGHT_CALLBACKS), default=DEFAULT_PROFILE)
+    parser.add_argument("--paths", action="store_true", help="add the route as a WKT linestring")
+    args = parser.parse_args()
+
+    # progress and cache messages go to stderr, stdout only carries results
+    start = perf_counter()
+    with redirect_stdout(sys.stderr):
+        manager, _ = default_setup(args.data)
+        router = BatchRouter(manager, args.profile, args.mode)
+    print(f"Network loaded in {perf_counter() - start:.1f} s", file=sys.stderr)
+
+    source = sys.stdin if args.input == "-" else open(args.input, newline="")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    start = perf_counter()
+    try:
+        columns = list(OUTPUT_COLUMNS) + (['path'] if args.paths else [])
+        writer = csv.DictWriter(target, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        with redirect_stdout(sys.stderr):
+            for index, result in enumerate(router.route(csv.DictReader(source), args.paths)):
+                writer.writerow(result)
+                if index % FLUSH_ROWS == 0:
+                    target.flush()
+    finally:
+        target.flush()
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    elapsed = perf_counter() - start
+    queries = sum(router.counts.values())
+    print(
+        f"{queries} queries in {elapsed:.1f} s, {queries / elapsed * 60 if elapsed else 0:.0f} per minute, "
+        + ", ".join(f"{status}: {number}" for status, number in router.counts.items()),
+        file=sys.stderr
+        )
+
+# endregion
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+from railwaynet import RailwayNetManager, PathEdgePoint, CONTRACTION_HIERARCHY, read_countries_data
+from routingmetrics import summary
+from pathfinding import SEARCH_MODES, DEFAULT_PROFILE
+from synthetic import SCALES, generate_trains
+from networkx import NetworkXNoPath
+from netcache import NetworkCache, cache_key
+from time import perf_counter
+from datetime import datetime
+
+import numpy as np
+import subprocess
+import argparse
+import platform
+import random
+import shutil
+import json
+import os
+
+# region Constants
+
+BENCHMARK_PATH = "./cached/benchmark"
+# relative to the scratch directory, next to the cache the manager has mapped
+SCRATCH_CACHE_PATH = "./cached/network_scratch"
+
+# endregion
+
+# region Types
+
+class Benchmark:
+    """ times every stage of the pipeline on synthetic data, all random choices come from the seed """
+
+    # region Construction
+
+    def __init__(self, scale: str = "world", seed: int = 0, queries: int = 100, repeats: int = 3):
+        self.scale = scale
+        self.seed = seed
+        self.queries = queries
+        self.repeats = repeats
+
+        self.results = dict()
+        self.manager = None
+
+    # endregion
+
+    # region PublicMethods
+
+    def run(self, modes: tuple[str] = SEARCH_MODES, hierarchy: bool = False, render: bool = True) -> dict:
+        # everything the manager writes to ./cached lands in a scratch directory
+        root = os.getcwd()
+        countries_data = read_countries_data()
+        shutil.rmtree(BENCHMARK_PATH, ignore_errors=True)
+        os.makedirs(os.path.join(BENCHMARK_PATH, "cached"))
+        os.chdir(BENCHMARK_PATH)
+        try:
+            start = perf_counter()
+            graph_data = generate_trains(countries_data, self.scale, self.seed)
+            self.results['generate'] = {'time': perf_counter() - start, 'trails': len(graph_data)}
+
+            self.__ingest(graph_data, countries_data)
+            self.__cache(graph_data, countries_data)
+            self.__get_nets()
+            self.__find_path(list(modes) + ([CONTRACTION_HIERARCHY] if hierarchy else []))
+            if render:
+                self.__render()
+        finally:
+            os.chdir(root)
+
+        return {
+            'meta'    : self.__meta(),
+            'results' : self.results
+            }
+
+    # endregion
+
+    # region ServiceMethods
+
+    def __ingest(self, graph_data, countries_data) -> None:
+        start = perf_counter()
+        self.manager = RailwayNetManager(graph_data, countries_data, seed=self.seed)
+        self.results['ingest'] = {
+            'time'  : perf_counter() - start,
+            'nodes' : self.manager.full_compact.number_of_nodes,
+            'edges' : self.manager.full_compact.number_of_edges
+            }
+
+    def __cache(self, graph_data, countries_data) -> None:
+        # saved to a copy, replacing the live cache would pull its mapped files from under the manager
+        cache = NetworkCache(SCRATCH_CACHE_PATH)
+        key = cache_key(graph_data[['iso3', 'shape']], countries_data, extra=(self.manager.distance_mode, self.seed))
+        rng = random.Random(self.seed)
+        save = []
+        manifest = []
+        shard = []
+        for _ in range(self.repeats):
+            start = perf_counter()
+            cache.save(key, self.manager.compact_nets, self.manager.full_compact, metadata={'seed': self.seed})
+            save.append(perf_counter() - start)
+            # loading only checks the manifest, a country is read from disk when first used
+            start = perf_counter()
+            shards = cache.load(key)
+            manifest.append(perf_counter() - start)
+            start = perf_counter()
+            shards[rng.choice(self.manager.countries_sorted)]
+            shard.append(perf_counter() - start)
+        shutil.rmtree(cache.path, ignore_errors=True)
+
+        # a new manager over the cache ingest wrote, timed up to the answer of its first query
+        iso3 = self.manager.countries_sorted[0]
+        node_ids = self.manager.compact_nets[iso3].biggest_component_ids()
+        ends = [PathEdgePoint(self.manager.compact_nets[iso3].point(node_id), iso3) for node_id in (node_ids[0], node_ids[-1])]
+        start = perf_counter()
+        manager = RailwayNetManager(graph_data, countries_data, seed=self.seed)
+        construction = perf_counter() - start
+        manager.start_node, manager.finish_node = ends
+        start = perf_counter()
+        manager.find_path([None, None])
+        first_query = perf_counter() - start
+
+        self.results['cache'] = {
+            'save'           : summary(save),
+            'manifest_load'  : summary(manifest),
+            'shard_load'     : summary(shard),
+            'warm_start'     : construction,
+            'first_query'    : first_query
+            }
+
+    def __get_nets(self) -> None:
+        rng = random.Random(self.seed)
+        countries = self.manager.countries_sorted
+        times = []
+        for _ in range(self.repeats):
+            iso3 = rng.choice(countries)
+            corridor = sorted(self.manager.countries_data[iso3]['neighbours'] & set(countries))
+            start = perf_counter()
+            self.manager.get_nets(corridor)
+            times.append(perf_counter() - start)
+        self.results['get_nets'] = summary(times)
+
+    def __find_path(self, modes: list[str]) -> None:
+        graph = self.manager.full_compact
+        rng = random.Random(self.seed)
+        nodes = graph.biggest_component_ids().tolist()
+        pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(self.queries)]
+
+        if CONTRACTION_HIERARCHY in modes:
+            start = perf_counter()
+            cached = self.manager.get_hierarchy(DEFAULT_PROFILE) is not None
+            if not cached:
+                self.manager.prepare_hierarchies((DEFAULT_PROFILE, ))
+            self.results['prepare_hierarchies'] = {'time': perf_counter() - start, 'cached': cached}
+
+        paths = [None, None]
+        self.results['find_path'] = dict()
+        for mode in modes:
+            self.manager.metrics.reset()
+            times = []
+            settled = []
+            for source, target in pairs:
+                self.manager.start_node = PathEdgePoint(graph.point(source), graph.country(graph.node_country[source]))
+                self.manager.finish_node = PathEdgePoint(graph.point(target), graph.country(graph.node_country[target]))
+                try:
+                    start = perf_counter()
+                    self.manager.find_path(paths, mode=mode)
+                    times.append(perf_counter() - start)
+                except NetworkXNoPath:
+                    continue
+                settled.append(self.manager.settled)
+            self.results['find_path'][mode] = summary(times) | {
+                'settled' : float(np.mean(settled)) if settled else None,
+                'phases'  : self.manager.metrics.summary()
+                }
+        self.results['corridors'] = self.manager.corridors.stats()
+        self.manager.start_node = None
+        self.manager.finish_node = None
+
+    def __render(self) -> None:
+        try:
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+            import pygame as pg
+            from graphrenderer import GraphRenderer
+        except ImportError as error:
+            self.results['render'] = {'skipped': str(error)}
+            return
+
+        pg.init()
+        surface = pg.Surface((1280, 720))
+        full_graph = self.manager.full_graph
+        start = perf_counter()
+        renderer = GraphRenderer(surface, full_graph, full_graph, ['white'])
+        setup = perf_counter() - start
+        cold = []
+        warm = []
+        for _ in range(self.repeats):
+            renderer.tiles.clear()
+            start = perf_counter()
+            renderer.render_internal()
+            cold.append(perf_counter() - start)
+            start = perf_counter()
+            renderer.render_internal()
+            warm.append(perf_counter() - start)
+        pg.quit()
+        self.results['render'] = {'setup': setup, 'frame': summary(cold), 'cached_frame': summary(warm)}
+
+    def __meta(self) -> dict:
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+                ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'scale'     : self.scale,
+            'seed'      : self.seed,
+            'queries'   : self.queries,
+            'repeats'   : self.repeats,
+            'commit'    : commit,
+            'python'    : platform.python_version(),
+            'machine'   : platform.machine(),
+            'cpus'      : os.cpu_count(),
+            'timestamp' : datetime.now().isoformat(timespec='seconds')
+            }
+
+    # endregion
+
+# endregion
+
+# region Main
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the railway network pipeline on synthetic data")
+    parser.add_argument("--scale", choices=list(SCALES), default="world")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", choices=SEARCH_MODES, default=list(SEARCH_MODES))
+    parser.add_argument("--hierarchy", action="store_true", help="also build and query contraction hierarchies")
+    parser.add_argument("--no-render", action="store_true")
+    parser.add_argument("--output", default="benchmark.json")
+    args = parser.parse_args()
+
+    report = Benchmark(args.scale, args.seed, args.queries, args.repeats).run(
+        tuple(args.modes), hierarchy=args.hierarchy, render=not args.no_render
+        )
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(json.dumps(report['results'], indent=4))
+
+# endregion
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse import csr_matrix
+from geograph import Point
+
+import numpy as np
+
+# region Constants
+
+NO_COUNTRY = -1
+
+EDGE_ATTRIBUTES = ('distance', 'speed', 'centrality', 'cost')
+
+# endregion
+
+# region Types
+
+class CompactGraph:
+    """ integer indexed railway graph: coordinates and edge attributes in typed columns, CSR adjacency """
+
+    # region Construction
+
+    def __init__(
+            self,
+            lat: np.ndarray,
+            lon: np.ndarray,
+            node_country: np.ndarray,
+            src: np.ndarray,
+            dst: np.ndarray,
+            edge_country: np.ndarray,
+            countries: list[str],
+            component: np.ndarray = None,
+            **edge_attributes: np.ndarray
+        ):
+        # nodes
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.node_country = np.asarray(node_country, dtype=np.int16)
+        # connected component label of every node, computed on first use unless given
+        self.component = None if component is None else np.asarray(component, dtype=np.int32)
+
+        # edges, missing attribute values are stored as nan
+        self.src = np.asarray(src, dtype=np.int32)
+        self.dst = np.asarray(dst, dtype=np.int32)
+        self.edge_country = np.asarray(edge_country, dtype=np.int16)
+        for attr in EDGE_ATTRIBUTES:
+            values = edge_attributes.get(attr)
+            setattr(self, attr, np.full(len(self.src), np.nan) if values is None else np.asarray(values, dtype=np.float64))
+
+        self.countries = list(countries)
+
+        self.__adjacency = None
+        self.__lookup = None
+
+    # endregion
+
+    # region Properties
+
+    @property
+    def number_of_nodes(self) -> int:
+        return len(self.lat)
+
+    @property
+    def number_of_edges(self) -> int:
+        return len(self.src)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.lat, self.lon, self.node_country, self.src, self.dst, self.edge_country]
+        if self.component is not None:
+            arrays.append(self.component)
+        arrays += [getattr(self, attr) for attr in EDGE_ATTRIBUTES]
+        if self.__adjacency is not None:
+            arrays += list(self.__adjacency)
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def adjacency(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ CSR adjacency: neighbours of node i are indices[indptr[i]:indptr[i + 1]], edge_ids hold edge rows """
+        if self.__adjacency is None:
+            ends = np.concatenate((self.src, self.dst))
+            others = np.concatenate((self.dst, self.src))
+            edge_ids = np.tile(np.arange(self.number_of_edges, dtype=np.int32), 2)
+            order = np.argsort(ends, kind='stable')
+            indptr = np.zeros(self.number_of_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(ends, minlength=self.number_of_nodes), out=indptr[1:])
+            self.__adjacency = indptr, others[order], edge_ids[order]
+        return self.__adjacency
+
+    # endregion
+
+    # region PublicMethods
+
+    def point(self, node_id: int) -> Point:
+        return Point(float(self.lat[node_id]), float(self.lon[node_id]))
+
+    def points(self, node_ids=None) -> list[Point]:
+        lat = self.lat if node_ids is None else self.lat[node_ids]
+        lon = self.lon if node_ids is None else self.lon[node_ids]
+        return [Point(node_lat, node_lon) for node_lat, node_lon in zip(lat.tolist(), lon.tolist())]
+
+    def country(self, code: int) -> str | None:
+        return None if code == NO_COUNTRY else self.countries[code]
+
+    def country_code(self, iso3: str) -> int:
+        return self.countries.index(iso3) if iso3 in self.countries else NO_COUNTRY
+
+    def node_ids(self, lat, lon) -> np.ndarray:
+        """ ids of nodes with exactly these coordinates, -1 where there is no such node """
+        keys, order = self.__get_lookup()
+        queries = np.asarray(lat, dtype=np.float64) + 1j * np.asarray(lon, dtype=np.float64)
+        positions = np.clip(np.searchsorted(keys, queries), 0, max(len(keys) - 1, 0))
+        if len(keys) == 0:
+            return np.full(np.shape(queries), -1, dtype=np.int64)
+        return np.where(keys[positions] == queries, order[positions], -1)
+
+    def node_id(self, point: Point) -> int | None:
+        node_id = int(self.node_ids(point.lat, point.lon))
+        return None if node_id < 0 else node_id
+
+    def neighbours(self, node_id: int) -> np.ndarray:
+        indptr, indices, _ = self.adjacency
+        return indices[indptr[node_id]:indptr[node_id + 1]]
+
+    def edge_attributes(self, edge_id: int) -> dict:
+        attributes = {
+            attr: float(getattr(self, attr)[edge_id])
+                for attr in EDGE_ATTRIBUTES if not np.isnan(getattr(self, attr)[edge_id])
+            }
+        attributes['iso3'] = self.country(self.edge_country[edge_id])
+        return attributes
+
+    def component_labels(self) -> np.ndarray:
+        if self.component is None:
+            matrix = csr_matrix(
+                (np.ones(self.number_of_edges, dtype=np.int8), (self.src, self.dst)),
+                shape=(self.number_of_nodes, self.number_of_nodes)
+                )
+            self.component = connected_components(matrix, directed=False)[1].astype(np.int32)
+        return self.component
+
+    def component_sizes(self) -> np.ndarray:
+        """ number of nodes in every component, indexed by label """
+        return np.bincount(self.component_labels(), minlength=1 if self.number_of_nodes else 0)
+
+    def connected(self, a: int, b: int) -> bool:
+        labels = self.component_labels()
+        return bool(labels[a] == labels[b])
+
+    def biggest_component_ids(self) -> np.ndarray:
+        labels = self.component_labels()
+        if len(labels) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(labels == np.argmax(np.bincount(labels)))
+
+    def subgraph(self, node_ids: np.ndarray) -> 'CompactGraph':
+        """ induced subgraph, node ids are renumbered in the given order """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        node_map = np.full(self.number_of_nodes, -1, dtype=np.int64)
+        node_map[node_ids] = np.arange(len(node_ids))
+        edge_mask = (node_map[self.src] >= 0) & (node_map[self.dst] >= 0)
+        return CompactGraph(
+            self.lat[node_ids],
+            self.lon[node_ids],
+            self.node_country[node_ids],
+            node_map[self.src[edge_mask]],
+            node_map[self.dst[edge_mask]],
+            self.edge_country[edge_mask],
+            self.countries,
+            **{attr: getattr(self, attr)[edge_mask] for attr in EDGE_ATTRIBUTES}
+            )
+
+    @staticmethod
+    def compose(graphs: list['CompactGraph']) -> 'CompactGraph':
+        """ union of graphs with nodes matched by coordinates, attributes of later graphs win like in nx.compose """
+
+        countries = []
+        for graph in graphs:
+            countries += [country for country in graph.countries if country not in countries]
+
+        def remap(codes: np.ndarray, graph: 'CompactGraph') -> np.ndarray:
+            table = np.array([countries.index(country) for country in graph.countries] + [NO_COUNTRY], dtype=np.int16)
+            return table[codes]
+
+        lat = np.concatenate([graph.lat for graph in graphs] + [np.empty(0)])
+        lon = np.concatenate([graph.lon for graph in graphs] + [np.empty(0)])
+        node_country = np.concatenate([remap(graph.node_country, graph) for graph in graphs] + [np.empty(0, dtype=np.int16)])
+        offsets = np.cumsum([0] + [graph.number_of_nodes for graph in graphs])
+        src = np.concatenate([graph.src + offset for graph, offset in zip(graphs, offsets)] + [np.empty(0, dtype=np.int64)])
+        dst = np.concatenate([graph.dst + offset for graph, offset in zip(graphs, offsets)] + [np.empty(0, dtype=np.int64)])
+        edge_country = np.concatenate([remap(graph.edge_country, graph) for graph in graphs] + [np.empty(0, dtype=np.int16)])
+        attributes = {
+            attr: np.concatenate([getattr(graph, attr) for graph in graphs] + [np.empty(0)]) for attr in EDGE_ATTRIBUTES
+            }
+
+        # nodes are numbered by first appearance, the last appearance gives the country
+        keys = lat + 1j * lon
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        last = len(keys) - 1 - np.unique(keys[::-1], return_index=True)[1]
+        rank = np.argsort(first, kind='stable')
+        new_ids = np.empty(len(first), dtype=np.int64)
+        new_ids[rank] = np.arange(len(first))
+        node_map = new_ids[inverse.ravel()]
+
+        # edges are kept in order of first appearance with the attributes of the last one
+        src, dst = node_map[src], node_map[dst]
+        pair_keys = np.minimum(src, dst) * len(first) + np.maximum(src, dst)
+        _, first_edges = np.unique(pair_keys, return_index=True)
+        last_edges = len(pair_keys) - 1 - np.unique(pair_keys[::-1], return_index=True)[1]
+        edge_order = np.argsort(first_edges, kind='stable')
+        first_edges, last_edges = first_edges[edge_order], last_edges[edge_order]
+
+        return CompactGraph(
+            lat[first[rank]],
+            lon[first[rank]],
+            node_country[last[rank]],
+            src[first_edges],
+            dst[first_edges],
+            edge_country[last_edges],
+            countries,
+            **{attr: values[last_edges] for attr, values in attributes.items()}
+            )
+
+    # endregion
+
+    # region OverloadMethods
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_CompactGraph__adjacency'] = None
+        state['_CompactGraph__lookup'] = None
+        return state
+
+    # endregion
+
+    # region ServiceMethods
+
+    def __get_lookup(self) -> tuple[np.ndarray, np.ndarray]:
+        if self.__lookup is None:
+            keys = self.lat + 1j * self.lon
+            order = np.argsort(keys, kind='stable')
+            self.__lookup = keys[order], order
+        return self.__lookup
+
+    # endregion
+
+# endregion
@@ -0,0 +1,395 @@
+from pathfinding import get_weights, unwind
+from compactgraph import CompactGraph
+from multiprocessing.connection import Connection
+from networkx import NetworkXNoPath
+from heapq import heappush, heappop
+from itertools import count
+
+import multiprocessing
+import numpy as np
+import hashlib
+import math
+import os
+
+# region Constants
+
+# witness searches give up after settling this many nodes and add the shortcut
+WITNESS_SETTLED_LIMIT = 64
+
+NO_MIDDLE = -1
+
+# jobs of the witness processes
+EDGE_DIFFERENCES = "edge_differences"
+SHORTCUTS = "shortcuts"
+CONTRACT = "contract"
+
+# endregion
+
+# region Types
+
+class ContractionHierarchy:
+    """ contraction hierarchy of a compact graph for one weight profile """
+
+    # region Construction
+
+    def __init__(
+            self,
+            profile: str,
+            node_ids: np.ndarray,
+            rank: np.ndarray,
+            indptr: np.ndarray,
+            indices: np.ndarray,
+            weights: np.ndarray,
+            middles: np.ndarray,
+            signature: str
+        ):
+        self.profile = profile
+        # hierarchy node i is node node_ids[i] of the graph it was built for
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)
+        self.rank = np.asarray(rank, dtype=np.int64)
+        # upward edges in CSR form, middles hold the contracted node of a shortcut
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.middles = np.asarray(middles, dtype=np.int64)
+        self.signature = signature
+
+        self.settled = 0
+
+        self.__search = None
+
+    # endregion
+
+    # region PublicMethods
+
+    @staticmethod
+    def build(graph: CompactGraph, profile: str, node_ids: np.ndarray = None, workers: int = None) -> 'ContractionHierarchy':
+        """ contracts rounds of independent nodes, each of lower edge-difference priority than all of its neighbours,
+        the witness searches of a round are spread over worker processes """
+
+        node_ids = np.arange(graph.number_of_nodes) if node_ids is None else np.asarray(node_ids, dtype=np.int64)
+        component = graph.subgraph(node_ids)
+        edge_weights = get_weights(component, profile)
+
+        n = component.number_of_nodes
+        adjacency = [dict() for _ in range(n)]
+        for u, v, w in zip(component.src.tolist(), component.dst.tolist(), edge_weights.tolist()):
+            if u != v and w < adjacency[u].get(v, (math.inf, ))[0]:
+                adjacency[u][v] = (w, NO_MIDDLE)
+                adjacency[v][u] = (w, NO_MIDDLE)
+
+        contracted_neighbours = [0] * n
+        rank = [0] * n
+        up_edges = []
+
+        pool = WitnessPool(adjacency, os.cpu_count() if workers is None else workers)
+        try:
+            priorities = pool.edge_differences(list(range(n)))
+            # neighbours of contracted nodes have stale priorities, like the lazy updates of a single queue,
+            # only those about to be contracted are recomputed
+            stale = set()
+            remaining = list(range(n))
+            order = 0
+            while remaining:
+                candidates = [v for v in remaining if is_local_minimum(adjacency, priorities, v)]
+                recomputed = [v for v in candidates if v in stale]
+                for v, difference in zip(recomputed, pool.edge_differences(recomputed)):
+                    priorities[v] = difference + contracted_neighbours[v]
+                stale.difference_update(recomputed)
+
+                # no two nodes of a round are neighbours, so their shortcuts can be found at once,
+                # the node of least priority, ties broken by id, is among them once its priority is recomputed
+                batch = [v for v in candidates if is_local_minimum(adjacency, priorities, v)]
+                contractions = list(zip(batch, pool.shortcuts(batch)))
+                for v, edges in zip(batch, pool.contract(contractions)):
+                    for u, (w, middle) in edges.items():
+                        up_edges.append((v, u, w, middle))
+                        contracted_neighbours[u] += 1
+                        stale.add(u)
+                    rank[v] = order
+                    order += 1
+
+                contracted = set(batch)
+                remaining = [v for v in remaining if v not in contracted]
+        finally:
+            pool.close()
+
+        up_edges.sort()
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount([edge[0] for edge in up_edges], minlength=n), out=indptr[1:])
+        return ContractionHierarchy(
+            profile,
+            node_ids,
+            rank,
+            indptr,
+            [edge[1] for edge in up_edges],
+            [edge[2] for edge in up_edges],
+            [edge[3] for edge in up_edges],
+            hierarchy_signature(graph, profile, node_ids)
+            )
+
+    def shortest_path(self, source: int, target: int) -> list[int]:
+        """ source and target are node ids of the original graph, so is the returned path """
+
+        indptr, indices, weights, local_ids, _ = self.__get_search()
+        if source not in local_ids or target not in local_ids:
+            raise NetworkXNoPath(f"Node {source} or {target} is not in the hierarchy")
+        s, t = local_ids[source], local_ids[target]
+
+        dist = ({}, {})
+        seen = ({s: 0.0}, {t: 0.0})
+        pred = ({s: None}, {t: None})
+        c = count()
+        heaps = ([(0.0, next(c), s)], [(0.0, next(c), t)])
+        best = math.inf
+        meeting = None
+        direction = 1
+        while (heaps[0] and heaps[0][0][0] < best) or (heaps[1] and heaps[1][0][0] < best):
+            direction = 1 - direction
+            if not heaps[direction] or heaps[direction][0][0] >= best:
+                direction = 1 - direction
+            d, _, u = heappop(heaps[direction])
+            if u in dist[direction]:
+                continue
+            dist[direction][u] = d
+            other = dist[1 - direction]
+            if u in other and d + other[u] < best:
+                best = d + other[u]
+                meeting = u
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+                vd = d + weights[i]
+                if v not in dist[direction] and (v not in seen[direction] or vd < seen[direction][v]):
+                    seen[direction][v] = vd
+                    pred[direction][v] = u
+                    heappush(heaps[direction], (vd, next(c), v))
+
+        self.settled = len(dist[0]) + len(dist[1])
+        if meeting is None:
+            raise NetworkXNoPath(f"Node {target} not reachable from {source}")
+
+        backward = unwind(pred[1], meeting)
+        backward.reverse()
+        up_path = unwind(pred[0], meeting) + backward[1:]
+        path = [up_path[0]]
+        for u, v in zip(up_path[:-1], up_path[1:]):
+            self.__unpack(u, v, path)
+        return self.node_ids[path].tolist()
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                profile=np.array(self.profile),
+                node_ids=self.node_ids,
+                rank=self.rank,
+                indptr=self.indptr,
+                indices=self.indices,
+                weights=self.weights,
+                middles=self.middles,
+                signature=np.array(self.signature)
+                )
+
+    @staticmethod
+    def load(path: str) -> 'ContractionHierarchy':
+        with np.load(path) as data:
+            return ContractionHierarchy(
+                str(data['profile']),
+                data['node_ids'],
+                data['rank'],
+                data['indptr'],
+                data['indices'],
+                data['weights'],
+                data['middles'],
+                str(data['signature'])
+                )
+
+    # endregion
+
+    # region ServiceMethods
+
+    def __get_search(self) -> tuple:
+        if self.__search is None:
+            tails = np.repeat(np.arange(len(self.rank)), np.diff(self.indptr))
+            pairs = zip(np.minimum(tails, self.indices).tolist(), np.maximum(tails, self.indices).tolist())
+            middles = dict(zip(pairs, self.middles.tolist()))
+            self.__search = (
+                self.indptr.tolist(),
+                self.indices.tolist(),
+                self.weights.tolist(),
+                {node_id: local_id for local_id, node_id in enumerate(self.node_ids.tolist())},
+                middles
+                )
+        return self.__search
+
+    def __unpack(self, u: int, v: int, path: list[int]) -> None:
+        """ appends the original edges of (possibly shortcut) edge u-v to path, u is already there """
+        middles = self.__search[4]
+        stack = [(u, v)]
+        while stack:
+            a, b = stack.pop()
+            middle = middles[(a, b) if a < b else (b, a)]
+            if middle == NO_MIDDLE:
+                path.append(b)
+            else:
+                stack.append((middle, b))
+                stack.append((a, middle))
+
+    # endregion
+
+class WitnessPool:
+    """ forked processes holding a copy of the adjacency each, kept in step with the caller's by replaying its contractions,
+    without fork or with a single worker the searches run in the calling process """
+
+    # region Construction
+
+    def __init__(self, adjacency: list[dict], workers: int = 1):
+        self.adjacency = adjacency
+        self.processes = []
+        self.connections = []
+        if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+            for _ in range(workers):
+                connection, child = context.Pipe()
+                process = context.Process(target=_serve_witnesses, args=(child, adjacency), daemon=True)
+                process.start()
+                child.close()
+                self.processes.append(process)
+                self.connections.append(connection)
+
+    # endregion
+
+    # region PublicMethods
+
+    def edge_differences(self, nodes: list[int]) -> list[int]:
+        """ shortcuts contracting a node would add less the edges it would remove """
+        return self.__run(EDGE_DIFFERENCES, nodes, None)
+
+    def shortcuts(self, batch: list[int]) -> list[list[tuple[int, int, float]]]:
+        """ shortcuts of every node of a batch contracted at once, witnesses avoid the whole batch """
+        return self.__run(SHORTCUTS, batch, set(batch))
+
+    def contract(self, contractions: list[tuple[int, list]]) -> list[dict]:
+        """ applies the contractions here and in every process, returns the edges each contracted node had left """
+        for connection in self.connections:
+            connection.send((CONTRACT, contractions, None))
+        return [contract(self.adjacency, v, v_shortcuts) for v, v_shortcuts in contractions]
+
+    def close(self) -> None:
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.connections = []
+
+    # endregion
+
+    # region ServiceMethods
+
+    def __run(self, job: str, nodes: list[int], excluded: set | None) -> list:
+        if not self.connections or len(nodes) < len(self.connections):
+            return _witness_job(self.adjacency, job, nodes, excluded)
+
+        # every process takes every k-th node, so the expensive high degree nodes are spread evenly
+        k = len(self.connections)
+        for i, connection in enumerate(self.connections):
+            connection.send((job, nodes[i::k], excluded))
+        results = [None] * len(nodes)
+        for i, connection in enumerate(self.connections):
+            results[i::k] = connection.recv()
+        return results
+
+    # endregion
+
+# endregion
+
+# region Functions
+
+def shortcuts(adjacency: list[dict], v: int, excluded: set = frozenset()) -> list[tuple[int, int, float]]:
+    """ shortcuts needed to contract v, found with settle-limited witness searches that avoid v and the excluded nodes """
+
+    neighbours = [(u, w) for u, (w, _) in adjacency[v].items()]
+    if len(neighbours) < 2:
+        return []
+
+    result = []
+    for index, (u, u_weight) in enumerate(neighbours[:-1]):
+        targets = {x: u_weight + x_weight for x, x_weight in neighbours[index + 1:]}
+        limit = max(targets.values())
+        remaining = len(targets)
+
+        dist = {}
+        seen = {u: 0.0}
+        heap = [(0.0, u)]
+        while heap and remaining and len(dist) < WITNESS_SETTLED_LIMIT:
+            d, a = heappop(heap)
+            if a in dist:
+                continue
+            dist[a] = d
+            if a in targets:
+                remaining -= 1
+            for b, (w, _) in adjacency[a].items():
+                bd = d + w
+                if b != v and bd <= limit and bd < seen.get(b, math.inf) and b not in excluded:
+                    seen[b] = bd
+                    heappush(heap, (bd, b))
+
+        for x, via in targets.items():
+            if dist.get(x, math.inf) > via:
+                result.append((u, x, via))
+    return result
+
+def is_local_minimum(adjacency: list[dict], priorities: list[int], v: int) -> bool:
+    """ v comes before every neighbour by priority, then by id """
+    return all((priorities[v], v) < (priorities[u], u) for u in adjacency[v])
+
+def contract(adjacency: list[dict], v: int, v_shortcuts: list[tuple[int, int, float]]) -> dict:
+    """ adds the shortcuts of v and takes it out of the graph, returns its edges """
+    for u, x, w in v_shortcuts:
+        if w < adjacency[u].get(x, (math.inf, ))[0]:
+            adjacency[u][x] = (w, v)
+            adjacency[x][u] = (w, v)
+    edges = adjacency[v]
+    for u in edges:
+        del adjacency[u][v]
+    adjacency[v] = dict()
+    return edges
+
+def hierarchy_signature(graph: CompactGraph, profile: str, node_ids: np.ndarray) -> str:
+    """ identifies the graph, node set and weights a hierarchy was built for """
+    digest = hashlib.sha1(profile.encode())
+    for array in (graph.lat, graph.lon, graph.src, graph.dst, get_weights(graph, profile), np.asarray(node_ids, dtype=np.int64)):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+def build_hierarchies(
+        graph: CompactGraph,
+        profiles: list[str],
+        node_ids: np.ndarray = None,
+        workers: int = None
+    ) -> dict[str, ContractionHierarchy]:
+    """ contracts one profile after the other, each on all workers """
+    return {profile: ContractionHierarchy.build(graph, profile, node_ids, workers) for profile in profiles}
+
+def _witness_job(adjacency: list[dict], job: str, nodes: list[int], excluded: set | None) -> list:
+    if job == EDGE_DIFFERENCES:
+        return [len(shortcuts(adjacency, v)) - len(adjacency[v]) for v in nodes]
+    return [shortcuts(adjacency, v, excluded) for v in nodes]
+
+def _serve_witnesses(connection: Connection, adjacency: list[dict]) -> None:
+    try:
+        while (message := connection.recv()) is not None:
+            job, payload, excluded = message
+            if job == CONTRACT:
+                for v, v_shortcuts in payload:
+                    contract(adjacency, v, v_shortcuts)
+            else:
+                connection.send(_witness_job(adjacency, job, payload, excluded))
+    except EOFError:
+        pass
+    finally:
+        connection.close()
+
+# endregion
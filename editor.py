@@ -1,12 +1,15 @@
 from graphrenderer import GraphRenderer
 from railwaynet import RailwayNetManager, COLORS
 from guirenderer import GUIRenderer
-from threading import Thread
+from routingworker import RoutingWorker
 import pygame as pg
 
 class Editor:
     def __init__(self, railway_net_manager: RailwayNetManager):
 
+        # the routing process is started before the display exists
+        self.router = RoutingWorker(railway_net_manager)
+
         pg.init()
         
         # init application screen
@@ -36,35 +39,40 @@ class Editor:
             self.search_range
             )
 
-    def find_path_routine(self):
-        self.railway_net_manager.find_path(self.current_paths)
-        self.graph_renderer.render()
-        animate = False
+    def manage_route_event(self, event: pg.event):
+        # a result posted just before a reset or a newer query is still in the event queue
+        if event.type != self.router.event_type or event.request != self.router.latest:
+            return
+        if event.error is not None:
+            print(f"Path not found: {event.error}")
+            return
+
+        self.current_paths = event.paths
         if self.current_paths[1] is not None:
             if self.current_paths[0] is not None:
                 self.current_country = "full"
-                self.graph_renderer.update_graph(self.railway_net_manager.full_graph.get_biggest_component())
-                self.graph_renderer.render(animate=True)
+                self.graph_renderer.update_graph(self.railway_net_manager.full_graph.get_biggest_component(), "full")
 
             self.graph_renderer.update_path(self.current_paths[1])
-            self.graph_renderer.render()
+        self.graph_renderer.render()
 
     def manage_guirenderer_event(self, event: pg.event):
         result = self.gui_renderer.check_event(event)
         if result is not None:
             if result == "reset":
+                self.router.cancel()
                 self.railway_net_manager.start_node = None
                 self.railway_net_manager.finish_node = None
                 self.graph_renderer.path = None
                 self.graph_renderer.path_points_data = None
-                self.graph_renderer.update_graph(self.railway_net_manager.full_graph.get_biggest_component())
+                self.graph_renderer.update_graph(self.railway_net_manager.full_graph.get_biggest_component(), "full")
             else:
                 self.current_country = result
                 if result == "full":
-                    self.graph_renderer.update_graph(self.railway_net_manager.full_graph.get_biggest_component())
+                    self.graph_renderer.update_graph(self.railway_net_manager.full_graph.get_biggest_component(), "full")
                 else:
-                    self.graph_renderer.update_graph(self.railway_net_manager.get_net(result))
-            self.graph_renderer.render(True)
+                    self.graph_renderer.update_graph(self.railway_net_manager.get_net(result), result)
+            self.graph_renderer.render()
 
     def manage_graphrenderer_event(self, event: pg.event):
         result = self.graph_renderer.check_event(event)
@@ -73,12 +81,15 @@ class Editor:
             self.graph_renderer.render()
             if self.railway_net_manager.start_node is not None and \
                 self.railway_net_manager.finish_node is not None:
-                t = Thread(target=self.find_path_routine)
-                t.start()
+                self.router.submit(self.railway_net_manager.start_node, self.railway_net_manager.finish_node)
+
 
+    def manage_view_event(self, event: pg.event):
+        if self.graph_renderer.check_view_event(event):
+            self.graph_renderer.render()
 
     def run(self):
-        self.graph_renderer.render(animate=True)
+        self.graph_renderer.render()
         self.path = None
 
         self.running = True
@@ -91,6 +102,8 @@ class Editor:
                         self.running = False
 
                 self.manage_guirenderer_event(event)
+                self.manage_view_event(event)
+                self.manage_route_event(event)
 
                 if self.current_country != "full":
                     self.manage_graphrenderer_event(event)
@@ -104,3 +117,5 @@ class Editor:
             pg.draw.circle(self.screen, 'blue', pg.mouse.get_pos(), self.search_range, 1)
 
             pg.display.update()
+
+        self.router.close()
@@ -1,8 +1,19 @@
 import networkx as nx
+import numpy as np
 
-from matplotlib import pyplot as plt
 from geopy import distance
 
+# region Constants
+
+HAVERSINE = "haversine"
+GEODESIC = "geodesic"
+
+WGS84_MAJOR_AXIS, _, WGS84_FLATTENING = distance.ELLIPSOIDS['WGS-84']
+VINCENTY_ITERATIONS = 200
+VINCENTY_TOLERANCE = 1e-12
+
+# endregion
+
 class Color:
 
     # region construction
@@ -17,13 +28,25 @@ class Color:
 
 class Point:
 
+    __slots__ = ('lat', 'lon')
+
     # region Construction
 
     def __init__(self, lat: float, lon: float):
         self.lat = lat
         self.lon = lon
-        self.coord = (lon, lat)
-        self.coord_reverse = (lat, lon)
+
+    # endregion
+
+    # region Properties
+
+    @property
+    def coord(self) -> tuple[float, float]:
+        return (self.lon, self.lat)
+
+    @property
+    def coord_reverse(self) -> tuple[float, float]:
+        return (self.lat, self.lon)
 
     # endregion
 
@@ -40,7 +63,18 @@ class Point:
         return self.lat == other.lat and self.lon == other.lon
 
     def __hash__(self):
-        return hash(self.coord)
+        return hash((self.lon, self.lat))
+
+    def __getstate__(self):
+        return (self.lat, self.lon)
+
+    def __setstate__(self, state):
+        # pickles made before __slots__ carry the whole instance dict
+        if isinstance(state, tuple) and len(state) == 2 and isinstance(state[1], dict):
+            state = state[1]
+        if isinstance(state, dict):
+            state = (state['lat'], state['lon'])
+        self.lat, self.lon = state
 
     # endregion
 
@@ -66,4 +100,76 @@ class GeoGraph(nx.Graph):
                 pos=dict(zip(self.nodes, [node.coord for node in self.nodes]))
                 )
 
-    # endregion
\ No newline at end of file
+    # endregion
+
+# region Functions
+
+def distances(lat1, lon1, lat2, lon2, mode: str = GEODESIC) -> np.ndarray:
+    """ broadcasted distances in km between coordinate arrays (degrees) """
+
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(
+        *(np.asarray(value, dtype=np.float64) for value in (lat1, lon1, lat2, lon2))
+        )
+    if mode == HAVERSINE:
+        return _haversine(lat1, lon1, lat2, lon2)
+    if mode == GEODESIC:
+        return _vincenty(lat1, lon1, lat2, lon2)
+    raise ValueError(f"Unknown distance mode '{mode}'")
+
+def _haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(lon2 - lon1)
+    h = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * distance.EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+def _vincenty(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """ vectorized Vincenty inverse formula, nearly antipodal pairs fall back to geopy """
+
+    a = WGS84_MAJOR_AXIS
+    f = WGS84_FLATTENING
+    b = (1 - f) * a
+
+    big_l = np.radians(lon2 - lon1)
+    u1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    u2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    lam = big_l.copy()
+    delta = np.full(lam.shape, np.inf)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(VINCENTY_ITERATIONS):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt((cos_u2 * sin_lam) ** 2 + (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam) ** 2)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+            c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_previous = lam
+            lam = big_l + (1 - c) * f * sin_alpha * (
+                sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+                )
+            delta = np.abs(lam - lam_previous)
+            if not np.any(delta > VINCENTY_TOLERANCE):
+                break
+
+        u_sq = cos2_alpha * (a ** 2 - b ** 2) / b ** 2
+        big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+        big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+        delta_sigma = big_b * sin_sigma * (
+            cos_2sigma_m + big_b / 4 * (
+                cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+                - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+                )
+            )
+        result = b * big_a * (sigma - delta_sigma)
+
+    result = np.where(sin_sigma == 0, 0.0, result)
+    for index in map(tuple, np.argwhere(~(delta <= VINCENTY_TOLERANCE) | ~np.isfinite(result))):
+        result[index] = distance.distance((lat1[index], lon1[index]), (lat2[index], lon2[index])).km
+    return result
+
+# endregion
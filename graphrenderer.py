@@ -1,14 +1,51 @@
 from railwaynet import *
+from lrucache import LRUCache
 from scipy.spatial import cKDTree
 from threading import Thread
+from itertools import count
 
 import pygame as pg
 
+# region Constants
+
+TILE_SIZE = 256
+MAX_ZOOM = 12
+# below this zoom tiles show point density, from it on the rail lines themselves
+DETAIL_ZOOM = 5
+# points per pixel that get the full colour in density tiles
+DENSITY_SATURATION = 16
+MIN_DENSITY_SHADE = 0.35
+
+TILE_CACHE_BUDGET = 64 * 1024 ** 2
+INDEX_CACHE_BUDGET = 64 * 1024 ** 2
+DISPLAYED_CACHE_BUDGET = 256 * 1024 ** 2
+
+PAN_STEP = 64
+
+# endregion
+
+@dataclass
+class DisplayedGraph:
+    """ everything about a displayed graph that does not depend on the surface or the view """
+    version: int
+    points_data: pd.DataFrame
+    lat: np.ndarray
+    lon: np.ndarray
+    rgb: np.ndarray
+    edges: np.ndarray
+    # kd-tree over (lon, lat), projections and zoom do not touch it
+    tree: cKDTree
+
+    @property
+    def nbytes(self) -> int:
+        # the tree holds a copy of the coordinates and about as much again in nodes
+        return int(self.points_data.memory_usage(deep=True).sum()) + \
+            self.lat.nbytes * 6 + self.rgb.nbytes + self.edges.nbytes
 
 class GraphRenderer:
-    
+
     # region Construction
-    
+
     def __init__(
             self,
             surface: pg.Surface,
@@ -16,21 +53,27 @@ class GraphRenderer:
             graph: RailwayNet,
             colors: list[str],
             search_range: int = 2,
-            bg_color: tuple[int, int, int] = (0,0,0)
+            bg_color: tuple[int, int, int] = (0,0,0),
+            key: str = "full"
         ):
         self.surface = surface
         self.size = self.w, self.h = self.surface.get_size()
-        
+
         self.bg_color = bg_color
         self.colors = colors
-        
+
         # full graph
         self.fgraph = fgraph
-        self.fgraph_surface = None
 
-        # displayed graph
+        # displayed graph, one array entry per point, x and y are zoom 0 pixel coordinates
+        # the key names it, "full" or an iso3, so its cached arrays outlive a net the manager evicts and loads again
         self.graph = graph
+        self.graph_key = key
         self.points_data = None
+        self.x = None
+        self.y = None
+        self.edges = None
+        self.selected = []
 
         self.path = None
         self.path_points_data = None
@@ -38,6 +81,17 @@ class GraphRenderer:
         self.search_tree = None
         self.search_range = search_range
 
+        # the view shows world pixels [origin, origin + size) at zoom, the world is size * 2 ** zoom big
+        self.zoom = 0
+        self.origin = (0.0, 0.0)
+
+        # tiles are rendered on first sight and dropped least recently seen first
+        self.tiles = LRUCache(TILE_CACHE_BUDGET, lambda tile: tile.get_width() * tile.get_height() * tile.get_bytesize())
+        self.indices = LRUCache(INDEX_CACHE_BUDGET, lambda index: sum(array.nbytes for array in index))
+        self.graph_versions = count()
+        self.graph_version = None
+        self.displayed = LRUCache(DISPLAYED_CACHE_BUDGET, lambda displayed: displayed.nbytes)
+
         self.update_points_positions()
         self.update_search_tree()
 
@@ -46,60 +100,109 @@ class GraphRenderer:
     # region PublicMethods
 
     def update_points_positions(self) -> None:
-        self.points_data = self.graph.get_points_dataframe(self.fgraph)
-        
-        self.vertical_bounds = self.points_data.lat.max(), self.points_data.lat.min()
-        self.horizontal_bounds = self.points_data.lon.min(), self.points_data.lon.max()
+        """ projects the cached world coordinates of the displayed graph onto the surface """
+        displayed = self.__get_displayed()
+        self.points_data = displayed.points_data
+        self.rgb = displayed.rgb
+        self.edges = displayed.edges
+        self.graph_version = displayed.version
+
+        self.vertical_bounds = (displayed.lat.max(), displayed.lat.min()) if len(displayed.lat) else (0.0, 0.0)
+        self.horizontal_bounds = (displayed.lon.min(), displayed.lon.max()) if len(displayed.lon) else (0.0, 0.0)
         self.vertical_span = self.vertical_bounds[1] - self.vertical_bounds[0]
         self.horizontal_span = self.horizontal_bounds[1] - self.horizontal_bounds[0]
 
-        self.points_data['x'] = self.points_data.lon.apply(
-                lambda lon : self.world2local(lon)
-            )
-        self.points_data['y'] = self.points_data.lat.apply(
-                lambda lat : self.world2local(lat, horizontal=False)
-            )
-        self.points_data['color'] = self.points_data.iso3.apply(
-                lambda iso3: self.colors[ord(iso3[0]) % len(self.colors)]
-            )
-        self.points_data['radius'] = [1] * self.points_data.shape[0]
+        self.x = self.world2local(displayed.lon)
+        self.y = self.world2local(displayed.lat, horizontal=False)
+        self.selected = []
 
     def update_search_tree(self) -> None:
-        self.search_tree = cKDTree(
-            [(self.points_data.x.iloc[i], self.points_data.y.iloc[i]) for i in self.points_data.index]
-        )
+        self.search_tree = self.__get_displayed().tree
 
-    def update_graph(self, graph: RailwayNet) -> None:
+    def update_graph(self, graph: RailwayNet, key: str) -> None:
         self.graph = graph
+        self.graph_key = key
         self.update_points_positions()
         self.update_search_tree()
+        self.zoom = 0
+        self.origin = (0.0, 0.0)
         if self.path is not None:
             self.update_path_points_positions()
 
     def update_path_points_positions(self):
-        if self.path_points_data is None:
-            self.path_points_data = pd.DataFrame()
-        self.path_points_data['x'] = [self.world2local(point.coord[0]) for point in self.path]
-        self.path_points_data['y'] = [self.world2local(point.coord[1], horizontal=False) for point in self.path]
+        lon = np.array([point.coord[0] for point in self.path])
+        lat = np.array([point.coord[1] for point in self.path])
+        self.path_points_data = np.column_stack((self.world2local(lon), self.world2local(lat, horizontal=False)))
 
     def update_path(self, path: list[Point]):
         self.path = path
         self.update_path_points_positions()
 
     def check_event(self, event: pg.event) -> tuple[float, float] | None:
-        if event.type == pg.MOUSEBUTTONDOWN:
+        if event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
             mouse_coord = pg.mouse.get_pos()
-            mouse_coord = (mouse_coord[0], mouse_coord[1] - 50) 
-            found_points = self.search_tree.query_ball_point(mouse_coord, r=self.search_range)
-            if found_points:
-                point_index = found_points[0]
-                self.points_data.loc[:, ('color')].iloc[point_index] = 'red'
-                self.points_data.loc[:, ('radius')].iloc[point_index] = 3
+            point_index = self.pick(mouse_coord[0], mouse_coord[1] - 50)
+            if point_index is not None:
+                self.selected.append(point_index)
                 return (
                     self.points_data.lon.iloc[point_index],
                     self.points_data.lat.iloc[point_index]
                     )
-    
+
+    def pick(self, sx: float, sy: float) -> int | None:
+        """ nearest point within search_range screen pixels of (sx, sy) """
+        if len(self.x) == 0:
+            return None
+        x, y = self.screen2local(sx, sy)
+        lon, lat = self.local2world(x, y)
+        # the tree is in degrees, the search covers the range along the less stretched axis and is cut to a circle on screen
+        scale = 2 ** self.zoom
+        radius = self.search_range / scale * max(
+            (self.horizontal_span or 1) / self.w,
+            abs(self.vertical_span or 1) / self.h
+            )
+        candidates = np.array(self.search_tree.query_ball_point((lon, lat), r=radius), dtype=np.int64)
+        if len(candidates) == 0:
+            return None
+        pixel_distances = np.hypot(self.x[candidates] - x, self.y[candidates] - y) * scale
+        nearest = np.argmin(pixel_distances)
+        return int(candidates[nearest]) if pixel_distances[nearest] <= self.search_range else None
+
+    def check_view_event(self, event: pg.event) -> bool:
+        """ wheel zooms at the cursor, right or middle drag and arrows pan, +/- zoom at the centre, 0 resets """
+        if event.type == pg.MOUSEWHEEL:
+            mouse_coord = pg.mouse.get_pos()
+            return self.zoom_at(self.zoom + (1 if event.y > 0 else -1), mouse_coord[0], mouse_coord[1] - 50)
+        if event.type == pg.MOUSEMOTION and (event.buttons[1] or event.buttons[2]):
+            return self.pan(-event.rel[0], -event.rel[1])
+        if event.type == pg.KEYDOWN:
+            if event.key in (pg.K_PLUS, pg.K_EQUALS, pg.K_KP_PLUS):
+                return self.zoom_at(self.zoom + 1, self.w / 2, self.h / 2)
+            if event.key in (pg.K_MINUS, pg.K_KP_MINUS):
+                return self.zoom_at(self.zoom - 1, self.w / 2, self.h / 2)
+            if event.key == pg.K_0:
+                return self.zoom_at(0, 0, 0)
+            steps = {pg.K_LEFT: (-1, 0), pg.K_RIGHT: (1, 0), pg.K_UP: (0, -1), pg.K_DOWN: (0, 1)}
+            if event.key in steps:
+                return self.pan(steps[event.key][0] * PAN_STEP, steps[event.key][1] * PAN_STEP)
+        return False
+
+    def zoom_at(self, zoom: int, sx: float, sy: float) -> bool:
+        """ keeps the world point under screen position (sx, sy) in place """
+        zoom = min(max(zoom, 0), MAX_ZOOM)
+        if zoom == self.zoom:
+            return False
+        x, y = self.screen2local(sx, sy)
+        self.zoom = zoom
+        self.origin = (0.0, 0.0) if zoom == 0 else (x * 2 ** zoom - sx, y * 2 ** zoom - sy)
+        return True
+
+    def pan(self, dx: float, dy: float) -> bool:
+        if self.zoom == 0:
+            return False
+        self.origin = (self.origin[0] + dx, self.origin[1] + dy)
+        return True
+
     def render(self, animate=False) -> None:
         if animate:
             t = Thread(target=self.render_internal)
@@ -108,41 +211,159 @@ class GraphRenderer:
             self.render_internal()
 
     def render_internal(self) -> None:
-        if self.graph == self.fgraph and self.fgraph_surface is not None:
-            self.surface.blit(self.fgraph_surface, (0,0))
-        else:
-            self.surface.fill(self.bg_color)
-            for i in self.points_data.index:
-                pg.draw.rect(
-                    self.surface,
-                    self.points_data.color.iloc[i],
-                    pg.Rect(
-                        (self.points_data.x.iloc[i], self.points_data.y.iloc[i]),
-                        (self.points_data.radius.iloc[i], self.points_data.radius.iloc[i])),
-                    self.points_data.radius.iloc[i]
-                    )
-        
-        if self.graph == self.fgraph and self.fgraph_surface is None:
-            self.fgraph_surface = pg.Surface(self.size)
-            self.fgraph_surface.blit(self.surface, (0,0))
-
-        if self.path_points_data is not None:
-            for i in self.path_points_data.index[:-1]:
-                pg.draw.line(
-                    self.surface,
-                    'red',
-                    (self.path_points_data.x.iloc[i], self.path_points_data.y.iloc[i]),
-                    (self.path_points_data.x.iloc[i + 1], self.path_points_data.y.iloc[i + 1]),
-                    2
-                )
+        # draw on a canvas, so the displayed surface is never half drawn or locked while the editor blits it
+        canvas = pg.Surface(self.size, 0, self.surface)
+        canvas.fill(self.bg_color)
+        ox, oy = int(self.origin[0]), int(self.origin[1])
+        for tx in range(ox // TILE_SIZE, (ox + self.w - 1) // TILE_SIZE + 1):
+            for ty in range(oy // TILE_SIZE, (oy + self.h - 1) // TILE_SIZE + 1):
+                if self.__tile_exists(tx, ty):
+                    canvas.blit(self.get_tile(self.zoom, tx, ty), (tx * TILE_SIZE - ox, ty * TILE_SIZE - oy))
+
+        for i in self.selected:
+            pg.draw.rect(canvas, 'red', pg.Rect(self.local2screen(self.x[i], self.y[i]), (3, 3)), 3)
+
+        if self.path_points_data is not None and len(self.path_points_data) > 1:
+            path_x, path_y = self.local2screen(self.path_points_data[:, 0], self.path_points_data[:, 1])
+            pg.draw.lines(canvas, 'red', False, np.column_stack((path_x, path_y)).tolist(), 2)
+
+        self.surface.blit(canvas, (0,0))
+
+    def get_tile(self, zoom: int, tx: int, ty: int) -> pg.Surface:
+        return self.tiles.get((self.graph_version, zoom, tx, ty), lambda: self.__render_tile(zoom, tx, ty))
 
     # endregion
 
     # region ServiceMethods
 
-    def world2local(self, value: float, horizontal: bool = True):
+    def world2local(self, value, horizontal: bool = True):
+        """ zoom 0 pixel coordinate, works on scalars and arrays alike """
         if horizontal:
-            return (value - self.horizontal_bounds[0]) / self.horizontal_span * self.w
-        return (value - self.vertical_bounds[0]) / self.vertical_span * self.h
+            return (value - self.horizontal_bounds[0]) / (self.horizontal_span or 1) * self.w
+        return (value - self.vertical_bounds[0]) / (self.vertical_span or 1) * self.h
+
+    def local2world(self, x, y):
+        """ inverse of world2local, (lon, lat) of zoom 0 pixel coordinates """
+        return (
+            self.horizontal_bounds[0] + x / self.w * (self.horizontal_span or 1),
+            self.vertical_bounds[0] + y / self.h * (self.vertical_span or 1)
+            )
+
+    def local2screen(self, x, y):
+        scale = 2 ** self.zoom
+        return x * scale - self.origin[0], y * scale - self.origin[1]
+
+    def screen2local(self, sx, sy):
+        scale = 2 ** self.zoom
+        return (sx + self.origin[0]) / scale, (sy + self.origin[1]) / scale
+
+    def __get_displayed(self) -> 'DisplayedGraph':
+        """ world coordinates, colours, edges and pick index of a graph, kept while switching between graphs """
+
+        graph = self.graph
+
+        def build() -> DisplayedGraph:
+            points_data = graph.get_points_dataframe(self.fgraph)
+            lat = points_data.lat.to_numpy()
+            lon = points_data.lon.to_numpy()
+
+            # one colour lookup per country instead of one per point
+            countries, inverse = np.unique(points_data.iso3.to_numpy(dtype=str), return_inverse=True)
+            palette = np.array(
+                [tuple(pg.Color(self.colors[ord(iso3[0]) % len(self.colors)]))[:3] for iso3 in countries],
+                dtype=np.float64
+                ).reshape(-1, 3)
+            rgb = palette[inverse]
+            points_data['color'] = pg.surfarray.map_array(self.surface, rgb.astype(np.int64)) if len(rgb) else []
+
+            # edges as point index pairs, drawn at detail zoom
+            point_ids = {Point(lat_, lon_): i for i, (lat_, lon_) in enumerate(zip(lat.tolist(), lon.tolist()))}
+            edges = np.array(
+                [(point_ids[u], point_ids[v]) for u, v in graph.edges if u in point_ids and v in point_ids],
+                dtype=np.int64
+                ).reshape(-1, 2)
+
+            return DisplayedGraph(
+                next(self.graph_versions), points_data, lat, lon, rgb, edges, cKDTree(np.column_stack((lon, lat)))
+                )
+
+        # keyed by name, the cache holds arrays only and never keeps a graph alive
+        return self.displayed.get(self.graph_key, build)
+
+    def __tile_exists(self, tx: int, ty: int) -> bool:
+        scale = 2 ** self.zoom
+        return 0 <= tx * TILE_SIZE < self.w * scale and 0 <= ty * TILE_SIZE < self.h * scale
+
+    def __get_index(self, zoom: int) -> tuple[np.ndarray, ...]:
+        """ points and edge ends sorted by the tile they fall into at zoom """
+
+        def build() -> tuple[np.ndarray, ...]:
+            scale = 2 ** zoom
+            columns = (self.h * scale) // TILE_SIZE + 1
+            point_keys = (self.x * scale // TILE_SIZE).astype(np.int64) * columns + (self.y * scale // TILE_SIZE).astype(np.int64)
+            point_order = np.argsort(point_keys, kind='stable')
+            if zoom < DETAIL_ZOOM:
+                return point_keys[point_order], point_order
+
+            # an edge is found from the tiles of its ends, longer edges are checked against every tile
+            a, b = point_keys[self.edges[:, 0]], point_keys[self.edges[:, 1]]
+            a_column, b_column = a % columns, b % columns
+            near = (np.abs(a // columns - b // columns) + np.abs(a_column - b_column)) <= 1
+            edge_keys = np.concatenate((a[near], b[near]))
+            edge_ids = np.tile(np.flatnonzero(near), 2)
+            edge_order = np.argsort(edge_keys, kind='stable')
+            return point_keys[point_order], point_order, edge_keys[edge_order], edge_ids[edge_order], np.flatnonzero(~near)
+
+        return self.indices.get((self.graph_version, zoom), build)
+
+    def __render_tile(self, zoom: int, tx: int, ty: int) -> pg.Surface:
+        scale = 2 ** zoom
+        columns = (self.h * scale) // TILE_SIZE + 1
+        key = tx * columns + ty
+        index = self.__get_index(zoom)
+        keys, order = index[0], index[1]
+        ids = order[np.searchsorted(keys, key):np.searchsorted(keys, key, side='right')]
+
+        tile = pg.Surface((TILE_SIZE, TILE_SIZE), 0, self.surface)
+        tile.fill(self.bg_color)
+        px = np.clip((self.x[ids] * scale).astype(np.int64) - tx * TILE_SIZE, 0, TILE_SIZE - 1)
+        py = np.clip((self.y[ids] * scale).astype(np.int64) - ty * TILE_SIZE, 0, TILE_SIZE - 1)
+
+        if zoom < DETAIL_ZOOM:
+            # mean country colour per pixel, darker where fewer points fall
+            if len(ids):
+                flat = px * TILE_SIZE + py
+                counts = np.bincount(flat, minlength=TILE_SIZE * TILE_SIZE)
+                rgb = np.stack(
+                    [np.bincount(flat, weights=self.rgb[ids, c], minlength=TILE_SIZE * TILE_SIZE) for c in range(3)],
+                    axis=1
+                    )
+                lit = np.flatnonzero(counts)
+                shade = np.clip(np.log1p(counts[lit]) / np.log1p(DENSITY_SATURATION), MIN_DENSITY_SHADE, 1.0)
+                pixels = pg.surfarray.pixels3d(tile)
+                pixels[lit // TILE_SIZE, lit % TILE_SIZE] = (rgb[lit] / counts[lit, None] * shade[:, None]).astype(np.uint8)
+                del pixels
+            return tile
+
+        edge_keys, edge_ids, long_edges = index[2], index[3], index[4]
+        edges = np.unique(edge_ids[np.searchsorted(edge_keys, key):np.searchsorted(edge_keys, key, side='right')])
+        if len(long_edges):
+            a, b = self.edges[long_edges, 0], self.edges[long_edges, 1]
+            left, right = np.minimum(self.x[a], self.x[b]) * scale, np.maximum(self.x[a], self.x[b]) * scale
+            top, bottom = np.minimum(self.y[a], self.y[b]) * scale, np.maximum(self.y[a], self.y[b]) * scale
+            crossing = (right >= tx * TILE_SIZE) & (left < (tx + 1) * TILE_SIZE) & \
+                (bottom >= ty * TILE_SIZE) & (top < (ty + 1) * TILE_SIZE)
+            edges = np.concatenate((edges, long_edges[crossing]))
+
+        a, b = self.edges[edges, 0], self.edges[edges, 1]
+        starts = np.column_stack((self.x[a] * scale - tx * TILE_SIZE, self.y[a] * scale - ty * TILE_SIZE)).tolist()
+        ends = np.column_stack((self.x[b] * scale - tx * TILE_SIZE, self.y[b] * scale - ty * TILE_SIZE)).tolist()
+        for color, start, end in zip(self.rgb[a].astype(int).tolist(), starts, ends):
+            pg.draw.line(tile, color, start, end)
+        if len(ids):
+            pixels = pg.surfarray.pixels2d(tile)
+            pixels[px, py] = self.points_data.color.to_numpy()[ids]
+            del pixels
+        return tile
 
     # endregion
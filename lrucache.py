@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable
+
+# region Types
+
+class LRUCache:
+    """ least recently used entries are dropped once their total size goes over the budget in bytes """
+
+    # region Construction
+
+    def __init__(self, budget: int, size: Callable[[Any], int], on_evict: Callable[[Hashable, Any], None] = None):
+        self.budget = budget
+        self.size = size
+        # told about every dropped entry, e.g. to drop other references to the value
+        self.on_evict = on_evict
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+
+    # endregion
+
+    # region PublicMethods
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """ cached value of key, factory() is called and stored on a miss """
+        with self.__lock:
+            if key in self.__entries:
+                self.hits += 1
+                self.__entries.move_to_end(key)
+                return self.__entries[key][0]
+            self.misses += 1
+
+        value = factory()
+        value_size = self.size(value)
+        evicted = []
+        with self.__lock:
+            if key in self.__entries:
+                self.nbytes -= self.__entries.pop(key)[1]
+            # a value bigger than the whole budget is returned but not kept
+            if value_size <= self.budget:
+                self.__entries[key] = (value, value_size)
+                self.nbytes += value_size
+                while self.nbytes > self.budget:
+                    dropped_key, (dropped, dropped_size) = self.__entries.popitem(last=False)
+                    self.nbytes -= dropped_size
+                    self.evictions += 1
+                    evicted.append((dropped_key, dropped))
+        # outside the lock, the callback may use the cache again
+        if self.on_evict is not None:
+            for dropped_key, dropped in evicted:
+                self.on_evict(dropped_key, dropped)
+        return value
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            'entries'   : len(self.__entries),
+            'nbytes'    : self.nbytes,
+            'budget'    : self.budget,
+            'hits'      : self.hits,
+            'misses'    : self.misses,
+            'evictions' : self.evictions,
+            'hit_rate'  : self.hits / requests if requests else 0.0
+            }
+
+    # endregion
+
+    # region OverloadMethods
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.__entries
+
+    # endregion
+
+# endregion
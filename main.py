@@ -1,13 +1,35 @@
-from railwaynet import *
-from editor import *
+from time import perf_counter
 
-from threading import Thread
+import argparse
 
 # region Main
 
 def main() -> None:
-    manager, _, _ = default_setup()
+    parser = argparse.ArgumentParser(description="Railway network editor")
+    parser.add_argument("--data", default="./data/trains.csv")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print the time to the first query by phase instead of opening the editor")
+    args = parser.parse_args()
 
+    # modules are imported when they are needed, the editor pulls in pygame only when it opens
+    start = perf_counter()
+    from railwaynet import PathEdgePoint, default_setup, startup_report
+    imports = perf_counter() - start
+
+    manager, _ = default_setup(args.data)
+
+    if args.profile_startup:
+        graph = manager.full_compact
+        source, target = graph.biggest_component_ids()[[0, -1]].tolist()
+        manager.start_node = PathEdgePoint(graph.point(source), graph.country(graph.node_country[source]))
+        manager.finish_node = PathEdgePoint(graph.point(target), graph.country(graph.node_country[target]))
+        start = perf_counter()
+        manager.find_path([None, None])
+        manager.startup = {'imports': imports} | manager.startup | {'first query': perf_counter() - start}
+        print(startup_report(manager.startup))
+        return
+
+    from editor import Editor
     editor = Editor(manager)
     editor.run()
 
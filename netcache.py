@@ -0,0 +1,211 @@
+from compactgraph import CompactGraph, EDGE_ATTRIBUTES
+from lrucache import LRUCache
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Mapping
+
+import pandas as pd
+import numpy as np
+import hashlib
+import shutil
+import json
+import os
+
+# region Constants
+
+# bump whenever the way graphs are built or stored changes
+CACHE_VERSION = 5
+
+MANIFEST_FILE = "manifest.json"
+SHARDS_DIR = "shards"
+FULL_DIR = "full"
+
+SHARD_BUDGET = 1024 ** 3
+
+FILE_CHUNK_BYTES = 1024 ** 2
+
+NODE_COLUMNS = ('lat', 'lon', 'node_country', 'component')
+EDGE_COLUMNS = ('src', 'dst', 'edge_country') + EDGE_ATTRIBUTES
+
+# endregion
+
+# region Types
+
+class NetworkCache:
+    """ columnar on-disk network: a shard directory per country and one for the full graph, one .npy file per column """
+
+    # region Construction
+
+    def __init__(self, path: str):
+        self.path = path
+
+    # endregion
+
+    # region PublicMethods
+
+    def load(self, key: str, budget: int = SHARD_BUDGET) -> 'CountryShards | None':
+        """ country nets are only read when first used, see load_full for the full graph """
+        manifest = self.read_manifest()
+        if manifest is None:
+            print(f"Cache '{self.path}' not found")
+            return None
+        if manifest.get('version') != CACHE_VERSION or manifest.get('key') != key:
+            print(f"Cache '{self.path}' is stale")
+            return None
+
+        print(f"Cache '{self.path}' found")
+        return CountryShards(self, manifest['shards'], budget)
+
+    def load_shard(self, iso3: str, countries: list[str]) -> CompactGraph:
+        # read into memory, so the shard budget accounts for what a loaded country really holds
+        return NetworkCache.__load_graph(os.path.join(self.path, SHARDS_DIR, iso3), countries, mmap_mode=None)
+
+    def load_full(self) -> CompactGraph:
+        """ memory-mapped, pages are read as searches touch them """
+        manifest = self.read_manifest()
+        return NetworkCache.__load_graph(os.path.join(self.path, FULL_DIR), manifest['full'], mmap_mode='r')
+
+    def save(self, key: str, nets: Mapping[str, CompactGraph], full_graph: CompactGraph, metadata: dict = None) -> None:
+        """ metadata is kept in the manifest, e.g. the seed the network was built with """
+        # write next to the old cache, then swap, so readers never see half a cache
+        temporary_path = self.path + ".tmp"
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        os.makedirs(os.path.join(temporary_path, SHARDS_DIR))
+
+        shards = dict()
+        for iso3, graph in nets.items():
+            NetworkCache.__save_graph(os.path.join(temporary_path, SHARDS_DIR, iso3), graph)
+            shards[iso3] = graph.countries
+        NetworkCache.__save_graph(os.path.join(temporary_path, FULL_DIR), full_graph)
+
+        manifest = {
+            'version'  : CACHE_VERSION,
+            'key'      : key,
+            'metadata' : dict() if metadata is None else metadata,
+            'shards'   : shards,
+            'full'     : full_graph.countries,
+            'border'   : border_index(full_graph)
+        }
+        with open(os.path.join(temporary_path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(temporary_path, self.path)
+
+    def read_manifest(self) -> dict | None:
+        try:
+            with open(os.path.join(self.path, MANIFEST_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    # endregion
+
+    # region ServiceMethods
+
+    @staticmethod
+    def __save_graph(path: str, graph: CompactGraph) -> None:
+        # component labels are stored with the nodes, so they are never recomputed after a load
+        graph.component_labels()
+        os.makedirs(path)
+        for column in NODE_COLUMNS + EDGE_COLUMNS:
+            np.save(os.path.join(path, f"{column}.npy"), getattr(graph, column))
+
+    @staticmethod
+    def __load_graph(path: str, countries: list[str], mmap_mode: str | None) -> CompactGraph:
+        columns = {
+            column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode=mmap_mode)
+                for column in NODE_COLUMNS + EDGE_COLUMNS
+            }
+        return CompactGraph(
+            columns['lat'],
+            columns['lon'],
+            columns['node_country'],
+            columns['src'],
+            columns['dst'],
+            columns['edge_country'],
+            countries,
+            component=columns['component'],
+            **{attr: columns[attr] for attr in EDGE_ATTRIBUTES}
+            )
+
+    # endregion
+
+class CountryShards(Mapping):
+    """ country nets of a cache, read on first access or in the background, least recently used dropped over the budget """
+
+    # region Construction
+
+    def __init__(self, cache: NetworkCache, shards: dict[str, list[str]], budget: int = SHARD_BUDGET):
+        self.cache = cache
+        self.shards = shards
+        self.loaded = LRUCache(budget, lambda graph: graph.nbytes)
+        self.__executor = None
+
+    # endregion
+
+    # region PublicMethods
+
+    def prefetch(self, iso3_lst) -> None:
+        """ reads the shards on a background thread, the countries are likely to be asked for soon """
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=1)
+        for iso3 in iso3_lst:
+            if iso3 in self.shards and iso3 not in self.loaded:
+                self.__executor.submit(self.__getitem__, iso3)
+
+    # endregion
+
+    # region OverloadMethods
+
+    def __getitem__(self, iso3: str) -> CompactGraph:
+        if iso3 not in self.shards:
+            raise KeyError(iso3)
+        return self.loaded.get(iso3, lambda: self.cache.load_shard(iso3, self.shards[iso3]))
+
+    def __iter__(self):
+        return iter(self.shards)
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def __contains__(self, iso3) -> bool:
+        return iso3 in self.shards
+
+    # endregion
+
+# endregion
+
+# region Functions
+
+def border_index(full_graph: CompactGraph) -> list[tuple[str, str, int]]:
+    """ pairs of countries with railway edges between them and the number of such edges """
+    a_codes = full_graph.node_country[full_graph.src]
+    b_codes = full_graph.node_country[full_graph.dst]
+    border = a_codes != b_codes
+    pairs = np.stack((np.minimum(a_codes, b_codes)[border], np.maximum(a_codes, b_codes)[border]), axis=1)
+    pairs, counts = np.unique(pairs.reshape(-1, 2), axis=0, return_counts=True)
+    return [
+        (full_graph.country(a), full_graph.country(b), count)
+            for (a, b), count in zip(pairs.tolist(), counts.tolist())
+        ]
+
+def cache_key(*frames: pd.DataFrame, extra: tuple = ()) -> str:
+    """ hash of the input tables, the cache version and any build options """
+    digest = hashlib.sha256(str(CACHE_VERSION).encode())
+    for frame in frames:
+        digest.update(",".join(map(str, frame.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+    for value in extra:
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+def file_digest(*paths: str) -> str:
+    """ hash of the raw bytes of input files, nothing is parsed """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            while chunk := f.read(FILE_CHUNK_BYTES):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+# endregion
@@ -0,0 +1,360 @@
+from geograph import HAVERSINE, distances
+from compactgraph import CompactGraph
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse.csgraph import dijkstra
+from scipy.sparse import csr_matrix
+from networkx import NetworkXNoPath
+from heapq import heappush, heappop
+from itertools import count
+from geopy import distance
+
+import numpy as np
+import math
+
+# region Constants
+
+DEFAULT_PROFILE = "default"
+
+# weights are computed with the same operation order as the networkx callbacks they replace
+WEIGHT_PROFILES = {
+    DEFAULT_PROFILE : lambda g: g.distance + 1 / g.speed + np.nan_to_num(g.cost) + 1 / g.centrality,
+    "no_cost"       : lambda g: g.distance + 1 / g.speed + 1 / g.centrality,
+    "distance"      : lambda g: g.distance.copy(),
+}
+
+# networkx weight callbacks equal to the profiles above, a zero divisor gives inf like numpy instead of raising
+WEIGHT_CALLBACKS = {
+    DEFAULT_PROFILE : lambda u, v, e: e['distance'] + inverse(e['speed']) + e.get('cost', 0.0) + inverse(e['centrality']),
+    "no_cost"       : lambda u, v, e: e['distance'] + inverse(e['speed']) + inverse(e['centrality']),
+    "distance"      : lambda u, v, e: e['distance'],
+}
+
+DIJKSTRA = "dijkstra"
+ASTAR = "astar"
+BIDIRECTIONAL = "bidirectional"
+BIDIRECTIONAL_ASTAR = "bidirectional_astar"
+
+SEARCH_MODES = (DIJKSTRA, ASTAR, BIDIRECTIONAL, BIDIRECTIONAL_ASTAR)
+
+# keeps the heuristic admissible despite rounding in the scale computation
+HEURISTIC_SAFETY = 1 - 1e-9
+
+# rough size of a python list slot plus the float or int object it points to
+LIST_ITEM_BYTES = 32
+
+# single-source trees computed per scipy call, bounds the (origins x nodes) buffers
+MATRIX_BLOCK_ORIGINS = 64
+
+# endregion
+
+# region Types
+
+class ShortestPathEngine:
+    """ heap based searches over CSR adjacency with weights materialized once per profile """
+
+    # region Construction
+
+    def __init__(self, graph: CompactGraph, profile: str = DEFAULT_PROFILE, weights: np.ndarray = None):
+        self.graph = graph
+        self.profile = profile
+        self.weights = get_weights(graph, profile) if weights is None else np.asarray(weights, dtype=np.float64)
+
+        # python lists are much faster than numpy scalars inside the search loop
+        indptr, indices, edge_ids = graph.adjacency
+        self.indptr = indptr.tolist()
+        self.indices = indices.tolist()
+        self.adjacency_weights = self.weights[edge_ids].tolist()
+
+        # great-circle distance times the smallest weight per km never overestimates
+        edge_lengths = distances(graph.lat[graph.src], graph.lon[graph.src], graph.lat[graph.dst], graph.lon[graph.dst], HAVERSINE)
+        positive = edge_lengths > 0
+        self.heuristic_scale = \
+            float(np.min(self.weights[positive] / edge_lengths[positive])) * HEURISTIC_SAFETY if positive.any() else 0.0
+        self.heuristic_scale = max(self.heuristic_scale, 0.0)
+        self.lat_radians = np.radians(graph.lat).tolist()
+        self.lon_radians = np.radians(graph.lon).tolist()
+        self.cos_lat = np.cos(np.radians(graph.lat)).tolist()
+
+        self.settled = 0
+        self.cost = math.inf
+
+    # endregion
+
+    # region Properties
+
+    @property
+    def nbytes(self) -> int:
+        """ approximate memory held by the engine, its graph included """
+        items = len(self.indptr) + 2 * len(self.indices) + 3 * len(self.lat_radians)
+        return self.graph.nbytes + self.weights.nbytes + items * LIST_ITEM_BYTES
+
+    # endregion
+
+    # region PublicMethods
+
+    def shortest_path(self, source: int, target: int, mode: str = DIJKSTRA) -> list[int]:
+        return self.search({source: 0.0}, {target: 0.0}, mode)
+
+    def search(self, sources: dict[int, float], targets: dict[int, float], mode: str = DIJKSTRA) -> list[int]:
+        """ cheapest path from any source to any target, dict values are costs added at the path ends """
+        if mode == DIJKSTRA:
+            return self.__dijkstra(sources, targets)
+        if mode == ASTAR:
+            return self.__astar(sources, targets)
+        if mode == BIDIRECTIONAL:
+            return self.__bidirectional(sources, targets, lambda _: 0.0)
+        if mode == BIDIRECTIONAL_ASTAR:
+            to_targets = self.__heuristic(targets)
+            to_sources = self.__heuristic(sources)
+            return self.__bidirectional(sources, targets, lambda v: (to_targets(v) - to_sources(v)) / 2)
+        raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+
+    def path_length(self, path: list[int]) -> float:
+        indptr, indices, weights = self.indptr, self.indices, self.adjacency_weights
+        length = 0.0
+        for u, v in zip(path[:-1], path[1:]):
+            length += min(weights[i] for i in range(indptr[u], indptr[u + 1]) if indices[i] == v)
+        return length
+
+    # endregion
+
+    # region ServiceMethods
+
+    def __dijkstra(self, sources: dict[int, float], targets: dict[int, float]) -> list[int]:
+        indptr, indices, weights = self.indptr, self.indices, self.adjacency_weights
+
+        dist = {}
+        seen = dict(sources)
+        pred = dict.fromkeys(sources)
+        c = count()
+        heap = [(d, next(c), u) for u, d in sources.items()]
+        heap.sort()
+        best = math.inf
+        reached = None
+        while heap:
+            d, _, u = heappop(heap)
+            if d >= best:
+                break
+            if u in dist:
+                continue
+            dist[u] = d
+            if u in targets and d + targets[u] < best:
+                best = d + targets[u]
+                reached = u
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+                if v in dist:
+                    continue
+                vd = d + weights[i]
+                if v not in seen or vd < seen[v]:
+                    seen[v] = vd
+                    pred[v] = u
+                    heappush(heap, (vd, next(c), v))
+
+        return self.__finish(len(dist), best, pred, reached)
+
+    def __astar(self, sources: dict[int, float], targets: dict[int, float]) -> list[int]:
+        indptr, indices, weights = self.indptr, self.indices, self.adjacency_weights
+        heuristic = self.__heuristic(targets)
+
+        closed = set()
+        seen = dict(sources)
+        pred = dict.fromkeys(sources)
+        c = count()
+        heap = [(d + heuristic(u), next(c), u) for u, d in sources.items()]
+        heap.sort()
+        best = math.inf
+        reached = None
+        while heap:
+            key, _, u = heappop(heap)
+            if key >= best:
+                break
+            if u in closed:
+                continue
+            closed.add(u)
+            d = seen[u]
+            if u in targets and d + targets[u] < best:
+                best = d + targets[u]
+                reached = u
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+                if v in closed:
+                    continue
+                vd = d + weights[i]
+                if v not in seen or vd < seen[v]:
+                    seen[v] = vd
+                    pred[v] = u
+                    heappush(heap, (vd + heuristic(v), next(c), v))
+
+        return self.__finish(len(closed), best, pred, reached)
+
+    def __bidirectional(self, sources: dict[int, float], targets: dict[int, float], potential) -> list[int]:
+        """ bidirectional search, a consistent potential turns it into bidirectional A* """
+        indptr, indices, weights = self.indptr, self.indices, self.adjacency_weights
+
+        # forward keys are g + potential, backward keys are g - potential
+        signs = (1, -1)
+        dist = ({}, {})
+        seen = (dict(sources), dict(targets))
+        pred = (dict.fromkeys(sources), dict.fromkeys(targets))
+        c = count()
+        heaps = (
+            sorted((d + potential(u), next(c), u) for u, d in sources.items()),
+            sorted((d - potential(u), next(c), u) for u, d in targets.items())
+            )
+        best = math.inf
+        meeting = None
+        for u in sources:
+            if u in targets and sources[u] + targets[u] < best:
+                best = sources[u] + targets[u]
+                meeting = u
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            direction = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            _, _, u = heappop(heaps[direction])
+            if u in dist[direction]:
+                continue
+            d = seen[direction][u]
+            dist[direction][u] = d
+            other_seen = seen[1 - direction]
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+                if v in dist[direction]:
+                    continue
+                vd = d + weights[i]
+                if v not in seen[direction] or vd < seen[direction][v]:
+                    seen[direction][v] = vd
+                    pred[direction][v] = u
+                    heappush(heaps[direction], (vd + signs[direction] * potential(v), next(c), v))
+                    if v in other_seen and vd + other_seen[v] < best:
+                        best = vd + other_seen[v]
+                        meeting = v
+
+        path = self.__finish(len(dist[0]) + len(dist[1]), best, pred[0], meeting)
+        backward = unwind(pred[1], meeting)
+        backward.reverse()
+        return path + backward[1:]
+
+    def __finish(self, settled: int, best: float, pred: dict, reached: int) -> list[int]:
+        self.settled = settled
+        self.cost = best
+        if reached is None:
+            raise NetworkXNoPath("No path between the given nodes")
+        return unwind(pred, reached)
+
+    def __heuristic(self, targets: dict[int, float]):
+        lat_radians, lon_radians, cos_lat = self.lat_radians, self.lon_radians, self.cos_lat
+        ends = [(lat_radians[t], lon_radians[t], cos_lat[t], offset) for t, offset in targets.items()]
+        scale = 2 * distance.EARTH_RADIUS * self.heuristic_scale
+
+        def heuristic(v: int) -> float:
+            lat, lon, cos = lat_radians[v], lon_radians[v], cos_lat[v]
+            result = math.inf
+            for target_lat, target_lon, target_cos, offset in ends:
+                h = math.sin((lat - target_lat) / 2) ** 2 + cos * target_cos * math.sin((lon - target_lon) / 2) ** 2
+                result = min(result, scale * math.asin(math.sqrt(min(h, 1.0))) + offset)
+            return result
+
+        return heuristic
+
+    # endregion
+
+# endregion
+
+# region Functions
+
+def inverse(value: float) -> float:
+    return math.inf if value == 0 else 1 / value
+
+def get_weights(graph: CompactGraph, profile: str) -> np.ndarray:
+    if profile not in WEIGHT_PROFILES:
+        raise ValueError(f"Unknown weight profile '{profile}', expected one of {list(WEIGHT_PROFILES)}")
+    return WEIGHT_PROFILES[profile](graph)
+
+def unwind(pred: dict, target: int) -> list[int]:
+    path = []
+    node = target
+    while node is not None:
+        path.append(node)
+        node = pred[node]
+    path.reverse()
+    return path
+
+def weight_matrix(graph: CompactGraph, weights: np.ndarray) -> csr_matrix:
+    """ symmetric sparse matrix keeping the lightest of parallel edges, scipy would sum them """
+    src = np.concatenate((graph.src, graph.dst))
+    dst = np.concatenate((graph.dst, graph.src))
+    weights = np.concatenate((weights, weights))
+    order = np.lexsort((weights, dst, src))
+    src, dst, weights = src[order], dst[order], weights[order]
+    first = np.ones(len(src), dtype=bool)
+    first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+    first &= src != dst
+    n = graph.number_of_nodes
+    return csr_matrix((weights[first], (src[first], dst[first])), shape=(n, n))
+
+def route_matrix(
+        graph: CompactGraph,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        profile: str = DEFAULT_PROFILE,
+        with_paths: bool = False,
+        workers: int = None,
+        matrix: csr_matrix = None
+    ) -> tuple[np.ndarray, list[list[list[int]]] | None]:
+    """ costs from every source to every target, one search tree per distinct source, inf where unreachable """
+
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    if matrix is None:
+        matrix = weight_matrix(graph, get_weights(graph, profile))
+    origins, rows = np.unique(sources, return_inverse=True)
+    blocks = [origins[i:i + MATRIX_BLOCK_ORIGINS] for i in range(0, len(origins), MATRIX_BLOCK_ORIGINS)]
+    tasks = [(block, targets, with_paths) for block in blocks]
+
+    if workers == 1 or len(tasks) <= 1:
+        # passed in directly, the module global is only set in pool processes
+        results = [_route_block(task, matrix) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_route_worker, initargs=(matrix, )) as executor:
+            results = list(executor.map(_route_block, tasks))
+
+    costs = np.vstack([block_costs for block_costs, _ in results]) if results else np.empty((0, len(targets)))
+    if not with_paths:
+        return costs[rows], None
+    origin_paths = [paths for _, block_paths in results for paths in block_paths]
+    return costs[rows], [origin_paths[row] for row in rows.tolist()]
+
+_route_matrix = None
+
+def _init_route_worker(matrix: csr_matrix) -> None:
+    # the matrix is sent once per process instead of once per block
+    global _route_matrix
+    _route_matrix = matrix
+
+def _route_block(task: tuple, matrix: csr_matrix = None) -> tuple[np.ndarray, list[list[list[int]]] | None]:
+    origins, targets, with_paths = task
+    if matrix is None:
+        matrix = _route_matrix
+    if not with_paths:
+        return dijkstra(matrix, indices=origins)[:, targets], None
+
+    costs, predecessors = dijkstra(matrix, indices=origins, return_predecessors=True)
+    paths = []
+    for origin, origin_costs, origin_predecessors in zip(origins.tolist(), costs, predecessors):
+        origin_predecessors = origin_predecessors.tolist()
+        origin_paths = []
+        for target, cost in zip(targets.tolist(), origin_costs[targets].tolist()):
+            if cost == math.inf:
+                origin_paths.append(None)
+                continue
+            path = [target]
+            while path[-1] != origin:
+                path.append(origin_predecessors[path[-1]])
+            path.reverse()
+            origin_paths.append(path)
+        paths.append(origin_paths)
+    return costs[:, targets], paths
+
+# endregion
@@ -1,33 +1,32 @@
-from functools import reduce, lru_cache
-from geograph import GeoGraph, Point
-from numpy.random import default_rng
-from matplotlib import pyplot as plt
+from geograph import GeoGraph, Point, GEODESIC, distances
+from compactgraph import CompactGraph, EDGE_ATTRIBUTES
+from pathfinding import ShortestPathEngine, DEFAULT_PROFILE, DIJKSTRA, WEIGHT_CALLBACKS, route_matrix, weight_matrix, get_weights
+from contractionhierarchy import ContractionHierarchy, build_hierarchies, hierarchy_signature
+from netcache import NetworkCache, cache_key, file_digest
+from spatialindex import SpatialIndex
+from lrucache import LRUCache
+from reducedgraph import ReducedGraph
+from routingmetrics import RoutingMetrics, COUNTRY_PATH, CORRIDOR, SEARCH, RECONSTRUCTION, TOTAL
+from numpy.random import default_rng, SeedSequence
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from rich.console import Console
-from scipy.stats import norm
 from random import choice
-from statistics import mean
-from tqdm import tqdm
-from time import time
+from time import time, perf_counter
+from typing import Callable
 
 from networkx import NetworkXNoPath
+from scipy.sparse import csr_matrix
 
 import networkx as nx
 import pandas as pd
-import matplotlib
-import contextlib
-import pycountry
+import numpy as np
 import pickle
+import os
 import random
-import bz2
 
 
-matplotlib.use('Qt5Agg')
-
 # region Constants
 
-NORM_RANDOM = lambda : norm.rvs(size=1, random_state=default_rng())[0]
-
 COLORS = [
           'crimson', 'cyan',
           'darkblue', 'darkcyan', 'darkgoldenrod',
@@ -72,12 +71,21 @@ COLORS = [
           'yellow', 'yellowgreen'
           ]
 
-CONSOLE = Console()
-
 CALCULATING_COMPONENTS_MSG = "Calculating components"
 CALCULATING_GRAPHS_MSG     = "    Calculating graphs"
 COMBINING_GRAPHS_MSG       = "       Combinig graphs"
 CALCULATING_CENTRALITY_MSG = "Calculating centrality"
+CONTRACTING_MSG            = "Contracting hierarchies"
+
+CONTRACTION_HIERARCHY = "ch"
+
+CAPITALS_DATA_PATH = "./data/country_capitals.csv"
+SPEED_DATA_PATH = "./data/train_speed.csv"
+# countries resolved by pycountry, valid while both source files stay the same
+COUNTRIES_CACHE_PATH = "./cached/countries.pickle"
+
+# sizes of this many biggest components are reported by describe
+DESCRIBED_COMPONENTS = 5
 
 PROGRESS_BAR_WIDTH = 100
 
@@ -91,64 +99,174 @@ class RailwayNetInfo:
     edges: int
     components: int
     biggest_component_part: float
+    component_sizes: list[int]
+
+@dataclass
+class TrailsData:
+    """ flat coordinates of all trails, trail i spans [offsets[i], offsets[i + 1]) """
+    lon: np.ndarray
+    lat: np.ndarray
+    offsets: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def select(self, trail_indices: np.ndarray) -> 'TrailsData':
+        starts = self.offsets[trail_indices]
+        counts = self.offsets[np.asarray(trail_indices) + 1] - starts
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        points = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+        return TrailsData(lon=self.lon[points], lat=self.lat[points], offsets=offsets)
+
+    def segments(self) -> tuple[np.ndarray, np.ndarray]:
+        """ indices of consecutive non-degenerate point pairs inside every trail """
+        points_number = len(self.lat)
+        if points_number < 2:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        keep = np.ones(points_number - 1, dtype=bool)
+        trail_ends = self.offsets[1:-1] - 1
+        keep[trail_ends[(trail_ends >= 0) & (trail_ends < points_number - 1)]] = False
+
+        a = np.arange(points_number - 1)
+        b = a + 1
+        keep &= (self.lat[a] != self.lat[b]) | (self.lon[a] != self.lon[b])
+        return a[keep], b[keep]
 
 class RailwayNet(GeoGraph):
 
     # region Construction
 
-    def __init__(self, graph_data: pd.DataFrame = None, countries_data: pd.DataFrame = None, iso3: str = None):
+    def __init__(
+            self,
+            graph_data: pd.DataFrame = None,
+            countries_data: pd.DataFrame = None,
+            iso3: str = None,
+            trails: TrailsData = None,
+            distance_mode: str = GEODESIC,
+            rng: np.random.Generator = None
+        ):
         super(RailwayNet, self).__init__()
 
         self.countries = set()
+        # component label of every node, known when the net comes from a labelled compact graph
+        self.component_labels = None
+        self.__biggest_component = None
 
-        if graph_data is not None:
+        if graph_data is not None or trails is not None:
             if iso3 is not None:
                 self.countries.add(iso3)
 
-            data_filtered = graph_data if iso3 is None else graph_data[graph_data.iso3 == iso3]
-            for trail in data_filtered['shape']:
-                lat, lon = RailwayNet.__get_coordinates_from_string(trail)
-                self.add_node(Point(lon[0], lat[0]), iso3=iso3)
-                for i in range(len(lat) - 1):
-                    b = Point(lon[i + 1], lat[i + 1])
-                    a = Point(lon[i], lat[i])
-                    self.add_node(b, iso3=iso3)
-                    if a.lat != b.lat or a.lon != b.lon:
-                        self.add_edge(
-                                a,
-                                b,
-                                distance=a.distance(b),
-                                centrality=a.distance(countries_data[iso3]['capital']),
-                                speed=(80 if countries_data is None else countries_data[iso3]['speed']) + get_random(5),
-                                iso3=iso3
-                            )
+            if trails is None:
+                data_filtered = graph_data if iso3 is None else graph_data[graph_data.iso3 == iso3]
+                trails = parse_trails(data_filtered['shape'])
+
+            points = [Point(lat, lon) for lat, lon in zip(trails.lat.tolist(), trails.lon.tolist())]
+            self.add_nodes_from(points, iso3=iso3)
+
+            a_indices, b_indices = trails.segments()
+            capital = countries_data[iso3]['capital']
+            edge_distances = distances(
+                trails.lat[a_indices], trails.lon[a_indices],
+                trails.lat[b_indices], trails.lon[b_indices],
+                distance_mode
+                )
+            edge_centralities = distances(
+                trails.lat[a_indices], trails.lon[a_indices],
+                capital.lat, capital.lon,
+                distance_mode
+                )
+            edge_speeds = (80 if countries_data is None else countries_data[iso3]['speed']) + \
+                get_noise(default_rng() if rng is None else rng, 5, len(a_indices))
+            for a_index, b_index, edge_distance, edge_centrality, edge_speed in zip(
+                    a_indices.tolist(), b_indices.tolist(), edge_distances.tolist(), edge_centralities.tolist(), edge_speeds.tolist()):
+                self.add_edge(
+                        points[a_index],
+                        points[b_index],
+                        distance=edge_distance,
+                        centrality=edge_centrality,
+                        speed=edge_speed,
+                        iso3=iso3
+                    )
+
+    @staticmethod
+    def from_compact(compact: CompactGraph) -> 'RailwayNet':
+        net = RailwayNet()
+        net.countries = set(compact.countries)
+        points = compact.points()
+        net.component_labels = dict(zip(points, compact.component_labels().tolist()))
+        net.add_nodes_from(
+            (point, {'iso3': compact.country(code)}) for point, code in zip(points, compact.node_country.tolist())
+            )
+        net.add_edges_from(
+            (points[u], points[v], compact.edge_attributes(edge_id))
+                for edge_id, (u, v) in enumerate(zip(compact.src.tolist(), compact.dst.tolist()))
+            )
+        return net
 
     # endregion
 
     # region PublicMethods
 
-    @lru_cache(maxsize=None)
+    def to_compact(self) -> CompactGraph:
+        node_countries = [iso3 for _, iso3 in self.nodes(data='iso3')]
+        edges = list(self.edges(data=True))
+        countries = sorted((self.countries | set(node_countries) | {attrs.get('iso3') for _, _, attrs in edges}) - {None})
+        codes = {iso3: code for code, iso3 in enumerate(countries)}
+        codes[None] = -1
+        node_ids = {node: node_id for node_id, node in enumerate(self.nodes)}
+        return CompactGraph(
+            [node.lat for node in self.nodes],
+            [node.lon for node in self.nodes],
+            [codes[iso3] for iso3 in node_countries],
+            [node_ids[u] for u, _, _ in edges],
+            [node_ids[v] for _, v, _ in edges],
+            [codes[attrs.get('iso3')] for _, _, attrs in edges],
+            countries,
+            **{attr: [attrs.get(attr, np.nan) for _, _, attrs in edges] for attr in EDGE_ATTRIBUTES}
+            )
+
     def get_biggest_component(self):
-        return self.subgraph(max(nx.connected_components(self), key=len))
+        if self.__biggest_component is None:
+            if self.component_labels is None:
+                self.__biggest_component = self.subgraph(max(nx.connected_components(self), key=len))
+            else:
+                biggest = max(self.get_component_sizes().items(), key=lambda item: item[1])[0]
+                self.__biggest_component = self.subgraph(
+                    node for node, label in self.component_labels.items() if label == biggest
+                    )
+        return self.__biggest_component
+
+    def get_component_sizes(self) -> dict[int, int]:
+        """ number of nodes per component label """
+        if self.component_labels is None:
+            self.component_labels = {
+                node: label for label, component in enumerate(nx.connected_components(self)) for node in component
+                }
+        sizes = dict()
+        for label in self.component_labels.values():
+            sizes[label] = sizes.get(label, 0) + 1
+        return sizes
 
     def get_points_dataframe(self, full_graph):
-        points_dataframe = pd.DataFrame(
-            {
-                'lat':  [node.coord_reverse[0] for node in self.nodes if node in full_graph.nodes],
-                'lon':  [node.coord_reverse[1] for node in self.nodes if node in full_graph.nodes],
-                'iso3': [self.nodes[node]['iso3'] for node in self.nodes if node in full_graph.nodes]
-            }
-        )
+        # one pass over the nodes, membership is only checked when this is not the full graph itself
+        nodes = [
+            (node.lat, node.lon, iso3) for node, iso3 in self.nodes(data='iso3')
+                if self is full_graph or node in full_graph.nodes
+            ]
+        points_dataframe = pd.DataFrame(nodes, columns=['lat', 'lon', 'iso3'])
         return points_dataframe
 
     def draw_plot_by_country(self, size: tuple[int, int] = (20, 10, ), ):
-        plt.figure(figsize=size)
+        get_pyplot().figure(figsize=size)
         edge_color=[COLORS[ord(self[u][v]['iso3'][0]) % len(COLORS)] for u, v in self.edges]
         self.draw(edge_color=edge_color, node_size=0)
     
     def draw_plot_by_component(self, size: tuple[int, int] = (20, 10)):
-        plt.figure(figsize=size)
+        get_pyplot().figure(figsize=size)
         components = sorted(nx.connected_components(self), key=len, reverse=True)[:20]
+        from tqdm import tqdm
         for index, component in enumerate(tqdm(components, desc=CALCULATING_COMPONENTS_MSG)):
             self.subgraph(component).draw(edge_color=COLORS[index % (len(COLORS))], node_size=0)
 
@@ -157,7 +275,7 @@ class RailwayNet(GeoGraph):
         def green2red(ratio: float) -> tuple[float, float, float]:
             return (ratio, 1 - ratio, 0)
 
-        plt.figure(figsize=size)
+        get_pyplot().figure(figsize=size)
         attr_list = [self[u][v][attr] for u,v in self.edges]
         min_attr = min(attr_list)
         ratio_derivative = max(attr_list) - min_attr
@@ -166,9 +284,9 @@ class RailwayNet(GeoGraph):
     def describe(self, verbose=True) -> RailwayNetInfo:
         nodes = nx.number_of_nodes(self)
         edges = nx.number_of_edges(self)
-        components = nx.number_connected_components(self)
-        biggest_component_part = \
-            nx.number_of_nodes(self.get_biggest_component()) / nx.number_of_nodes(self)
+        component_sizes = sorted(self.get_component_sizes().values(), reverse=True)
+        components = len(component_sizes)
+        biggest_component_part = component_sizes[0] / nodes if nodes else 0.0
 
         if verbose:
             res = "\n"
@@ -176,36 +294,19 @@ class RailwayNet(GeoGraph):
             res += f"                   edges: {edges}\n"
             res += f"              components: {components}\n"
             res += f"  biggest component part: {biggest_component_part:.6}\n"
+            res += f"  biggest component sizes: {component_sizes[:DESCRIBED_COMPONENTS]}\n"
             print(res)
 
         return RailwayNetInfo(
             nodes=nodes,
             edges=edges,
             components=components,
-            biggest_component_part=biggest_component_part
+            biggest_component_part=biggest_component_part,
+            component_sizes=component_sizes
             )
 
     # endregion
 
-    # region ServiceMethods
-
-    @staticmethod
-    def __get_coordinates_from_string(coordinates_string: str) -> tuple[list[float], list[float]]:
-        """ function which formats (lat, long) data nicely """
-
-        tuple_string = coordinates_string[15:]
-        coordinate_strings_list = tuple_string.lstrip("( ").rstrip(") ").split(',')
-        lon = []
-        lat = []
-
-        for lon_lat_pair in coordinate_strings_list:
-            lon.append(float(lon_lat_pair.strip().split()[0].strip("()")))
-            lat.append(float(lon_lat_pair.strip().split()[1].strip("()")))
-
-        return lon, lat
-
-    # endregion
-
 class PathEdgePoint:
     def __init__(self, node: Point, iso3: str):
         self.node = node
@@ -220,21 +321,29 @@ class CountryNet(GeoGraph):
 
     # region Construction
 
-    def __init__(self, countries_data: dict = None):
+    def __init__(self, countries_data: dict = None, distance_mode: str = GEODESIC):
         super(CountryNet, self).__init__()
 
         if countries_data is not None:
+           pairs = []
            for country, country_attributes in countries_data.items():
                self.add_node(country_attributes['capital'], iso3 = country)
                for neighbour in country_attributes['neighbours']:
-                   if neighbour == country:
-                       continue
-                   self.add_edge(
-                        country_attributes['capital'],
-                        countries_data[neighbour]['capital'],
-                        distance=country_attributes['capital'].distance(countries_data[neighbour]['capital']),
-                        speed=(country_attributes['speed'] + countries_data[neighbour]['speed']) / 2,
-                        )
+                   if neighbour != country:
+                       pairs.append((country_attributes, countries_data[neighbour]))
+
+           pairs_distances = distances(
+                [a['capital'].lat for a, _ in pairs], [a['capital'].lon for a, _ in pairs],
+                [b['capital'].lat for _, b in pairs], [b['capital'].lon for _, b in pairs],
+                distance_mode
+                )
+           for (a, b), pair_distance in zip(pairs, pairs_distances.tolist()):
+               self.add_edge(
+                    a['capital'],
+                    b['capital'],
+                    distance=pair_distance,
+                    speed=(a['speed'] + b['speed']) / 2,
+                    )
 
     # endregion
 
@@ -242,54 +351,159 @@ class RailwayNetManager(dict):
 
     # region Constants
 
-    CACHED_LIST_OF_NETS_PATH = "./cached/graphs_list.bz2"
-    CACHED_FULL_GRAPH_PATH = "./cached/graph_full.bz2"
+    CACHED_NETWORK_PATH = "./cached/network"
+    CACHED_SPATIAL_INDEX_FILE = "spatial_index.pickle"
+    CACHED_HIERARCHY_PATH = "./cached/hierarchy_{profile}.npz"
+    METRICS_PATH = "./cached/metrics.jsonl"
+
+    CORRIDOR_CACHE_BUDGET = 512 * 1024 ** 2
+    SHARD_CACHE_BUDGET = 1024 ** 3
+    NET_CACHE_BUDGET = 512 * 1024 ** 2
+
+    # networkx nets are sized by their nodes and edges, measured with tracemalloc on synthetic country nets
+    NET_NODE_BYTES = 300
+    NET_EDGE_BYTES = 560
 
     # endregion
 
     # region Construction
 
-    def __init__(self, graph_data: pd.DataFrame, countries_data: pd.DataFrame):
-        self.graph_data = graph_data
+    def __init__(
+            self,
+            graph_data: pd.DataFrame | Callable[[], pd.DataFrame],
+            countries_data: pd.DataFrame,
+            distance_mode: str = GEODESIC,
+            workers: int = None,
+            corridor_cache_budget: int = CORRIDOR_CACHE_BUDGET,
+            seed: int = None,
+            shard_cache_budget: int = SHARD_CACHE_BUDGET,
+            net_cache_budget: int = NET_CACHE_BUDGET,
+            data_key: str = None
+        ):
+        # seconds per construction phase, reported by startup_report
+        self.startup = dict()
+
+        # graph_data may be a function reading it, it is then only called when the network has to be built,
+        # data_key names where graph_data and countries_data come from, without it the frames themselves are hashed
+        self.__graph_data = graph_data
         self.countries_data = RailwayNetManager.__countries_dataframe2dict(countries_data)
+        self.distance_mode = distance_mode
+        self.workers = workers
 
         self.start_node = None
         self.finish_node = None
 
-        self.pathfinding_results_path = "./cached/results.csv"
-        with open(self.pathfinding_results_path, "w") as f:
-            f.write("frm_iso3,frm_lat,frm_lon,to_iso3,frm_lat,frm_lon,timec,time\n")
-
-        # sort countries by amount of railways in it
-        self.countries_sorted = self.graph_data.iso3.value_counts().keys().to_list()
-
-        # try to load cached list of nets
-        # if not found, calculate
-        # then init dict with graph values
-        railway_nets = try_load_cached_file(RailwayNetManager.CACHED_LIST_OF_NETS_PATH)
-        if railway_nets is None:
-            railway_nets = [RailwayNet(
-                                    graph_data=self.graph_data,
-                                    countries_data=self.countries_data,
-                                    iso3=iso3
-                                ) for iso3 in tqdm(self.countries_sorted, desc=CALCULATING_GRAPHS_MSG)]
-
-            save_file_to_cache(railway_nets, RailwayNetManager.CACHED_LIST_OF_NETS_PATH)
-        super(RailwayNetManager, self).__init__(zip(self.countries_sorted, railway_nets))
-        self.full_graph = None
-        self.full_graph = self.__get_full()
-
+        # per-phase timings of every query, kept as histograms and appended to a rotating file
+        self.metrics = RoutingMetrics(RailwayNetManager.METRICS_PATH)
+
+        # try to load the cached compact nets
+        # if not found or built from other data, calculate
+        # country nets are read from their shards on first use, the full graph is mapped on first use,
+        # networkx nets are materialized from them on first use
+        self.cache = NetworkCache(RailwayNetManager.CACHED_NETWORK_PATH)
+        self.__full_compact = None
+        # the seed is part of the key, so seed=None has a cache of its own, built once from fresh entropy,
+        # the seed actually used is read back from the cache either way
+        start = perf_counter()
+        if data_key is None:
+            key = cache_key(self.graph_data[['iso3', 'shape']], countries_data, extra=(self.distance_mode, seed))
+        else:
+            key = cache_key(extra=(data_key, self.distance_mode, seed))
+        self.startup['cache key'] = perf_counter() - start
+        start = perf_counter()
+        self.compact_nets = self.cache.load(key, shard_cache_budget)
+        if self.compact_nets is None:
+            self.seed = SeedSequence().entropy if seed is None else seed
+            # sort countries by amount of railways in it
+            self.countries_sorted = self.graph_data.iso3.value_counts().keys().to_list()
+            compact_nets = build_railway_nets(
+                                    self.graph_data,
+                                    self.countries_data,
+                                    self.countries_sorted,
+                                    distance_mode=self.distance_mode,
+                                    workers=self.workers,
+                                    seed=self.seed
+                                )
+            with get_console().status(COMBINING_GRAPHS_MSG.strip()):
+                self.__full_compact = CompactGraph.compose(compact_nets)
+            self.cache.save(
+                key,
+                dict(zip(self.countries_sorted, compact_nets)),
+                self.__full_compact,
+                metadata={'seed': self.seed, 'countries_sorted': self.countries_sorted}
+                )
+            # the built nets are let go, countries come back from their shards when used
+            self.compact_nets = self.cache.load(key, shard_cache_budget)
+            self.startup['network build'] = perf_counter() - start
+        else:
+            self.startup['network load'] = perf_counter() - start
+        # both come from the manifest, so a warm start never reads the trails
+        manifest = self.cache.read_manifest()
+        self.seed = manifest['metadata']['seed']
+        self.countries_sorted = manifest['metadata']['countries_sorted']
+        # noise of recalculated costs
+        self.rng = default_rng(self.seed)
+        super(RailwayNetManager, self).__init__(zip(self.countries_sorted, [None] * len(self.countries_sorted)))
+
+        self.__full_graph = None
+        self.__spatial_index = None
+        self.spatial_indices = dict()
+        self.engines = dict()
+        self.matrices = dict()
+        self.hierarchies = dict()
+
+        # cross-border queries mostly reuse a few corridors, their reduced graphs are kept by country set and profile
+        self.country_paths = dict()
+        self.corridors = LRUCache(corridor_cache_budget, lambda corridor: corridor.nbytes)
+        # materialized networkx nets, an evicted one is dropped from the manager too
+        self.nets = LRUCache(net_cache_budget, RailwayNetManager.__net_nbytes, on_evict=self.__drop_net)
+
+        start = perf_counter()
         for country in self.countries_data:
             self.countries_data[country]['neighbours'] = set()
             self.countries_data[country]['neighbours'].add(country)
 
-        for edge in self.full_graph.edges:
-            a_country = self.full_graph.nodes[edge[0]]['iso3']
-            b_country = self.full_graph.nodes[edge[1]]['iso3']
-            if a_country != b_country:
-                self.countries_data[a_country]['neighbours'].add(b_country)
+        # neighbours come from the cross-border index, not from the full graph
+        for a_country, b_country, _ in manifest['border']:
+            self.countries_data[a_country]['neighbours'].add(b_country)
+            self.countries_data[b_country]['neighbours'].add(a_country)
+
+        self.countries_graph = CountryNet(self.countries_data, self.distance_mode)
+        self.startup['countries graph'] = perf_counter() - start
+
+    # endregion
 
-        self.countries_graph = CountryNet(self.countries_data)
+    # region Properties
+
+    @property
+    def graph_data(self) -> pd.DataFrame:
+        if callable(self.__graph_data):
+            self.__graph_data = self.__graph_data()
+        return self.__graph_data
+
+    @property
+    def full_compact(self) -> CompactGraph:
+        if self.__full_compact is None:
+            self.__full_compact = self.cache.load_full()
+        return self.__full_compact
+
+    @property
+    def full_graph(self) -> RailwayNet:
+        if self.__full_graph is None:
+            self.__full_graph = RailwayNet.from_compact(self.full_compact)
+        return self.__full_graph
+
+    @property
+    def spatial_index(self) -> SpatialIndex:
+        # the index file lives inside the network cache, so it goes stale together with it
+        if self.__spatial_index is None:
+            path = os.path.join(self.cache.path, RailwayNetManager.CACHED_SPATIAL_INDEX_FILE)
+            try:
+                self.__spatial_index = SpatialIndex.load(path)
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                self.__spatial_index = SpatialIndex(self.full_compact.lat, self.full_compact.lon)
+                self.__spatial_index.save(path)
+        return self.__spatial_index
 
     # endregion
 
@@ -301,20 +515,25 @@ class RailwayNetManager(dict):
         edges = []
         components = []
         biggest_component_part = []
-        for key, value in self.items():
-            info = value.describe(False)
+        component_sizes = []
+        for key in self:
+            # stored component labels make this a count, no net is materialized
+            compact = self.compact_nets[key]
+            sizes = np.sort(compact.component_sizes())[::-1].tolist()
             countries.append(key)
-            nodes.append(info.nodes)
-            edges.append(info.edges)
-            components.append(info.components)
-            biggest_component_part.append(info.biggest_component_part)
+            nodes.append(compact.number_of_nodes)
+            edges.append(compact.number_of_edges)
+            components.append(len(sizes))
+            biggest_component_part.append(sizes[0] / compact.number_of_nodes if sizes else 0.0)
+            component_sizes.append(sizes[:DESCRIBED_COMPONENTS])
         description = pd.DataFrame(
             {
                 "country"                : countries,
                 "nodes"                  : nodes,
                 "edges"                  : edges,
                 "components"             : components,
-                "biggest_component_part" : biggest_component_part
+                "biggest_component_part" : biggest_component_part,
+                "component_sizes"        : component_sizes
             }
         )
         with open("railwaynet_description.csv", "w") as f:
@@ -334,24 +553,34 @@ class RailwayNetManager(dict):
 
     def get_net(self, iso3: str) -> RailwayNet | None:
         if iso3 in self.countries_sorted:
-            if self[iso3] is None:
-                self[iso3] = RailwayNet(
+
+            def build() -> RailwayNet:
+                if self.compact_nets.get(iso3) is not None:
+                    # a route from here most likely goes on to a neighbour
+                    self.compact_nets.prefetch(self.countries_data[iso3]['neighbours'])
+                    return RailwayNet.from_compact(self.compact_nets[iso3])
+                return RailwayNet(
                     self.graph_data,
                     countries_data=self.countries_data,
-                    iso3=iso3
+                    iso3=iso3,
+                    distance_mode=self.distance_mode,
+                    rng=self.rng
                     )
-            return self[iso3]
+
+            net = self.nets.get(iso3, build)
+            # a net over the whole budget is handed out but not kept
+            self[iso3] = net if iso3 in self.nets else None
+            return net
         return None
 
     def get_nets(self, iso3_lst: list[str], recalculate_centrality: bool = True) -> RailwayNet | None:
-        res = RailwayNet()
-
-        def compose(G, H):
-            C = nx.compose(G, H)
-            C.countries = G.countries.union(H.countries)
-            return C
+        """ union of the country nets, copied in linear time from the compact graphs """
+        iso3_lst = [iso3 for iso3 in iso3_lst if iso3 in self.countries_sorted]
+        if not iso3_lst:
+            return None
 
-        res = reduce(compose, tqdm([self.get_net(iso3) for iso3 in iso3_lst if iso3 in self.countries_sorted], desc=COMBINING_GRAPHS_MSG), res)
+        with get_console().status(COMBINING_GRAPHS_MSG.strip()):
+            res = RailwayNet.from_compact(CompactGraph.compose([self.compact_nets[iso3] for iso3 in iso3_lst]))
         if nx.number_of_nodes(res) <= 0:
             return None
 
@@ -360,149 +589,375 @@ class RailwayNetManager(dict):
         return res
 
     def save_node(self, point: tuple[float, float], iso3: str) -> bool:
-        for node in self.full_graph.nodes:
-            if node.coord == point:
-                if self.start_node is None:
-                    self.start_node = PathEdgePoint(node, iso3)
-                    return True
-                elif self.finish_node is None:
-                    self.finish_node = PathEdgePoint(node, iso3)
-                    return True
-                return False
+        node_id = self.spatial_index.lookup(point[1], point[0])
+        if node_id is None:
+            return False
+        node = self.full_compact.point(node_id)
+        if self.start_node is None:
+            self.start_node = PathEdgePoint(node, iso3)
+            return True
+        elif self.finish_node is None:
+            self.finish_node = PathEdgePoint(node, iso3)
+            return True
         return False
 
-    def find_path(self, o_paths: list, func_d=None) -> None:
-        
-        timespan_c = 0
-        timespan = 0
-
-        def country_func(u,v,e_attrs):
-            return e_attrs['distance'] + 2 * e_attrs['speed']
-
-        def func(u,v,e_attrs):
-            return e_attrs['distance'] + 1/e_attrs['speed'] + e_attrs['cost'] + 1/e_attrs['centrality']
-
+    def get_spatial_index(self, iso3: str = None, component_of: Point = None) -> SpatialIndex:
+        """ index over the full graph, optionally restricted to a country and/or the component of a node """
+        component = None
+        if component_of is not None:
+            node_id = self.full_compact.node_id(component_of)
+            if node_id is None:
+                raise nx.NodeNotFound(f"Node {component_of.coord} is not in the full graph")
+            component = int(self.full_compact.component_labels()[node_id])
+
+        key = (iso3, component)
+        if key == (None, None):
+            return self.spatial_index
+        if key not in self.spatial_indices:
+            mask = np.ones(self.full_compact.number_of_nodes, dtype=bool)
+            if iso3 is not None:
+                mask &= self.full_compact.node_country == self.full_compact.country_code(iso3)
+            if component is not None:
+                mask &= self.full_compact.component_labels() == component
+            self.spatial_indices[key] = self.spatial_index.restrict(np.flatnonzero(mask))
+        return self.spatial_indices[key]
+
+    def warm(self, profiles: tuple[str] = (DEFAULT_PROFILE, ), matrices: bool = False) -> None:
+        """ loads what queries share, forked workers then inherit it instead of each loading it again """
+        start = perf_counter()
+        # the first lookup sorts the node keys, snapping and ch use them, corridors come from the shards on demand
+        self.full_compact.node_ids(self.full_compact.lat[:1], self.full_compact.lon[:1])
+        self.spatial_index
+        for profile in profiles:
+            self.get_hierarchy(profile)
+            if matrices:
+                self.get_matrix(profile)
+        self.startup['warm'] = perf_counter() - start
+
+    def snap(self, lat: float, lon: float, iso3: str = None, component_of: Point = None, k: int = 1) -> list[Point]:
+        """ k nearest rail nodes to an arbitrary location, nearest first """
+        node_ids, _ = self.get_spatial_index(iso3, component_of).nearest(lat, lon, k)
+        return self.full_compact.points(node_ids[0])
+
+    def find_path(self, o_paths: list, func_d=None, profile: str = DEFAULT_PROFILE, mode: str = DIJKSTRA) -> float:
+        """ seconds spent on the country path, search and reconstruction, every phase is recorded in metrics """
+        self.settled = None
+        timings = dict()
+
+        # the hierarchy covers the whole biggest component, so no country corridor is needed
+        if mode == CONTRACTION_HIERARCHY:
+            hierarchy = self.get_hierarchy(profile)
+            if hierarchy is None:
+                raise ValueError(f"No contraction hierarchy for profile '{profile}', call prepare_hierarchies first")
+            source = self.full_compact.node_id(self.start_node.node)
+            target = self.full_compact.node_id(self.finish_node.node)
+            if source is None or target is None:
+                raise nx.NodeNotFound("Path end is not in the full graph")
+            if not self.full_compact.connected(source, target):
+                raise NetworkXNoPath(f"Node {self.finish_node.node.coord} not reachable from {self.start_node.node.coord}")
+            start = perf_counter()
+            path = hierarchy.shortest_path(source, target)
+            timings[SEARCH] = perf_counter() - start
+            start = perf_counter()
+            o_paths[1] = self.full_compact.points(path)
+            timings[RECONSTRUCTION] = perf_counter() - start
+            self.settled = hierarchy.settled
+            return self.__record_query(profile, mode, timings)
+
+        # other modes search the countries along the country path only, a same-country route stays in its country
         if self.start_node.iso3 == self.finish_node.iso3:
-            start = time()
-            o_paths[1] = nx.dijkstra_path(
-                self.full_graph.get_biggest_component(),
-                self.start_node.node,
-                self.finish_node.node,
-                func if func_d is None else func_d)
-            end = time()
-            timespan += end - start
+            if func_d is None:
+                start = perf_counter()
+                corridor = self.get_corridor([self.start_node.iso3], profile)
+                timings[CORRIDOR] = perf_counter() - start
+                o_paths[1] = self.__find_reduced_path(corridor, profile, mode, timings)
+            else:
+                start = perf_counter()
+                g = self.get_net(self.start_node.iso3)
+                timings[CORRIDOR] = perf_counter() - start
+                start = perf_counter()
+                o_paths[1] = nx.dijkstra_path(
+                    g,
+                    self.start_node.node,
+                    self.finish_node.node,
+                    func_d)
+                timings[SEARCH] = perf_counter() - start
         else:
-            frm = None
-            to = None
-            for n in self.countries_graph.nodes:
-                if self.countries_graph.nodes[n]['iso3'] == self.start_node.iso3:
-                    frm = n
-                if self.countries_graph.nodes[n]['iso3'] == self.finish_node.iso3:
-                    to = n
-            start = time()
-            o_paths[0] = cpath = nx.dijkstra_path(self.countries_graph, frm, to, country_func)
-            end = time()
-            timespan_c += end - start
-
-            countries_in_path = []
-            for p in cpath:
-                for n in self.countries_graph.nodes:
-                    if n == p:
-                        countries_in_path.append(self.countries_graph.nodes[n]['iso3'])
-            g = self.get_nets(countries_in_path, recalculate_centrality=False)
-            start = time()
-            o_paths[1] = nx.dijkstra_path(
-                g,
-                self.start_node.node,
-                self.finish_node.node,
-                func if func_d is None else func_d)
-            end = time()
-            timespan += end - start
-        self.__save_result(self.start_node, self.finish_node, timespan_c, timespan)
-        return timespan + timespan_c
-
-    def test_efficiency(self):
+            start = perf_counter()
+            cpath, countries_in_path = self.__get_country_path(self.start_node.iso3, self.finish_node.iso3)
+            o_paths[0] = list(cpath)
+            timings[COUNTRY_PATH] = perf_counter() - start
+
+            if func_d is None:
+                start = perf_counter()
+                corridor = self.get_corridor(countries_in_path, profile)
+                timings[CORRIDOR] = perf_counter() - start
+                o_paths[1] = self.__find_reduced_path(corridor, profile, mode, timings)
+            else:
+                start = perf_counter()
+                g = self.get_nets(countries_in_path, recalculate_centrality=False)
+                timings[CORRIDOR] = perf_counter() - start
+                start = perf_counter()
+                o_paths[1] = nx.dijkstra_path(
+                    g,
+                    self.start_node.node,
+                    self.finish_node.node,
+                    func_d)
+                timings[SEARCH] = perf_counter() - start
+        return self.__record_query(profile, mode, timings)
+
+    def route_matrix(
+            self,
+            origins: list[Point],
+            destinations: list[Point],
+            profile: str = DEFAULT_PROFILE,
+            with_paths: bool = False,
+            workers: int = None
+        ) -> tuple[np.ndarray, list[list[list[Point]]] | None]:
+        """ profile costs between all origins and destinations over the full graph, start and finish nodes are left as they are """
+        sources = self.full_compact.node_ids([p.lat for p in origins], [p.lon for p in origins])
+        targets = self.full_compact.node_ids([p.lat for p in destinations], [p.lon for p in destinations])
+        missing = [p.coord for p, node_id in zip(origins + destinations, np.concatenate((sources, targets)).tolist()) if node_id < 0]
+        if missing:
+            raise nx.NodeNotFound(f"Nodes {missing} are not in the full graph")
+
+        costs, paths = route_matrix(
+            self.full_compact,
+            sources,
+            targets,
+            profile,
+            with_paths=with_paths,
+            workers=self.workers if workers is None else workers,
+            matrix=self.get_matrix(profile)
+            )
+        if paths is not None:
+            paths = [[None if path is None else self.full_compact.points(path) for path in row] for row in paths]
+        return costs, paths
+
+    def prepare_hierarchies(self, profiles: tuple[str] = (DEFAULT_PROFILE, ), workers: int = None) -> None:
+        """ offline contraction of the biggest component, one profile after the other, each spread over the workers """
+        with get_console().status(CONTRACTING_MSG):
+            hierarchies = build_hierarchies(
+                self.full_compact,
+                list(profiles),
+                node_ids=self.full_compact.biggest_component_ids(),
+                workers=self.workers if workers is None else workers
+                )
+        for profile, hierarchy in hierarchies.items():
+            hierarchy.save(RailwayNetManager.CACHED_HIERARCHY_PATH.format(profile=profile))
+            self.hierarchies[profile] = hierarchy
+
+    def get_hierarchy(self, profile: str = DEFAULT_PROFILE) -> ContractionHierarchy | None:
+        if profile not in self.hierarchies:
+            try:
+                hierarchy = ContractionHierarchy.load(RailwayNetManager.CACHED_HIERARCHY_PATH.format(profile=profile))
+            except FileNotFoundError:
+                return None
+            signature = hierarchy_signature(self.full_compact, profile, self.full_compact.biggest_component_ids())
+            if hierarchy.signature != signature:
+                print(f"Contraction hierarchy for profile '{profile}' is stale")
+                return None
+            self.hierarchies[profile] = hierarchy
+        return self.hierarchies[profile]
+
+    def test_hierarchy(self, profile: str = DEFAULT_PROFILE, queries: int = 100) -> int:
+        """ compares hierarchy paths with nx.dijkstra_path, returns the number of mismatches """
+        hierarchy = self.get_hierarchy(profile)
+        g = self.full_graph.get_biggest_component()
+        nodes = list(g.nodes)
+        mismatches = 0
+        compared = 0
+        for _ in range(queries):
+            start = choice(nodes)
+            finish = choice(nodes)
+            cost, expected = nx.single_source_dijkstra(g, start, finish, weight=WEIGHT_CALLBACKS[profile])
+            # networkx walks infinite edges, the hierarchy treats their ends as unreachable
+            if cost == np.inf:
+                continue
+            compared += 1
+            path = self.full_compact.points(
+                hierarchy.shortest_path(self.full_compact.node_id(start), self.full_compact.node_id(finish))
+                )
+            if path != expected:
+                mismatches += 1
+                print(f"mismatch {start.coord} -> {finish.coord}: {len(path)} vs {len(expected)} nodes")
+        print(f"{mismatches} of {compared} contraction hierarchy paths differ from dijkstra")
+        return mismatches
+
+    def get_corridor(self, iso3_lst: list[str], profile: str = DEFAULT_PROFILE) -> ReducedGraph:
+        """ reduced union of the country nets, shared by all queries through the same countries """
+        corridor = tuple(sorted(iso3 for iso3 in set(iso3_lst) if iso3 in self.compact_nets))
+
+        def build() -> ReducedGraph:
+            reduced = ReducedGraph.build(CompactGraph.compose([self.compact_nets[iso3] for iso3 in corridor]))
+            # the engine is built before the cache sizes the corridor
+            reduced.get_engine(profile)
+            return reduced
+
+        return self.corridors.get((frozenset(corridor), profile), build)
+
+    def get_engine(self, profile: str = DEFAULT_PROFILE) -> ShortestPathEngine:
+        if profile not in self.engines:
+            self.engines[profile] = ShortestPathEngine(self.full_compact, profile)
+        return self.engines[profile]
+
+    def get_matrix(self, profile: str = DEFAULT_PROFILE) -> csr_matrix:
+        """ weights of the full graph as a sparse matrix for route matrices, built once per profile """
+        if profile not in self.matrices:
+            self.matrices[profile] = weight_matrix(self.full_compact, get_weights(self.full_compact, profile))
+        return self.matrices[profile]
+
+    def test_efficiency(
+            self,
+            modes: tuple[str] = (DIJKSTRA, ),
+            queries: int = 1000,
+            seed: int = None,
+            profile: str = DEFAULT_PROFILE
+        ) -> dict:
+        """ times every mode against nx.dijkstra_path with the callback of the same profile, ch needs its hierarchy prepared """
         fake = [None, None]
+        func = WEIGHT_CALLBACKS[profile]
+        rng = random.Random(seed)
 
         g = self.full_graph.get_biggest_component()
-        my_time = []
-        dij_time = []
-        for _ in range(1000):
-            start = choice(list(g.nodes))
-            finish = choice(list(g.nodes))
+        efficiency = {mode: {'time': [], 'settled': []} for mode in modes}
+        efficiency['networkx'] = {'time': [], 'settled': []}
+        for _ in range(queries):
+            start = rng.choice(list(g.nodes))
+            finish = rng.choice(list(g.nodes))
 
             self.start_node = PathEdgePoint(start, g.nodes[start]['iso3'])
             self.finish_node = PathEdgePoint(finish, g.nodes[finish]['iso3'])
 
-            def func(u,v,e_attrs):
-                return e_attrs['distance'] + 1/e_attrs['speed'] + 1/e_attrs['centrality']
-            
-            my_t = 0
-            dij_t = 0
-
             try:
-                my_t = self.find_path(fake, func_d=func)
+                s = time()
+                cost, path = nx.single_source_dijkstra(g, start, finish, weight=func)
+                e = time()
             except NetworkXNoPath:
                 continue
+            # only networkx walks infinite edges, the other modes find no path there
+            if cost == np.inf:
+                continue
 
+            results = dict()
             try:
-                s = time()
-                nx.dijkstra_path(g, start, finish, func)
-                e = time()
-                dij_t = e - s
-            except NetworkXNoPath:
+                for mode in modes:
+                    results[mode] = (self.find_path(fake, profile=profile, mode=mode), self.settled, fake[1] == path)
+            except (NetworkXNoPath, nx.NodeNotFound):
                 continue
-            
-            print(f"my {my_t}, dij {dij_t}")
-            my_time.append(my_t)
-            dij_time.append(dij_t)
+
+            efficiency['networkx']['time'].append(e - s)
+            efficiency['networkx']['settled'].append(None)
+            for mode, (my_t, settled, _) in results.items():
+                efficiency[mode]['time'].append(my_t)
+                efficiency[mode]['settled'].append(settled)
+
+            print(
+                ", ".join(
+                    f"{mode} {my_t:.6f}s/{settled}" + ("" if same else " (path differs)")
+                        for mode, (my_t, settled, same) in results.items()
+                    ) + f", dij {e - s:.6f}s"
+                )
 
         self.start_node = None
         self.finish_node = None
 
-        return my_time, dij_time
+        return efficiency
 
     # endregion
 
     # region ServiceMethods
     
-    def __get_full(self) -> RailwayNet:
-        # if full graph is initiated
-        if self.full_graph is not None:
-            return self.full_graph
-
-        # try to load graph of all nets
-        # if not found, calculate
-        full_graph = try_load_cached_file(RailwayNetManager.CACHED_FULL_GRAPH_PATH)
-        if full_graph is None:
-            full_graph = self.get_nets(self.countries_sorted, recalculate_centrality=False)
-            save_file_to_cache(full_graph, RailwayNetManager.CACHED_FULL_GRAPH_PATH)
-        return full_graph
+    def __get_country_path(self, frm_iso3: str, to_iso3: str) -> tuple[list, list[str]]:
+        """ countries graph path and the countries along it, memoized per pair """
+        key = (frm_iso3, to_iso3)
+        if key not in self.country_paths:
+
+            def country_func(u,v,e_attrs):
+                return e_attrs['distance'] + 2 * e_attrs['speed']
+
+            frm = None
+            to = None
+            for n in self.countries_graph.nodes:
+                if self.countries_graph.nodes[n]['iso3'] == frm_iso3:
+                    frm = n
+                if self.countries_graph.nodes[n]['iso3'] == to_iso3:
+                    to = n
+            cpath = nx.dijkstra_path(self.countries_graph, frm, to, country_func)
+            self.country_paths[key] = (cpath, [self.countries_graph.nodes[n]['iso3'] for n in cpath])
+        return self.country_paths[key]
+
+    def __find_reduced_path(self, reduced: ReducedGraph, profile: str, mode: str, timings: dict) -> list[Point]:
+        graph = reduced.original
+        source = graph.node_id(self.start_node.node)
+        target = graph.node_id(self.finish_node.node)
+        if source is None or target is None:
+            raise nx.NodeNotFound(f"Path end is not in the graph of {sorted(graph.countries)}")
+        if not graph.connected(source, target):
+            raise NetworkXNoPath(f"Node {target} not reachable from {source} in the graph of {sorted(graph.countries)}")
+        start = perf_counter()
+        path = reduced.shortest_path(source, target, profile, mode)
+        timings[SEARCH] = perf_counter() - start
+        self.settled = reduced.get_engine(profile).settled
+        start = perf_counter()
+        points = graph.points(path)
+        timings[RECONSTRUCTION] = perf_counter() - start
+        return points
 
     def __calculate_centrality(self, g: RailwayNet) -> None:
-        for edge in tqdm(g.edges, desc=CALCULATING_CENTRALITY_MSG):
-            g.edges[edge]['centrality'] = \
-                mean(
-                    (edge[0].distance(self.countries_data[neighbour]['capital']) \
-                        for neighbour in \
-                            self.countries_data[g.edges[edge]['iso3']]['neighbours']))
-            g.edges[edge]['cost'] = 2 + 1 / g.edges[edge]['centrality'] + get_random(1.5)
+        edges_by_country = dict()
+        for edge in g.edges:
+            edges_by_country.setdefault(g.edges[edge]['iso3'], []).append(edge)
+
+        from tqdm import tqdm
+        for iso3, edges in tqdm(edges_by_country.items(), desc=CALCULATING_CENTRALITY_MSG):
+            capitals = [self.countries_data[neighbour]['capital'] for neighbour in self.countries_data[iso3]['neighbours']]
+            centralities = distances(
+                np.array([edge[0].lat for edge in edges])[:, None],
+                np.array([edge[0].lon for edge in edges])[:, None],
+                np.array([capital.lat for capital in capitals])[None, :],
+                np.array([capital.lon for capital in capitals])[None, :],
+                self.distance_mode
+                ).mean(axis=1)
+            costs = 2 + 1 / centralities + get_noise(self.rng, 1.5, len(edges))
+            for edge, centrality, cost in zip(edges, centralities.tolist(), costs.tolist()):
+                g.edges[edge]['centrality'] = centrality
+                g.edges[edge]['cost'] = cost
     
-    def __save_result(self, s: PathEdgePoint, e: PathEdgePoint, timec: float, time: float):
-        with open(self.pathfinding_results_path, "a") as f:
-            f.write(f"{s.iso3},{s.node.coord_reverse[0]},{s.node.coord_reverse[1]},{e.iso3},{e.node.coord_reverse[0]},{e.node.coord_reverse[1]},{timec},{time}\n")
+    def __drop_net(self, iso3: str, _: RailwayNet) -> None:
+        self[iso3] = None
+
+    def __record_query(self, profile: str, mode: str, timings: dict) -> float:
+        timings[TOTAL] = sum(timings.values())
+        self.metrics.record(
+            frm_iso3=self.start_node.iso3,
+            frm=self.start_node.node.coord_reverse,
+            to_iso3=self.finish_node.iso3,
+            to=self.finish_node.node.coord_reverse,
+            profile=profile,
+            mode=mode,
+            settled=self.settled,
+            **timings
+            )
+        # corridor assembly is amortized over the queries sharing it, the returned time leaves it out
+        return timings[TOTAL] - timings.get(CORRIDOR, 0.0)
 
+    @staticmethod
+    def __net_nbytes(net: RailwayNet) -> int:
+        return net.number_of_nodes() * RailwayNetManager.NET_NODE_BYTES + net.number_of_edges() * RailwayNetManager.NET_EDGE_BYTES
 
     @staticmethod
     def __countries_dataframe2dict(countries_data: pd.DataFrame) -> dict:
-        countries_dict = dict()
-        for iso3 in countries_data.iso3:
-            country = countries_data[countries_data.iso3 == iso3].iloc[0]
-            countries_dict[iso3] = {
-                'speed'   : country.MaximumTrainSpeed,
-                'capital' : Point(country.CapitalLatitude, country.CapitalLongitude)
-                }
-        return countries_dict
+        # the first row of every country, like filtering the frame per iso3 did
+        countries = countries_data.drop_duplicates('iso3')
+        return {
+            iso3: {
+                'speed'   : speed,
+                'capital' : Point(lat, lon)
+                } for iso3, speed, lat, lon in zip(
+                    countries.iso3, countries.MaximumTrainSpeed, countries.CapitalLatitude, countries.CapitalLongitude
+                    )
+            }
 
     # endregion
 
@@ -510,52 +965,161 @@ class RailwayNetManager(dict):
 
 # region Functions
 
-def default_setup() -> RailwayNetManager:
-    # manage graph data
-    data_path = "./data/trains.csv"
-    data = pd.read_csv(data_path, sep=',', dtype=str)[["iso3", "shape"]]
+def default_setup(data_path: str = "./data/trains.csv") -> tuple[RailwayNetManager, pd.DataFrame]:
+    startup = dict()
+
+    start = perf_counter()
+    countries_data = read_countries_data()
+    startup['countries data'] = perf_counter() - start
+
+    # the cache is keyed by the raw files, the trails are only parsed when the network has to be built
+    start = perf_counter()
+    data_key = file_digest(data_path, CAPITALS_DATA_PATH, SPEED_DATA_PATH)
+    startup['data key'] = perf_counter() - start
+
+    def read_trains() -> pd.DataFrame:
+        start = perf_counter()
+        data = pd.read_csv(data_path, sep=',', dtype=str)[["iso3", "shape"]]
+        startup['read trains'] = perf_counter() - start
+        # synchronize graph data by available countries data
+        return data[data.iso3.isin(countries_data.iso3)]
+
+    manager = RailwayNetManager(graph_data=read_trains, countries_data=countries_data, data_key=data_key)
+    manager.startup = startup | manager.startup
+    return manager, countries_data
+
+def read_countries_data(cache_path: str = COUNTRIES_CACHE_PATH) -> pd.DataFrame:
+    """ maximum train speed and capital coordinates of every country with both known """
+    key = file_digest(CAPITALS_DATA_PATH, SPEED_DATA_PATH)
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['key'] == key:
+            return cached['data']
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError, KeyError):
+        pass
+
+    # pycountry loads its databases on the first lookup, every distinct name is looked up once
+    import pycountry
+
+    def alpha_3(alpha_2: str) -> str | None:
+        country = pycountry.countries.get(alpha_2=alpha_2)
+        return None if country is None else country.alpha_3
 
     # manage countries data
-    capitals_data_path = "./data/country_capitals.csv"
-    capitals_data = pd.read_csv(capitals_data_path, sep=',').dropna()[['CountryCode', 'CapitalLatitude', 'CapitalLongitude']]
-    capitals_data['iso3'] = capitals_data.CountryCode.apply(lambda c : pycountry.countries.get(alpha_2 = c).alpha_3 if pycountry.countries.get(alpha_2 = c) is not None else None)
+    capitals_data = pd.read_csv(CAPITALS_DATA_PATH, sep=',').dropna()[['CountryCode', 'CapitalLatitude', 'CapitalLongitude']]
+    codes = {code: alpha_3(code) for code in capitals_data.CountryCode.unique()}
+    capitals_data['iso3'] = capitals_data.CountryCode.map(codes)
     capitals_data = capitals_data.drop(columns=['CountryCode'])
 
-    speed_data_path="./data/train_speed.csv"
-    speed_data = pd.read_csv(speed_data_path, sep=',')
-    speed_data['iso3'] = speed_data.CountryName.apply(lambda name: pycountry.countries.search_fuzzy(name)[0].alpha_3)
+    speed_data = pd.read_csv(SPEED_DATA_PATH, sep=',')
+    names = {name: pycountry.countries.search_fuzzy(name)[0].alpha_3 for name in speed_data.CountryName.unique()}
+    speed_data['iso3'] = speed_data.CountryName.map(names)
     speed_data = speed_data.drop(columns=['CountryName'])
 
     # merge countries
     countries_data = speed_data.merge(capitals_data)
-
-    # synchronize graph data by available countries data
-    data = data[data.iso3.isin(countries_data.iso3)]
-
-    return RailwayNetManager(graph_data=data, countries_data=countries_data), data, countries_data
-
-def try_load_cached_file(path: str):
-    data = None
-    try:
-        with CONSOLE.status(f"Loading {path} file"), contextlib.closing(bz2.BZ2File(path, 'rb')) as f:
-            print(f"File '{path}' found")
-            data = pickle.load(f)
-    except FileNotFoundError as e:                
-        print(e)
-
-    return data
-
-def save_file_to_cache(obj, path: str):
-    with contextlib.closing(bz2.BZ2File(path, 'wb')) as f:
-                pickle.dump(obj, f)
-
-def get_random(span: float):
-    n = NORM_RANDOM()
-    if n < -1:
-        n = -1
-    if n > 1:
-        n = 1
-    return n * span
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, 'wb') as f:
+        pickle.dump({'key': key, 'data': countries_data}, f)
+    return countries_data
+
+def build_railway_nets(
+        graph_data: pd.DataFrame,
+        countries_data: dict,
+        countries: list[str],
+        distance_mode: str = GEODESIC,
+        workers: int = None,
+        seed: int = None
+    ) -> list[CompactGraph]:
+    """ parses and groups graph data once, then builds compact per-country nets on a process pool """
+
+    trails = parse_trails(graph_data['shape'])
+    groups = graph_data.groupby('iso3', sort=False).indices
+    # every country draws from its own child seed, so results do not depend on worker scheduling
+    seeds = SeedSequence(seed).spawn(len(countries))
+    tasks = [
+        (
+            trails.select(groups[iso3]),
+            {iso3: countries_data[iso3]},
+            iso3,
+            distance_mode,
+            country_seed
+        ) for iso3, country_seed in zip(countries, seeds)
+    ]
+
+    from tqdm import tqdm
+    if workers == 1:
+        return [_build_railway_net(task) for task in tqdm(tasks, desc=CALCULATING_GRAPHS_MSG)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(tqdm(executor.map(_build_railway_net, tasks), total=len(tasks), desc=CALCULATING_GRAPHS_MSG))
+
+def _build_railway_net(task: tuple) -> CompactGraph:
+    trails, countries_data, iso3, distance_mode, seed = task
+    compact = RailwayNet(
+        countries_data=countries_data,
+        iso3=iso3,
+        trails=trails,
+        distance_mode=distance_mode,
+        rng=default_rng(seed)
+        ).to_compact()
+    # labelled here so the work is spread over the pool
+    compact.component_labels()
+    return compact
+
+def parse_trails(shapes) -> TrailsData:
+    """ parses a whole column of WKT (MULTI)LINESTRING shapes into flat coordinate arrays """
+
+    bodies = []
+    counts = np.zeros(len(shapes), dtype=np.int64)
+    for i, shape in enumerate(shapes):
+        start = shape.find('(')
+        if start < 0:
+            continue
+        body = shape[start:].replace('(', ' ').replace(')', ' ')
+        if body.strip():
+            bodies.append(body)
+            counts[i] = body.count(',') + 1
+
+    values = np.array(' '.join(bodies).replace(',', ' ').split(), dtype=np.float64)
+    if len(values) != 2 * counts.sum():
+        raise ValueError("Trail shapes must contain (lon, lat) coordinate pairs only")
+
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    coordinates = values.reshape(-1, 2)
+    return TrailsData(lon=coordinates[:, 0].copy(), lat=coordinates[:, 1].copy(), offsets=offsets)
+
+def startup_report(startup: dict) -> str:
+    """ phases with their seconds and share of the total, slowest first """
+    total = sum(startup.values())
+    lines = [
+        f"{phase:>24} {seconds:8.3f} s {seconds / total if total else 0:6.1%}"
+            for phase, seconds in sorted(startup.items(), key=lambda item: item[1], reverse=True)
+        ]
+    return "\n".join(lines + [f"{'total':>24} {total:8.3f} s"])
+
+_console = None
+
+def get_console():
+    """ rich console for status messages, imported on the first one """
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
+
+def get_pyplot():
+    """ pyplot, imported on the first plot with an interactive backend where there is a display """
+    import matplotlib
+    matplotlib.use('Qt5Agg', force=False)
+    from matplotlib import pyplot as plt
+    return plt
+
+def get_noise(rng: np.random.Generator, span: float, size: int) -> np.ndarray:
+    """ standard normal noise clipped to [-1, 1] and scaled to [-span, span], drawn in one call """
+    return np.clip(rng.standard_normal(size), -1, 1) * span
 
 
 
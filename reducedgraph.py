@@ -0,0 +1,283 @@
+from pathfinding import ShortestPathEngine, DEFAULT_PROFILE, DIJKSTRA, get_weights
+from compactgraph import CompactGraph, EDGE_ATTRIBUTES
+from networkx import NetworkXNoPath
+
+import numpy as np
+import math
+
+# region Constants
+
+NOT_INTERIOR = -1
+
+# rough size of an entry of the edge lookup dict, its key tuple included
+LOOKUP_ITEM_BYTES = 200
+
+# endregion
+
+# region Types
+
+class ReducedGraph:
+    """ compact graph with chains of degree-2 nodes collapsed into single edges that keep their geometry """
+
+    # region Construction
+
+    def __init__(self, graph: CompactGraph, chains: list[list[int]], chain_edges: list[list[int]]):
+        self.original = graph
+
+        # reduced node i is original node node_ids[i]
+        self.node_ids = np.unique(np.array([chain[0] for chain in chains] + [chain[-1] for chain in chains], dtype=np.int64))
+        isolated = np.flatnonzero(np.diff(graph.adjacency[0]) == 0)
+        self.node_ids = np.union1d(self.node_ids, isolated)
+        self.reduced_ids = np.full(graph.number_of_nodes, -1, dtype=np.int64)
+        self.reduced_ids[self.node_ids] = np.arange(len(self.node_ids))
+
+        # geometry of reduced edge e is geometry[geometry_offsets[e]:geometry_offsets[e + 1]], src first
+        lengths = np.array([len(chain) for chain in chains], dtype=np.int64)
+        self.geometry_offsets = np.zeros(len(chains) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.geometry_offsets[1:])
+        self.geometry = np.array([node for chain in chains for node in chain], dtype=np.int64)
+        # original edges of reduced edge e are members[member_offsets[e]:member_offsets[e + 1]]
+        self.member_offsets = self.geometry_offsets - np.arange(len(chains) + 1)
+        self.members = np.array([edge for edges in chain_edges for edge in edges], dtype=np.int64)
+
+        # position of every interior node inside its chain
+        self.interior_edge = np.full(graph.number_of_nodes, NOT_INTERIOR, dtype=np.int64)
+        self.interior_position = np.zeros(graph.number_of_nodes, dtype=np.int64)
+        chain_ids = np.repeat(np.arange(len(chains)), lengths)
+        positions = np.arange(len(self.geometry)) - np.repeat(self.geometry_offsets[:-1], lengths)
+        interior = (positions > 0) & (positions < np.repeat(lengths, lengths) - 1)
+        self.interior_edge[self.geometry[interior]] = chain_ids[interior]
+        self.interior_position[self.geometry[interior]] = positions[interior]
+
+        member_distance = graph.distance[self.members]
+        starts = self.member_offsets[:-1]
+
+        def sums(values: np.ndarray) -> np.ndarray:
+            return np.add.reduceat(values, starts) if len(starts) else np.empty(0)
+
+        distance = sums(member_distance)
+        attributes = {'distance': distance}
+        for attr in EDGE_ATTRIBUTES:
+            if attr != 'distance':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    attributes[attr] = sums(member_distance * getattr(graph, attr)[self.members]) / distance
+
+        first_members = self.members[starts] if len(starts) else np.empty(0, dtype=np.int64)
+        self.graph = CompactGraph(
+            graph.lat[self.node_ids],
+            graph.lon[self.node_ids],
+            graph.node_country[self.node_ids],
+            self.reduced_ids[self.geometry[self.geometry_offsets[:-1]]],
+            self.reduced_ids[self.geometry[self.geometry_offsets[1:] - 1]],
+            graph.edge_country[first_members],
+            graph.countries,
+            **attributes
+            )
+
+        self.__edge_lookup = None
+        self.__engines = dict()
+        self.__cumulative = dict()
+
+    # endregion
+
+    # region Properties
+
+    @property
+    def nbytes(self) -> int:
+        """ approximate memory held by the reduced graph, the original graph and the engines built so far included """
+        arrays = [
+            self.node_ids, self.reduced_ids, self.geometry_offsets, self.geometry,
+            self.member_offsets, self.members, self.interior_edge, self.interior_position
+            ]
+        arrays += [array for cumulative in self.__cumulative.values() for array in cumulative]
+        # the edge lookup is built by the first expanded path, it is counted from the start
+        lookup = self.graph.number_of_edges * LOOKUP_ITEM_BYTES
+        engines = sum(engine.nbytes - engine.graph.nbytes for engine in self.__engines.values())
+        return self.original.nbytes + self.graph.nbytes + sum(array.nbytes for array in arrays) + lookup + engines
+
+    # endregion
+
+    # region PublicMethods
+
+    @staticmethod
+    def build(graph: CompactGraph) -> 'ReducedGraph':
+        """ walks chains between junctions, a junction is a node of degree other than 2 or a country border """
+
+        indptr, indices, edge_ids = graph.adjacency
+        indptr, indices, edge_ids = indptr.tolist(), indices.tolist(), edge_ids.tolist()
+        edge_country = graph.edge_country.tolist()
+
+        degree = np.diff(graph.adjacency[0])
+        junction = (degree != 2).tolist()
+        for node in np.flatnonzero(degree == 2).tolist():
+            first, second = edge_ids[indptr[node]], edge_ids[indptr[node] + 1]
+            if edge_country[first] != edge_country[second]:
+                junction[node] = True
+
+        visited = [False] * graph.number_of_edges
+
+        def walk(start: int, position: int) -> tuple[list[int], list[int]]:
+            nodes, edges = [start], []
+            while True:
+                edge = edge_ids[position]
+                visited[edge] = True
+                node = indices[position]
+                nodes.append(node)
+                edges.append(edge)
+                if junction[node]:
+                    return nodes, edges
+                position = indptr[node] if edge_ids[indptr[node]] != edge else indptr[node] + 1
+
+        chains = []
+        for start in [node for node, is_junction in enumerate(junction) if is_junction]:
+            for position in range(indptr[start], indptr[start + 1]):
+                if not visited[edge_ids[position]]:
+                    chains.append(walk(start, position))
+
+        # what is left are isolated cycles of degree-2 nodes
+        for edge in range(graph.number_of_edges):
+            if not visited[edge]:
+                start = int(graph.src[edge])
+                junction[start] = True
+                position = next(p for p in range(indptr[start], indptr[start + 1]) if edge_ids[p] == edge)
+                chains.append(walk(start, position))
+
+        # loops and parallel chains are split at their middle node, so a node path defines its edges,
+        # shortest chains claim their end pairs first
+        chains.sort(key=lambda chain: len(chain[1]), reverse=True)
+        result = []
+        pairs = set()
+        while chains:
+            nodes, edges = chains.pop()
+            key = (min(nodes[0], nodes[-1]), max(nodes[0], nodes[-1]))
+            if len(edges) == 1 or nodes[0] != nodes[-1] and key not in pairs:
+                pairs.add(key)
+                result.append((nodes, edges))
+            else:
+                middle = len(nodes) // 2
+                chains.append((nodes[:middle + 1], edges[:middle]))
+                chains.append((nodes[middle:], edges[middle:]))
+
+        result.sort(key=lambda chain: chain[1][0])
+        return ReducedGraph(graph, [nodes for nodes, _ in result], [edges for _, edges in result])
+
+    def edge_geometry(self, edge_id: int) -> np.ndarray:
+        """ original node ids along a reduced edge, src first """
+        return self.geometry[self.geometry_offsets[edge_id]:self.geometry_offsets[edge_id + 1]]
+
+    def expand(self, path: list[int]) -> list[int]:
+        """ original node ids along a path of reduced node ids """
+        if not path:
+            return []
+        lookup = self.__get_edge_lookup()
+        result = [int(self.node_ids[path[0]])]
+        for u, v in zip(path[:-1], path[1:]):
+            geometry = self.edge_geometry(lookup[(u, v) if u < v else (v, u)]).tolist()
+            if geometry[0] != result[-1]:
+                geometry.reverse()
+            result += geometry[1:]
+        return result
+
+    def get_engine(self, profile: str = DEFAULT_PROFILE) -> ShortestPathEngine:
+        """ engine over reduced edges weighted by the profile summed along the original edges """
+        if profile not in self.__engines:
+            self.__engines[profile] = ShortestPathEngine(self.graph, profile, self.__get_cumulative(profile)[2])
+        return self.__engines[profile]
+
+    def shortest_path(self, source: int, target: int, profile: str = DEFAULT_PROFILE, mode: str = DIJKSTRA) -> list[int]:
+        """ original node ids in and out, the search itself runs on the reduced graph """
+        engine = self.get_engine(profile)
+        sources, source_chain = self.__endpoints(source, profile)
+        targets, target_chain = self.__endpoints(target, profile)
+
+        # both ends inside the same chain may be connected along it directly
+        direct = None
+        direct_cost = math.inf
+        if source_chain is not None and source_chain == target_chain:
+            a, b = int(self.interior_position[source]), int(self.interior_position[target])
+            direct = self.__chain_part(source_chain, a, b)
+            direct_cost = self.__along(source_chain, a, b, profile)
+        elif source == target:
+            return [source]
+
+        try:
+            reduced_path = engine.search(sources, targets, mode)
+        except NetworkXNoPath:
+            if direct is None:
+                raise
+            return direct
+        if direct is not None and direct_cost <= engine.cost:
+            return direct
+
+        path = self.expand(reduced_path)
+        if source_chain is not None:
+            path = self.__chain_part(
+                source_chain, int(self.interior_position[source]), self.__position(source_chain, path[0])
+                )[:-1] + path
+        if target_chain is not None:
+            path = path + self.__chain_part(
+                target_chain, self.__position(target_chain, path[-1]), int(self.interior_position[target])
+                )[1:]
+        return path
+
+    # endregion
+
+    # region ServiceMethods
+
+    def __get_edge_lookup(self) -> dict:
+        if self.__edge_lookup is None:
+            src, dst = self.graph.src.tolist(), self.graph.dst.tolist()
+            self.__edge_lookup = {(u, v) if u < v else (v, u): e for e, (u, v) in enumerate(zip(src, dst))}
+        return self.__edge_lookup
+
+    def __get_cumulative(self, profile: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ finite weight and number of infinite weights from the src of chain e to its node i, and chain totals """
+        # both are kept at geometry_offsets[e] + i
+        if profile not in self.__cumulative:
+            member_weights = get_weights(self.original, profile)[self.members]
+            # an infinite weight would turn every later running sum into inf and their differences into nan
+            infinite = np.isinf(member_weights)
+            running = np.concatenate(([0.0], np.cumsum(np.where(infinite, 0.0, member_weights))))
+            running_infinite = np.concatenate(([0], np.cumsum(infinite)))
+            chain_ids = np.repeat(np.arange(self.graph.number_of_edges), np.diff(self.member_offsets))
+            positions = np.arange(len(self.members)) + chain_ids + 1
+            finite = np.zeros(len(self.geometry))
+            finite[positions] = running[1:] - running[self.member_offsets[chain_ids]]
+            infinite_count = np.zeros(len(self.geometry), dtype=np.int64)
+            infinite_count[positions] = running_infinite[1:] - running_infinite[self.member_offsets[chain_ids]]
+            ends = self.geometry_offsets[1:] - 1
+            totals = np.where(infinite_count[ends] > 0, np.inf, finite[ends])
+            self.__cumulative[profile] = (finite, infinite_count, totals)
+        return self.__cumulative[profile]
+
+    def __along(self, chain: int, a: int, b: int, profile: str) -> float:
+        """ profile weight along a chain between positions a and b """
+        finite, infinite_count, _ = self.__get_cumulative(profile)
+        start = self.geometry_offsets[chain]
+        a, b = start + min(a, b), start + max(a, b)
+        return math.inf if infinite_count[b] > infinite_count[a] else float(finite[b] - finite[a])
+
+    def __endpoints(self, node: int, profile: str) -> tuple[dict[int, float], int | None]:
+        chain = int(self.interior_edge[node])
+        if chain == NOT_INTERIOR:
+            return {int(self.reduced_ids[node]): 0.0}, None
+        position = int(self.interior_position[node])
+        last = int(self.geometry_offsets[chain + 1] - self.geometry_offsets[chain]) - 1
+        return {
+            int(self.graph.src[chain]): self.__along(chain, 0, position, profile),
+            int(self.graph.dst[chain]): self.__along(chain, position, last, profile)
+            }, chain
+
+    def __position(self, chain: int, node: int) -> int:
+        """ position of an end node of a chain """
+        start, end = self.geometry_offsets[chain], self.geometry_offsets[chain + 1]
+        return 0 if self.geometry[start] == node else int(end - start) - 1
+
+    def __chain_part(self, chain: int, a: int, b: int) -> list[int]:
+        """ original nodes of a chain from position a to position b """
+        geometry = self.edge_geometry(chain).tolist()
+        return geometry[a:b + 1] if a <= b else geometry[b:a + 1][::-1]
+
+    # endregion
+
+# endregion
@@ -0,0 +1,225 @@
+from logging.handlers import RotatingFileHandler, QueueListener
+from threading import Lock, Event, Thread
+from queue import SimpleQueue
+
+import multiprocessing
+import numpy as np
+import logging
+import atexit
+import json
+import os
+
+# region Constants
+
+COUNTRY_PATH = "country_path"
+CORRIDOR = "corridor"
+SEARCH = "search"
+RECONSTRUCTION = "reconstruction"
+TOTAL = "total"
+
+PHASES = (COUNTRY_PATH, CORRIDOR, SEARCH, RECONSTRUCTION, TOTAL)
+SETTLED = "settled"
+
+# log-spaced buckets, seconds for phases and node counts for settled
+TIME_RANGE = (1e-7, 1e3)
+SETTLED_RANGE = (1.0, 1e9)
+BUCKETS_PER_DECADE = 20
+
+PERCENTILES = (50, 90, 95, 99)
+
+MAX_FILE_BYTES = 16 * 1024 ** 2
+FILE_BACKUPS = 5
+
+# markers sent through the record pipe, a JSON record never equals them
+FLUSH = b"flush"
+CLOSE = b"close"
+
+# endregion
+
+# region Types
+
+class Histogram:
+    """ fixed log-spaced buckets, percentiles are read from the bucket a rank falls into """
+
+    # region Construction
+
+    def __init__(self, low: float, high: float, buckets_per_decade: int = BUCKETS_PER_DECADE):
+        decades = np.log10(high) - np.log10(low)
+        self.edges = np.logspace(np.log10(low), np.log10(high), int(round(decades * buckets_per_decade)) + 1)
+        # the first and last bucket take everything below low and above high
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    # endregion
+
+    # region PublicMethods
+
+    def record(self, value: float) -> None:
+        self.counts[np.searchsorted(self.edges, value, side='right')] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float | None:
+        """ upper edge of the bucket holding the q-th percentile, clamped to the observed range """
+        if self.count == 0:
+            return None
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.count))
+        upper = self.edges[bucket] if bucket < len(self.edges) else self.max
+        return float(min(max(upper, self.min), self.max))
+
+    def summary(self) -> dict:
+        if self.count == 0:
+            return {'count': 0}
+        return {
+            'count' : self.count,
+            'mean'  : self.total / self.count,
+            'min'   : float(self.min),
+            'max'   : float(self.max)
+            } | {f"p{q}": self.percentile(q) for q in PERCENTILES}
+
+    # endregion
+
+class RoutingMetrics:
+    """ per-phase routing timings kept as histograms, raw records go to a rotating JSON lines file from a writer thread,
+    forked processes send their records back to the process that made the metrics, which keeps both """
+
+    # region Construction
+
+    def __init__(self, path: str, max_bytes: int = MAX_FILE_BYTES, backups: int = FILE_BACKUPS):
+        # resolved now, the working directory may have changed by the time a record is written
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.owner = os.getpid()
+
+        self.histograms = dict()
+        self.__lock = Lock()
+        self.__flush_lock = Lock()
+        self.__flushed = Event()
+        self.__queue = SimpleQueue()
+        self.__listener = None
+
+        # made before any fork, so every forked worker, a restarted one too, writes into the same pipe
+        self.__reader, self.__writer = multiprocessing.Pipe(duplex=False)
+        self.__receiver = Thread(target=self.__receive, daemon=True)
+        self.__receiver.start()
+
+        self.reset()
+        atexit.register(self.close)
+
+    # endregion
+
+    # region PublicMethods
+
+    def record(self, **record) -> None:
+        """ phases missing from the record were not part of the query, like the country path of a same-country route """
+        if os.getpid() != self.owner:
+            # a pipe write of at most PIPE_BUF bytes is atomic, a record is far smaller, so writers need no shared lock
+            # and a killed worker leaves no partial record behind
+            self.__writer.send_bytes(json.dumps(record).encode())
+            return
+        self.__add(record)
+
+    def flush(self) -> None:
+        """ waits until every record sent so far, forked processes' included, is in the histograms and the file """
+        if os.getpid() != self.owner:
+            return
+        with self.__flush_lock:
+            if not self.__receiver.is_alive():
+                return
+            # the marker comes after every record already in the pipe
+            self.__flushed.clear()
+            self.__writer.send_bytes(FLUSH)
+            self.__flushed.wait()
+            with self.__lock:
+                if self.__listener is not None:
+                    self.__listener.stop()
+                    self.__listener.start()
+
+    def summary(self) -> dict:
+        with self.__lock:
+            return {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.histograms = {phase: Histogram(*TIME_RANGE) for phase in PHASES}
+            self.histograms[SETTLED] = Histogram(*SETTLED_RANGE)
+
+    def close(self) -> None:
+        if os.getpid() != self.owner:
+            return
+        with self.__flush_lock:
+            if self.__receiver.is_alive():
+                self.__writer.send_bytes(CLOSE)
+                self.__receiver.join()
+        with self.__lock:
+            if self.__listener is not None:
+                self.__listener.stop()
+                for handler in self.__listener.handlers:
+                    handler.close()
+            self.__listener = None
+
+    # endregion
+
+    # region ServiceMethods
+
+    def __add(self, record: dict) -> None:
+        with self.__lock:
+            for phase in PHASES:
+                if record.get(phase) is not None:
+                    self.histograms[phase].record(record[phase])
+            if record.get(SETTLED) is not None:
+                self.histograms[SETTLED].record(record[SETTLED])
+            # handed to the writer thread at once, nothing is left in memory when the process ends abruptly
+            self.__get_queue().put(logging.makeLogRecord({'msg': json.dumps(record)}))
+
+    def __get_queue(self) -> SimpleQueue:
+        # the file is only made once there is something to write
+        if self.__listener is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.__listener = QueueListener(
+                self.__queue, RotatingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=self.backups)
+                )
+            self.__listener.start()
+        return self.__queue
+
+    def __receive(self) -> None:
+        # runs in the owner only, a forked process does not inherit the thread
+        while True:
+            try:
+                message = self.__reader.recv_bytes()
+            except (EOFError, OSError):
+                return
+            if message == FLUSH:
+                self.__flushed.set()
+            elif message == CLOSE:
+                return
+            else:
+                self.__add(json.loads(message))
+
+    # endregion
+
+# endregion
+
+# region Functions
+
+def summary(times: list[float]) -> dict:
+    """ count, mean and spread of raw samples, e.g. latencies kept in full """
+    if not times:
+        return {'count': 0}
+    times = np.asarray(times)
+    return {
+        'count'  : len(times),
+        'mean'   : float(times.mean()),
+        'median' : float(np.median(times)),
+        'p95'    : float(np.percentile(times, 95)),
+        'min'    : float(times.min()),
+        'max'    : float(times.max())
+        }
+
+# endregion
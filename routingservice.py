@@ -0,0 +1,318 @@
+from railwaynet import RailwayNetManager, CONTRACTION_HIERARCHY, default_setup
+from pathfinding import SEARCH_MODES, DEFAULT_PROFILE, DIJKSTRA, WEIGHT_CALLBACKS
+from batchroute import BatchRouter
+from routingmetrics import summary
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+from time import perf_counter
+from http import HTTPStatus
+
+import numpy as np
+import multiprocessing
+import argparse
+import asyncio
+import json
+import math
+import os
+
+# region Constants
+
+HOST = "127.0.0.1"
+PORT = 8080
+
+# a batch is sent to a worker once it is full or its first request waited this long
+BATCH_SIZE = 32
+BATCH_WINDOW = 0.005
+
+# latencies of this many latest requests per endpoint are summarized
+LATENCY_WINDOW = 10000
+
+MAX_BODY = 16 * 1024 ** 2
+
+ROUTE = "route"
+SNAP = "snap"
+MATRIX = "matrix"
+
+# endregion
+
+# region Types
+
+class RoutingService:
+    """ HTTP/JSON routing over one warm manager, concurrent requests are micro-batched onto a worker pool """
+
+    # region Construction
+
+    def __init__(
+            self,
+            manager: RailwayNetManager,
+            workers: int = None,
+            batch_size: int = BATCH_SIZE,
+            batch_window: float = BATCH_WINDOW
+        ):
+        self.manager = manager
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+
+        # forked workers inherit the warm manager, a thread fallback has to share one manager and so runs alone,
+        # it is warmed for every profile first, so the workers neither load nor save the shared parts themselves,
+        # nor build the weight matrix of every matrix request again
+        self.manager.warm(tuple(WEIGHT_CALLBACKS), matrices=True)
+        if 'fork' in multiprocessing.get_all_start_methods():
+            self.workers = workers or os.cpu_count()
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=_init_service_worker,
+                initargs=(manager, )
+                )
+        else:
+            self.workers = 1
+            self.executor = ThreadPoolExecutor(max_workers=1, initializer=_init_service_worker, initargs=(manager, ))
+        list(self.executor.map(_ping, range(self.workers)))
+
+        self.queue = None
+        self.in_flight = 0
+        self.started = None
+        self.latencies = {endpoint: deque(maxlen=LATENCY_WINDOW) for endpoint in (ROUTE, SNAP, MATRIX)}
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+
+    # endregion
+
+    # region PublicMethods
+
+    def run(self, host: str = HOST, port: int = PORT) -> None:
+        try:
+            asyncio.run(self.serve(host, port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def serve(self, host: str = HOST, port: int = PORT) -> None:
+        self.queue = asyncio.Queue()
+        self.started = perf_counter()
+        batcher = asyncio.create_task(self.__batch())
+        server = await asyncio.start_server(self.__handle, host, port)
+        print(f"Serving on http://{host}:{port} with {self.workers} workers")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+    async def submit(self, kind: str, payload: dict) -> tuple[HTTPStatus, dict]:
+        """ status and result of one request, it waits in the queue until its batch runs """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((kind, payload, future))
+        return await future
+
+    def health(self) -> dict:
+        return {
+            'status'    : "ok",
+            'uptime'    : perf_counter() - self.started,
+            'nodes'     : self.manager.full_compact.number_of_nodes,
+            'edges'     : self.manager.full_compact.number_of_edges,
+            'workers'   : self.workers,
+            'queued'    : self.queue.qsize(),
+            'in_flight' : self.in_flight
+            }
+
+    def latency(self) -> dict:
+        return {endpoint: summary(list(times)) for endpoint, times in self.latencies.items()} | {
+            'batch_size': summary(list(self.batch_sizes))
+            }
+
+    # endregion
+
+    # region ServiceMethods
+
+    async def __batch(self) -> None:
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.workers)
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+
+            # at most one batch per worker, the rest keep collecting in the queue meanwhile
+            await slots.acquire()
+            self.batch_sizes.append(len(batch))
+            asyncio.create_task(self.__run_batch(batch, slots))
+
+    async def __run_batch(self, batch: list, slots: asyncio.Semaphore) -> None:
+        self.in_flight += len(batch)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _serve_batch, [(kind, payload) for kind, payload, _ in batch]
+                )
+        except Exception as error:
+            results = [(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(error).__name__}: {error}"})] * len(batch)
+        finally:
+            self.in_flight -= len(batch)
+            slots.release()
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # HTTP/1.1 with keep-alive, one request at a time per connection
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = dict()
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    await self.__respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "Body is too large"})
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, response = await self.__dispatch(method, path.split('?')[0], body)
+                await self.__respond(writer, status, response)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def __dispatch(self, method: str, path: str, body: bytes) -> tuple[HTTPStatus, dict]:
+        endpoint = path.strip('/')
+        if method == 'GET' and endpoint == 'health':
+            return HTTPStatus.OK, self.health()
+        if method == 'GET' and endpoint == 'latency':
+            return HTTPStatus.OK, self.latency()
+        if endpoint not in self.latencies:
+            return HTTPStatus.NOT_FOUND, {'error': f"Unknown endpoint '{path}'"}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': "Use POST with a JSON body"}
+
+        try:
+            payload = json.loads(body or b'{}')
+        except json.JSONDecodeError as error:
+            return HTTPStatus.BAD_REQUEST, {'error': f"Invalid JSON: {error}"}
+        if not isinstance(payload, dict):
+            return HTTPStatus.BAD_REQUEST, {'error': "Body must be a JSON object"}
+
+        start = perf_counter()
+        status, result = await self.submit(endpoint, payload)
+        self.latencies[endpoint].append(perf_counter() - start)
+        return status, result
+
+    @staticmethod
+    async def __respond(writer: asyncio.StreamWriter, status: HTTPStatus, response: dict) -> None:
+        body = json.dumps(response).encode()
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+        await writer.drain()
+
+    # endregion
+
+# endregion
+
+# region Functions
+
+_service_router = None
+
+def _init_service_worker(manager: RailwayNetManager) -> None:
+    global _service_router
+    _service_router = BatchRouter(manager)
+
+def _ping(_) -> None:
+    pass
+
+def _serve_batch(batch: list[tuple[str, dict]]) -> list[tuple[HTTPStatus, dict]]:
+    # a failing request only fails itself, a bad payload is the client's error, anything else is ours
+    results = []
+    for kind, payload in batch:
+        try:
+            results.append((HTTPStatus.OK, _SERVE[kind](payload)))
+        except (KeyError, TypeError, ValueError) as error:
+            results.append((HTTPStatus.BAD_REQUEST, {'error': f"{type(error).__name__}: {error}"}))
+        except Exception as error:
+            results.append((HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(error).__name__}: {error}"}))
+    return results
+
+def _serve_route(payload: dict) -> dict:
+    _service_router.profile = _get_profile(payload)
+    _service_router.mode = payload.get('mode', DIJKSTRA)
+    if _service_router.mode not in SEARCH_MODES + (CONTRACTION_HIERARCHY, ):
+        raise ValueError(f"Unknown mode '{_service_router.mode}'")
+    result = _service_router.route_row(payload, with_paths=bool(payload.get('paths', False)))
+    result['id'] = payload.get('id')
+    return result
+
+def _serve_snap(payload: dict) -> dict:
+    iso3 = payload.get('iso3')
+    if iso3 is not None and iso3 not in _service_router.manager.countries_sorted:
+        raise ValueError(f"Unknown country '{iso3}'")
+    k = int(payload.get('k', 1))
+    if k < 1:
+        raise ValueError(f"k must be positive, got {k}")
+    points = _service_router.manager.snap(float(payload['lat']), float(payload['lon']), iso3=iso3, k=k)
+    return {'nodes': [point.coord_reverse for point in points]}
+
+def _serve_matrix(payload: dict) -> dict:
+    # the ends are snapped like route ends, the matrix itself runs in this worker only
+    profile = _get_profile(payload)
+    ends = []
+    for key in ('origins', 'destinations'):
+        nodes = [_service_router.snap(float(lat), float(lon)) for lat, lon in payload[key]]
+        if any(node is None for node in nodes):
+            raise ValueError(f"Some {key} have no rail node nearby")
+        ends.append([node.node for node in nodes])
+
+    with_paths = bool(payload.get('paths', False))
+    costs, paths = _service_router.manager.route_matrix(
+        ends[0], ends[1], profile, with_paths=with_paths, workers=1
+        )
+    result = {
+        'origins'      : [node.coord_reverse for node in ends[0]],
+        'destinations' : [node.coord_reverse for node in ends[1]],
+        'costs'        : [[None if math.isinf(cost) else cost for cost in row] for row in np.asarray(costs).tolist()]
+        }
+    if with_paths:
+        result['paths'] = [[None if path is None else [point.coord_reverse for point in path] for path in row] for row in paths]
+    return result
+
+def _get_profile(payload: dict) -> str:
+    profile = payload.get('profile', DEFAULT_PROFILE)
+    if profile not in WEIGHT_CALLBACKS:
+        raise ValueError(f"Unknown profile '{profile}'")
+    return profile
+
+_SERVE = {ROUTE: _serve_route, SNAP: _serve_snap, MATRIX: _serve_matrix}
+
+# endregion
+
+# region Main
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve routing over HTTP/JSON on localhost")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--data", default="./data/trains.csv")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW, help="seconds")
+    args = parser.parse_args()
+
+    manager, _ = default_setup(args.data)
+    RoutingService(manager, args.workers, args.batch_size, args.batch_window).run(args.host, args.port)
+
+# endregion
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+from railwaynet import RailwayNetManager, PathEdgePoint
+from pathfinding import DEFAULT_PROFILE, DIJKSTRA
+from multiprocessing.connection import Connection
+from threading import Lock, Thread
+from itertools import count
+
+import multiprocessing
+import pygame as pg
+
+# region Types
+
+class RoutingWorker:
+    """ one long-lived routing process fed through a pipe, results come back as pygame events of event_type """
+
+    # region Construction
+
+    def __init__(self, manager: RailwayNetManager, event_type: int = None):
+        self.manager = manager
+        self.event_type = pg.event.custom_type() if event_type is None else event_type
+
+        # a forked process inherits the warm manager instead of unpickling or rebuilding it,
+        # it is warmed first, so neither the first nor a restarted process loads the shared parts again,
+        # without fork the searches run in a thread and a running one can not be stopped
+        self.manager.warm()
+        self.forked = 'fork' in multiprocessing.get_all_start_methods()
+
+        self.requests = count(1)
+        self.latest = 0
+        # request sent to the worker and not answered yet
+        self.pending = None
+        self.__lock = Lock()
+        self.__process = None
+        self.__connection = None
+
+        # forks now, before the caller opens a display
+        self.__start()
+
+    # endregion
+
+    # region PublicMethods
+
+    def submit(
+            self,
+            start_node: PathEdgePoint,
+            finish_node: PathEdgePoint,
+            profile: str = DEFAULT_PROFILE,
+            mode: str = DIJKSTRA
+        ) -> int:
+        """ sends a search and cancels the previous one, returns the request id the result event carries """
+        with self.__lock:
+            self.__cancel()
+            request = next(self.requests)
+            self.latest = request
+            self.pending = request
+            self.__connection.send((request, (start_node, finish_node, profile, mode)))
+        return request
+
+    def cancel(self) -> None:
+        """ drops the search in progress, its result is never posted """
+        with self.__lock:
+            self.__cancel()
+
+    def close(self) -> None:
+        with self.__lock:
+            self.latest = 0
+            self.__stop()
+            self.pending = None
+
+    # endregion
+
+    # region ServiceMethods
+
+    def __start(self) -> None:
+        self.__connection, child = multiprocessing.Pipe()
+        if self.forked:
+            self.__process = multiprocessing.get_context('fork').Process(
+                target=_serve, args=(child, self.manager), daemon=True
+                )
+            self.__process.start()
+            child.close()
+        else:
+            Thread(target=_serve, args=(child, self.manager), daemon=True).start()
+        Thread(target=self.__receive, args=(self.__connection, ), daemon=True).start()
+
+    def __stop(self) -> None:
+        # a search can not be interrupted, a process running one is killed, an idle one or a thread finishes its loop
+        if self.__process is not None and self.pending is not None:
+            self.__process.kill()
+        else:
+            self.__connection.send(None)
+        if self.__process is not None:
+            self.__process.join()
+
+    def __cancel(self) -> None:
+        self.latest = 0
+        # the next search would wait for the running one, so the process is replaced by a fresh fork
+        if self.__process is not None and self.pending is not None:
+            self.__stop()
+            self.__start()
+        self.pending = None
+
+    def __receive(self, connection: Connection) -> None:
+        # the pipe ends once its worker is stopped or killed
+        while True:
+            try:
+                request, paths, settled, error = connection.recv()
+            except (EOFError, OSError):
+                connection.close()
+                return
+            with self.__lock:
+                if request == self.pending:
+                    self.pending = None
+                if request != self.latest:
+                    continue
+            # pygame.event.post is thread safe
+            pg.event.post(pg.event.Event(self.event_type, request=request, paths=paths, settled=settled, error=error))
+
+    # endregion
+
+# endregion
+
+# region Functions
+
+def _serve(connection: Connection, manager: RailwayNetManager) -> None:
+    try:
+        while (message := connection.recv()) is not None:
+            request, task = message
+            try:
+                paths, settled = _route(manager, task)
+                error = None
+            except Exception as exception:
+                paths, settled, error = None, None, exception
+            connection.send((request, paths, settled, error))
+    except EOFError:
+        pass
+    finally:
+        connection.close()
+
+def _route(manager: RailwayNetManager, task: tuple) -> tuple[list, int | None]:
+    start_node, finish_node, profile, mode = task
+    manager.start_node = start_node
+    manager.finish_node = finish_node
+    paths = [None, None]
+    manager.find_path(paths, profile=profile, mode=mode)
+    return paths, manager.settled
+
+# endregion
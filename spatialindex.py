@@ -0,0 +1,85 @@
+from scipy.spatial import cKDTree
+from geopy import distance
+
+import numpy as np
+import pickle
+import os
+
+# region Types
+
+class SpatialIndex:
+    """ kd-tree over nodes placed on the unit sphere, chord length grows with great-circle distance """
+
+    # region Construction
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, node_ids: np.ndarray = None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        # index position i refers to graph node node_ids[i]
+        self.node_ids = np.arange(len(self.lat)) if node_ids is None else np.asarray(node_ids, dtype=np.int64)
+        self.tree = cKDTree(to_unit_sphere(self.lat, self.lon))
+
+    # endregion
+
+    # region PublicMethods
+
+    def restrict(self, node_ids: np.ndarray) -> 'SpatialIndex':
+        """ index over a subset of graph node ids """
+        positions = np.flatnonzero(np.isin(self.node_ids, node_ids))
+        return SpatialIndex(self.lat[positions], self.lon[positions], self.node_ids[positions])
+
+    def lookup(self, lat: float, lon: float) -> int | None:
+        """ graph node with exactly these coordinates """
+        if len(self.node_ids) == 0:
+            return None
+        _, position = self.tree.query(to_unit_sphere(lat, lon))
+        if self.lat[position] == lat and self.lon[position] == lon:
+            return int(self.node_ids[position])
+        return None
+
+    def nearest(self, lat, lon, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """ ids of and great-circle distances in km to the k nearest nodes of every query point """
+        k = min(k, len(self.node_ids))
+        if k == 0:
+            return np.empty((np.size(lat), 0), dtype=np.int64), np.empty((np.size(lat), 0))
+        chords, positions = self.tree.query(to_unit_sphere(lat, lon).reshape(-1, 3), k=k)
+        chords, positions = chords.reshape(-1, k), positions.reshape(-1, k)
+        return self.node_ids[positions], chord2km(chords)
+
+    def within(self, lat: float, lon: float, radius: float) -> np.ndarray:
+        """ ids of nodes closer than radius km, nearest first """
+        point = to_unit_sphere(lat, lon)
+        positions = np.array(self.tree.query_ball_point(point, km2chord(radius)), dtype=np.int64)
+        order = np.argsort(np.linalg.norm(self.tree.data[positions] - point, axis=1))
+        return self.node_ids[positions[order]]
+
+    def save(self, path: str) -> None:
+        # forked workers may save at once, each writes its own file and swaps it in whole
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as f:
+            pickle.dump(self, f)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load(path: str) -> 'SpatialIndex':
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    # endregion
+
+# endregion
+
+# region Functions
+
+def to_unit_sphere(lat, lon) -> np.ndarray:
+    phi = np.radians(np.asarray(lat, dtype=np.float64))
+    lam = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.stack((np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)), axis=-1)
+
+def chord2km(chord):
+    return 2 * distance.EARTH_RADIUS * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+def km2chord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km) / (2 * distance.EARTH_RADIUS), np.pi / 2))
+
+# endregion
@@ -0,0 +1,124 @@
+from numpy.random import default_rng
+
+import pandas as pd
+import numpy as np
+import argparse
+
+# region Constants
+
+# trails run over a lattice, so trails meeting at a vertex share the node exactly
+GRID_DEGREES = 0.02
+
+TRAILS_PER_COUNTRY = 400
+MIN_TRAIL_POINTS = 2
+MAX_TRAIL_POINTS = 40
+TURN_PROBABILITY = 0.2
+# share of trails branching off an existing vertex instead of starting somewhere new
+BRANCH_PROBABILITY = 0.7
+SPREAD_DEGREES = 1.5
+# border lines from every capital to its nearest other capitals
+BORDER_LINES = 3
+
+DIRECTIONS = np.array([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)], dtype=np.int64)
+
+# scale name -> (number of countries, None for all of them, and trails multiplier)
+SCALES = {
+    "country" : (1, 1.0),
+    "region"  : (8, 1.0),
+    "world"   : (None, 1.0),
+    "world10" : (None, 10.0),
+}
+
+# endregion
+
+# region Functions
+
+def generate_trains(countries_data: pd.DataFrame, scale: str = "world", seed: int = 0) -> pd.DataFrame:
+    """ trains.csv shaped WKT trails around the capitals of countries_data, same seed gives the same table """
+    if scale not in SCALES:
+        raise ValueError(f"Unknown scale '{scale}', expected one of {list(SCALES)}")
+    countries_number, multiplier = SCALES[scale]
+
+    rng = default_rng(seed)
+    countries = countries_data.drop_duplicates('iso3').reset_index(drop=True)
+    capitals = np.stack((countries.CapitalLatitude.to_numpy(float), countries.CapitalLongitude.to_numpy(float)), axis=1)
+
+    # the first country and its nearest neighbours, so smaller scales stay connected
+    if countries_number is not None:
+        nearest = np.argsort(np.hypot(*(capitals - capitals[0]).T))[:countries_number]
+        countries = countries.iloc[nearest].reset_index(drop=True)
+        capitals = capitals[nearest]
+    lattice_capitals = np.round(capitals / GRID_DEGREES).astype(np.int64)
+
+    iso3s = []
+    shapes = []
+    for iso3, capital in zip(countries.iso3.tolist(), lattice_capitals):
+        country_shapes = country_trails(rng, capital, int(TRAILS_PER_COUNTRY * multiplier))
+        iso3s += [iso3] * len(country_shapes)
+        shapes += country_shapes
+
+    pairs = set()
+    for i, capital in enumerate(lattice_capitals):
+        for j in np.argsort(np.hypot(*(lattice_capitals - capital).T))[1:BORDER_LINES + 1].tolist():
+            pairs.add((min(i, j), max(i, j)))
+    for i, j in sorted(pairs):
+        # each half belongs to its own country, they meet at the middle vertex
+        line = straight_line(lattice_capitals[i], lattice_capitals[j])
+        middle = len(line) // 2
+        iso3s += [countries.iso3[i], countries.iso3[j]]
+        shapes += [to_wkt(line[:middle + 1]), to_wkt(line[middle:])]
+
+    return pd.DataFrame({'iso3': iso3s, 'shape': shapes})
+
+def country_trails(rng: np.random.Generator, capital: np.ndarray, trails: int) -> list[str]:
+    """ random walks on the lattice, most of them branching off earlier ones """
+    spread = SPREAD_DEGREES / GRID_DEGREES
+    vertices = [capital]
+    shapes = []
+    for _ in range(trails):
+        if rng.random() < BRANCH_PROBABILITY:
+            start = vertices[rng.integers(len(vertices))]
+        else:
+            start = capital + np.round(rng.normal(0, spread, 2)).astype(np.int64)
+
+        # keep going the same way until a turn
+        steps_number = int(rng.integers(MIN_TRAIL_POINTS, MAX_TRAIL_POINTS + 1)) - 1
+        directions = DIRECTIONS[rng.integers(len(DIRECTIONS), size=steps_number)]
+        turns = rng.random(steps_number) < TURN_PROBABILITY
+        turns[0] = True
+        last_turn = np.maximum.accumulate(np.where(turns, np.arange(steps_number), 0))
+        walk = start + np.concatenate(([(0, 0)], np.cumsum(directions[last_turn], axis=0)))
+
+        vertices += list(walk[1:])
+        shapes.append(to_wkt(walk))
+    return shapes
+
+def straight_line(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    steps_number = max(int(np.abs(b - a).max()), 1)
+    return np.round(a + (b - a) * np.linspace(0, 1, steps_number + 1)[:, None]).astype(np.int64)
+
+def to_wkt(walk: np.ndarray) -> str:
+    """ lattice (lat, lon) indices to a WKT multilinestring of lon lat pairs """
+    return "MULTILINESTRING ((" + ", ".join(f"{lon * GRID_DEGREES:.4f} {lat * GRID_DEGREES:.4f}" for lat, lon in walk.tolist()) + "))"
+
+# endregion
+
+# region Main
+
+def main() -> None:
+    from railwaynet import read_countries_data
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic trains.csv")
+    parser.add_argument("--scale", choices=list(SCALES), default="world")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="./data/trains.csv")
+    args = parser.parse_args()
+
+    trains = generate_trains(read_countries_data(), args.scale, args.seed)
+    trains.to_csv(args.output, index=False)
+    print(f"{len(trains)} trails written to '{args.output}'")
+
+# endregion
+
+if __name__ == "__main__":
+    main()
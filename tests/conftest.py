@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# capitals close enough for the synthetic trails of neighbours to cross and share edges
+COUNTRIES = pd.DataFrame({
+    'iso3'              : ['FRA', 'DEU', 'BEL', 'NLD', 'LUX', 'CHE'],
+    'MaximumTrainSpeed' : [320, 300, 300, 300, 160, 250],
+    'CapitalLatitude'   : [48.85, 52.52, 50.85, 52.37, 49.61, 46.95],
+    'CapitalLongitude'  : [2.35, 13.40, 4.35, 4.89, 6.13, 7.45],
+    })
+
+SEED = 0
+
+@pytest.fixture(scope="session")
+def countries_data() -> pd.DataFrame:
+    return COUNTRIES.copy()
+
+@pytest.fixture(scope="session")
+def graph_data(countries_data) -> pd.DataFrame:
+    from synthetic import generate_trains
+    return generate_trains(countries_data, "world", SEED)
+
+@pytest.fixture(scope="session")
+def workdir(tmp_path_factory):
+    """ the manager keeps its caches under ./cached, so the session runs in a scratch directory """
+    root = os.getcwd()
+    path = tmp_path_factory.mktemp("workdir")
+    os.makedirs(path / "cached")
+    os.chdir(path)
+    yield path
+    os.chdir(root)
+
+@pytest.fixture(scope="session")
+def manager(workdir, graph_data, countries_data):
+    from railwaynet import RailwayNetManager
+    return RailwayNetManager(graph_data, countries_data, seed=SEED, workers=1)
+
+@pytest.fixture(scope="session")
+def country_ends(manager):
+    """ two ends of the biggest component of a country net, connected inside the country """
+    from railwaynet import PathEdgePoint
+
+    def ends(iso3: str) -> tuple:
+        graph = manager.compact_nets[iso3]
+        node_ids = graph.biggest_component_ids()
+        return PathEdgePoint(graph.point(node_ids[0]), iso3), PathEdgePoint(graph.point(node_ids[-1]), iso3)
+
+    return ends
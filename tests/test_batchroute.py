@@ -0,0 +1,43 @@
+from batchroute import BatchRouter, OK, INVALID, NO_NODE
+from railwaynet import CONTRACTION_HIERARCHY
+from pathfinding import DEFAULT_PROFILE, DIJKSTRA
+
+import pytest
+
+def row(start, finish, **extra) -> dict:
+    return {
+        'frm_lat': start.node.lat, 'frm_lon': start.node.lon,
+        'to_lat': finish.node.lat, 'to_lon': finish.node.lon,
+        **extra
+        }
+
+@pytest.fixture(scope="module")
+def ch_router(manager):
+    return BatchRouter(manager, DEFAULT_PROFILE, CONTRACTION_HIERARCHY)
+
+def test_cached_hierarchy_is_not_rebuilt(manager, ch_router, monkeypatch):
+    # dropped from memory, the saved hierarchy is loaded from disk instead
+    manager.hierarchies.pop(DEFAULT_PROFILE)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("hierarchy rebuilt")
+
+    monkeypatch.setattr(manager, "prepare_hierarchies", fail)
+    BatchRouter(manager, DEFAULT_PROFILE, CONTRACTION_HIERARCHY)
+    assert manager.hierarchies[DEFAULT_PROFILE] is not None
+
+def test_same_country_row_agrees_across_modes(manager, ch_router, country_ends):
+    start, finish = country_ends('FRA')
+    results = [
+        router.route_row(row(start, finish, frm_iso3='FRA', to_iso3='FRA'))
+        for router in (BatchRouter(manager, DEFAULT_PROFILE, DIJKSTRA), ch_router)
+        ]
+    assert [result['status'] for result in results] == [OK, OK]
+    assert results[0]['distance'] == pytest.approx(results[1]['distance'])
+
+def test_invalid_rows(manager):
+    router = BatchRouter(manager)
+    results = list(router.route([{'frm_lat': "x"}, {'frm_lat': 0, 'frm_lon': 0, 'to_lat': 0, 'to_lon': 0, 'to_iso3': "ZZZ"}]))
+    assert [result['status'] for result in results] == [INVALID, NO_NODE]
+    assert [result['id'] for result in results] == [0, 1]
+    assert router.counts[INVALID] == 1 and router.counts[NO_NODE] == 1
@@ -0,0 +1,56 @@
+from compactgraph import CompactGraph, NO_COUNTRY
+from geograph import Point
+
+import numpy as np
+import pytest
+
+def graph(lat, lon, edges, iso3: str, distance=None) -> CompactGraph:
+    src, dst = np.array(edges, dtype=np.int64).reshape(-1, 2).T
+    return CompactGraph(
+        lat, lon, np.zeros(len(lat)), src, dst, np.zeros(len(src)), [iso3],
+        distance=np.ones(len(src)) if distance is None else distance
+        )
+
+@pytest.fixture
+def path_and_island():
+    # 0 - 1 - 2 and an island 3 - 4
+    return graph([0.0, 0.0, 0.0, 5.0, 5.0], [0.0, 1.0, 2.0, 0.0, 1.0], [(0, 1), (1, 2), (3, 4)], 'AAA')
+
+def test_lookup_and_points(path_and_island):
+    g = path_and_island
+    assert g.node_id(Point(0.0, 2.0)) == 2
+    assert g.node_id(Point(1.0, 1.0)) is None
+    assert g.node_ids([5.0, 9.0, 0.0], [1.0, 9.0, 0.0]).tolist() == [4, -1, 0]
+    assert g.points([3]) == [Point(5.0, 0.0)]
+
+def test_adjacency_and_components(path_and_island):
+    g = path_and_island
+    assert sorted(g.neighbours(1).tolist()) == [0, 2]
+    assert g.connected(0, 2) and not g.connected(0, 3)
+    assert g.biggest_component_ids().tolist() == [0, 1, 2]
+    assert sorted(g.component_sizes().tolist()) == [2, 3]
+
+def test_subgraph_renumbers_in_order(path_and_island):
+    sub = path_and_island.subgraph(np.array([2, 1, 3]))
+    assert sub.points() == [Point(0.0, 2.0), Point(0.0, 1.0), Point(5.0, 0.0)]
+    assert list(zip(sub.src.tolist(), sub.dst.tolist())) == [(1, 0)]
+
+def test_compose_matches_shared_nodes_and_edges():
+    a = graph([0.0, 0.0, 0.0], [0.0, 1.0, 2.0], [(0, 1), (1, 2)], 'AAA', distance=np.array([1.0, 1.0]))
+    # shares node (0, 2) and edge (0, 1)-(0, 2) with a, laid in the opposite direction
+    b = graph([0.0, 0.0, 1.0], [2.0, 1.0, 2.0], [(0, 1), (0, 2)], 'BBB', distance=np.array([5.0, 3.0]))
+    composed = CompactGraph.compose([a, b])
+    assert composed.number_of_nodes == 4
+    assert composed.number_of_edges == 3
+    assert composed.countries == ['AAA', 'BBB']
+    # attributes and countries of the later graph win
+    shared = composed.node_ids([0.0, 0.0], [1.0, 2.0])
+    edge = [e for e, (u, v) in enumerate(zip(composed.src.tolist(), composed.dst.tolist())) if {u, v} == set(shared.tolist())]
+    assert composed.edge_attributes(edge[0]) == {'distance': 5.0, 'iso3': 'BBB'}
+    assert composed.country(composed.node_country[shared[1]]) == 'BBB'
+    assert composed.country(NO_COUNTRY) is None
+
+def test_compose_of_nothing_is_empty():
+    empty = CompactGraph.compose([])
+    assert empty.number_of_nodes == 0 and empty.number_of_edges == 0
+    assert empty.node_id(Point(0.0, 0.0)) is None
@@ -0,0 +1,64 @@
+from contractionhierarchy import ContractionHierarchy, build_hierarchies, hierarchy_signature
+from pathfinding import ShortestPathEngine, DEFAULT_PROFILE
+from networkx import NetworkXNoPath
+
+import multiprocessing
+import numpy as np
+import pytest
+
+QUERIES = 30
+
+@pytest.fixture(scope="module")
+def compact(manager):
+    return manager.compact_nets['LUX']
+
+@pytest.fixture(scope="module")
+def hierarchy(compact):
+    return ContractionHierarchy.build(compact, DEFAULT_PROFILE, compact.biggest_component_ids())
+
+def test_costs_match_dijkstra(compact, hierarchy):
+    engine = ShortestPathEngine(compact, DEFAULT_PROFILE)
+    rng = np.random.default_rng(0)
+    node_ids = compact.biggest_component_ids()
+    for source, target in (rng.choice(node_ids, 2).tolist() for _ in range(QUERIES)):
+        path = hierarchy.shortest_path(source, target)
+        engine.shortest_path(source, target)
+        # the unpacked path runs over original edges only
+        assert path[0] == source and path[-1] == target
+        assert engine.path_length(path) == pytest.approx(engine.cost)
+
+def test_nodes_outside_the_component_are_rejected(compact, hierarchy):
+    labels = compact.component_labels()
+    biggest = compact.biggest_component_ids()
+    outside = int(np.flatnonzero(labels != labels[biggest[0]])[0])
+    with pytest.raises(NetworkXNoPath):
+        hierarchy.shortest_path(int(biggest[0]), outside)
+
+def test_save_and_load(compact, hierarchy, tmp_path):
+    path = str(tmp_path / "hierarchy.npz")
+    hierarchy.save(path)
+    loaded = ContractionHierarchy.load(path)
+    assert loaded.profile == hierarchy.profile
+    assert loaded.signature == hierarchy.signature
+    node_ids = compact.biggest_component_ids()
+    assert loaded.shortest_path(int(node_ids[0]), int(node_ids[-1])) == hierarchy.shortest_path(int(node_ids[0]), int(node_ids[-1]))
+
+def test_signature_follows_the_weights(compact, hierarchy):
+    node_ids = compact.biggest_component_ids()
+    assert hierarchy.signature == hierarchy_signature(compact, DEFAULT_PROFILE, node_ids)
+    assert hierarchy.signature != hierarchy_signature(compact, "distance", node_ids)
+    assert hierarchy.signature != hierarchy_signature(compact, DEFAULT_PROFILE, node_ids[:-1])
+
+def test_profiles_are_built_separately(compact):
+    node_ids = compact.biggest_component_ids()[:500]
+    hierarchies = build_hierarchies(compact, [DEFAULT_PROFILE, "distance"], node_ids, workers=1)
+    assert {profile: hierarchy.profile for profile, hierarchy in hierarchies.items()} == {
+        DEFAULT_PROFILE: DEFAULT_PROFILE, "distance": "distance"
+        }
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_workers_build_the_same_hierarchy(compact, hierarchy):
+    # rounds are chosen by the caller, the worker processes only search, so the result does not depend on their number
+    built = ContractionHierarchy.build(compact, DEFAULT_PROFILE, compact.biggest_component_ids(), workers=3)
+    for name in ('rank', 'indptr', 'indices', 'weights', 'middles'):
+        np.testing.assert_array_equal(getattr(built, name), getattr(hierarchy, name))
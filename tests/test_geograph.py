@@ -0,0 +1,34 @@
+from geograph import distances, HAVERSINE, GEODESIC
+from geopy import distance
+
+import numpy as np
+import pytest
+
+@pytest.fixture(scope="module")
+def pairs():
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(-80, 80, (2, 200))
+    lon = rng.uniform(-180, 180, (2, 200))
+    return lat[0], lon[0], lat[1], lon[1]
+
+def test_geodesic_matches_geopy(pairs):
+    lat1, lon1, lat2, lon2 = pairs
+    expected = [distance.distance((a, b), (c, d)).km for a, b, c, d in zip(lat1, lon1, lat2, lon2)]
+    assert distances(lat1, lon1, lat2, lon2, GEODESIC) == pytest.approx(expected, rel=1e-9, abs=1e-6)
+
+def test_haversine_matches_geopy(pairs):
+    lat1, lon1, lat2, lon2 = pairs
+    expected = [distance.great_circle((a, b), (c, d)).km for a, b, c, d in zip(lat1, lon1, lat2, lon2)]
+    assert distances(lat1, lon1, lat2, lon2, HAVERSINE) == pytest.approx(expected, rel=1e-9)
+
+def test_nearly_antipodal_and_equal_points():
+    lat1, lon1, lat2, lon2 = np.array([[0.0, 0.5, 48.85], [0.0, 0.0, 2.35], [0.0, -0.5, 48.85], [179.7, 179.9, 2.35]])
+    expected = [distance.distance((a, b), (c, d)).km for a, b, c, d in zip(lat1, lon1, lat2, lon2)]
+    assert distances(lat1, lon1, lat2, lon2) == pytest.approx(expected, rel=1e-9, abs=1e-6)
+
+def test_broadcasting_and_unknown_mode():
+    result = distances(np.zeros((3, 1)), np.zeros((3, 1)), np.zeros((1, 4)), np.arange(4.0)[None, :])
+    assert result.shape == (3, 4)
+    assert result[:, 0] == pytest.approx(0)
+    with pytest.raises(ValueError):
+        distances(0, 0, 1, 1, "flat")
@@ -0,0 +1,39 @@
+from lrucache import LRUCache
+
+def test_least_recently_used_is_evicted():
+    evicted = []
+    cache = LRUCache(10, len, on_evict=lambda key, value: evicted.append(key))
+    cache.get('a', lambda: "aaaa")
+    cache.get('b', lambda: "bbbb")
+    # a is used again, so b is the least recently used one
+    assert cache.get('a', lambda: "new") == "aaaa"
+    cache.get('c', lambda: "cccc")
+    assert 'a' in cache and 'b' not in cache and 'c' in cache
+    assert evicted == ['b']
+    assert cache.nbytes == 8
+    assert cache.stats() | {'hit_rate': None} == {
+        'entries': 2, 'nbytes': 8, 'budget': 10, 'hits': 1, 'misses': 3, 'evictions': 1, 'hit_rate': None
+        }
+
+def test_value_over_the_budget_is_not_kept():
+    cache = LRUCache(3, len)
+    cache.get('a', lambda: "aa")
+    assert cache.get('big', lambda: "bbbbbb") == "bbbbbb"
+    assert 'big' not in cache and 'a' in cache
+    assert cache.evictions == 0
+
+def test_several_entries_make_room_for_one():
+    evicted = []
+    cache = LRUCache(6, len, on_evict=lambda key, value: evicted.append((key, value)))
+    for key in "abc":
+        cache.get(key, lambda: "xx")
+    cache.get('d', lambda: "yyyyy")
+    assert evicted == [('a', "xx"), ('b', "xx"), ('c', "xx")]
+    assert len(cache) == 1 and cache.nbytes == 5
+
+def test_clear():
+    cache = LRUCache(10, len)
+    cache.get('a', lambda: "aaaa")
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+    assert cache.get('a', lambda: "new") == "new"
@@ -0,0 +1,98 @@
+from netcache import NetworkCache, CountryShards, cache_key, file_digest, border_index, NODE_COLUMNS, EDGE_COLUMNS
+from compactgraph import CompactGraph
+
+import pandas as pd
+import numpy as np
+import pytest
+import time
+
+KEY = "key"
+
+def country(iso3: str, lat: float) -> CompactGraph:
+    # three nodes in a row, the last one is shared with the next country
+    return CompactGraph(
+        [lat, lat, lat + 1.0], [0.0, 1.0, 1.0], np.zeros(3), [0, 1], [1, 2], np.zeros(2), [iso3],
+        distance=np.array([1.0, 2.0]), speed=np.array([100.0, 100.0])
+        )
+
+@pytest.fixture
+def nets() -> dict[str, CompactGraph]:
+    return {'AAA': country('AAA', 0.0), 'BBB': country('BBB', 1.0)}
+
+@pytest.fixture
+def cache(tmp_path, nets) -> NetworkCache:
+    cache = NetworkCache(str(tmp_path / "network"))
+    cache.save(KEY, nets, CompactGraph.compose(list(nets.values())), metadata={'seed': 7})
+    return cache
+
+def assert_same(graph: CompactGraph, expected: CompactGraph) -> None:
+    # labels are stored by the cache, a fresh graph computes them on first use
+    expected.component_labels()
+    for column in NODE_COLUMNS + EDGE_COLUMNS:
+        np.testing.assert_array_equal(getattr(graph, column), getattr(expected, column))
+    assert graph.countries == expected.countries
+
+def test_round_trip(cache, nets):
+    shards = cache.load(KEY)
+    assert isinstance(shards, CountryShards)
+    assert sorted(shards) == ['AAA', 'BBB']
+    for iso3, graph in nets.items():
+        assert_same(shards[iso3], graph)
+    full = cache.load_full()
+    assert_same(full, CompactGraph.compose(list(nets.values())))
+    # the columns are views of the mapped files
+    assert not full.lat.flags.owndata
+
+def test_manifest(cache):
+    manifest = cache.read_manifest()
+    assert manifest['metadata'] == {'seed': 7}
+    assert [tuple(pair) for pair in manifest['border']] == [('AAA', 'BBB', 1)]
+
+def test_stale_or_missing_cache(cache, tmp_path):
+    assert cache.load("other key") is None
+    assert NetworkCache(str(tmp_path / "nowhere")).load(KEY) is None
+
+def test_save_replaces_the_old_cache(cache, nets):
+    nets['AAA'] = country('AAA', 5.0)
+    cache.save("new key", {'AAA': nets['AAA']}, nets['AAA'])
+    assert cache.load(KEY) is None
+    shards = cache.load("new key")
+    assert list(shards) == ['AAA']
+    assert_same(shards['AAA'], nets['AAA'])
+
+def test_shards_are_dropped_over_budget(cache):
+    # room for one shard only
+    shards = cache.load(KEY, budget=cache.load(KEY)['AAA'].nbytes)
+    a = shards['AAA']
+    shards['BBB']
+    assert 'AAA' not in shards.loaded and 'BBB' in shards.loaded
+    assert shards['AAA'] is not a
+    with pytest.raises(KeyError):
+        shards['CCC']
+
+def test_prefetch_loads_in_the_background(cache):
+    shards = cache.load(KEY)
+    shards.prefetch(['BBB', 'CCC'])
+    for _ in range(100):
+        if 'BBB' in shards.loaded:
+            break
+        time.sleep(0.01)
+    assert 'BBB' in shards.loaded and 'AAA' not in shards.loaded
+
+def test_cache_key():
+    frame = pd.DataFrame({'iso3': ['AAA'], 'shape': ['x']})
+    key = cache_key(frame, extra=(1, ))
+    assert key == cache_key(frame.copy(), extra=(1, ))
+    assert key != cache_key(frame, extra=(2, ))
+    assert key != cache_key(frame.assign(shape=['y']), extra=(1, ))
+
+def test_file_digest(tmp_path):
+    a, b = tmp_path / "a.csv", tmp_path / "b.csv"
+    a.write_text("iso3,shape\nAAA,x\n")
+    b.write_text("iso3,shape\nAAA,y\n")
+    assert file_digest(str(a)) == file_digest(str(a))
+    assert file_digest(str(a)) != file_digest(str(b))
+    assert file_digest(str(a), str(b)) != file_digest(str(b), str(a))
+
+def test_border_index(nets):
+    assert border_index(nets['AAA']) == []
@@ -0,0 +1,108 @@
+from pathfinding import ShortestPathEngine, DEFAULT_PROFILE, DIJKSTRA, ASTAR, SEARCH_MODES, WEIGHT_CALLBACKS, route_matrix
+from compactgraph import CompactGraph
+from networkx import NetworkXNoPath
+
+import networkx as nx
+import numpy as np
+import pytest
+
+QUERIES = 30
+
+@pytest.fixture(scope="module")
+def compact(manager) -> CompactGraph:
+    return manager.compact_nets['BEL']
+
+@pytest.fixture(scope="module")
+def pairs(compact) -> list[tuple[int, int]]:
+    rng = np.random.default_rng(0)
+    node_ids = compact.biggest_component_ids()
+    return [tuple(rng.choice(node_ids, 2).tolist()) for _ in range(QUERIES)]
+
+@pytest.mark.parametrize("mode", SEARCH_MODES)
+def test_costs_match_networkx(manager, compact, pairs, mode):
+    from railwaynet import RailwayNet
+
+    engine = ShortestPathEngine(compact, "distance")
+    net = RailwayNet.from_compact(compact)
+    for source, target in pairs:
+        path = engine.shortest_path(source, target, mode)
+        assert path[0] == source and path[-1] == target
+        expected = nx.dijkstra_path_length(net, compact.point(source), compact.point(target), WEIGHT_CALLBACKS["distance"])
+        assert engine.cost == pytest.approx(expected)
+        assert engine.path_length(path) == pytest.approx(expected)
+
+@pytest.mark.parametrize("mode", SEARCH_MODES)
+def test_costs_match_the_route_matrix(compact, pairs, mode):
+    engine = ShortestPathEngine(compact, DEFAULT_PROFILE)
+    sources, targets = (np.array(ends) for ends in zip(*pairs))
+    costs, _ = route_matrix(compact, sources, targets, DEFAULT_PROFILE, workers=1)
+    for row, (source, target) in enumerate(pairs):
+        engine.shortest_path(source, target, mode)
+        assert engine.cost == pytest.approx(costs[row, row])
+
+def test_astar_settles_fewer_nodes(compact, pairs):
+    engine = ShortestPathEngine(compact, "distance")
+    settled = dict()
+    for mode in (DIJKSTRA, ASTAR):
+        settled[mode] = 0
+        for source, target in pairs:
+            engine.shortest_path(source, target, mode)
+            settled[mode] += engine.settled
+    assert settled[ASTAR] < settled[DIJKSTRA]
+
+@pytest.mark.parametrize("mode", SEARCH_MODES)
+def test_search_from_many_sources(compact, pairs, mode):
+    # the cheapest of every source and target pair, end costs included
+    engine = ShortestPathEngine(compact, "distance")
+    (a, b), (c, d) = pairs[:2]
+    costs = []
+    for source, source_cost in ((a, 0.0), (b, 1.0)):
+        for target, target_cost in ((c, 2.0), (d, 0.0)):
+            engine.shortest_path(source, target)
+            costs.append(source_cost + engine.cost + target_cost)
+    path = engine.search({a: 0.0, b: 1.0}, {c: 2.0, d: 0.0}, mode)
+    assert engine.cost == pytest.approx(min(costs))
+    assert path[0] in (a, b) and path[-1] in (c, d)
+
+@pytest.mark.parametrize("mode", SEARCH_MODES)
+def test_unreachable_and_unknown_mode(compact, mode):
+    engine = ShortestPathEngine(compact, "distance")
+    labels = compact.component_labels()
+    biggest = compact.biggest_component_ids()
+    # synthetic country nets always have small components besides the biggest one
+    outside = np.flatnonzero(labels != labels[biggest[0]])
+    with pytest.raises(NetworkXNoPath):
+        engine.shortest_path(int(biggest[0]), int(outside[0]), mode)
+    with pytest.raises(ValueError):
+        engine.shortest_path(int(biggest[0]), int(biggest[0]), "teleport")
+
+def test_route_matrix_paths_and_unreachable_targets(compact):
+    engine = ShortestPathEngine(compact, DEFAULT_PROFILE)
+    labels = compact.component_labels()
+    biggest = compact.biggest_component_ids()
+    outside = int(np.flatnonzero(labels != labels[biggest[0]])[0])
+    sources = np.array([biggest[0], biggest[1], biggest[0]])
+    targets = np.array([biggest[-1], outside])
+    costs, paths = route_matrix(compact, sources, targets, DEFAULT_PROFILE, with_paths=True, workers=1)
+    assert costs.shape == (3, 2)
+    # a repeated source gets the same row
+    assert costs[0].tolist() == costs[2].tolist()
+    for row, source in enumerate(sources.tolist()):
+        assert costs[row, 1] == np.inf and paths[row][1] is None
+        path = paths[row][0]
+        assert path[0] == source and path[-1] == targets[0]
+        assert engine.path_length(path) == pytest.approx(costs[row, 0])
+
+def test_callbacks_equal_the_profiles():
+    from pathfinding import WEIGHT_PROFILES, get_weights
+
+    # a zero centrality and a missing cost, as on capitals of the synthetic data
+    graph = CompactGraph(
+        [0.0, 0.0, 0.0], [0.0, 1.0, 2.0], np.zeros(3), [0, 1], [1, 2], np.zeros(2), ['AAA'],
+        distance=np.array([1.0, 2.0]), speed=np.array([100.0, 50.0]), centrality=np.array([0.0, 4.0]),
+        cost=np.array([np.nan, 3.0])
+        )
+    for profile in WEIGHT_PROFILES:
+        weights = get_weights(graph, profile)
+        for edge, weight in enumerate(weights.tolist()):
+            assert WEIGHT_CALLBACKS[profile](0, 1, graph.edge_attributes(edge)) == weight
@@ -0,0 +1,122 @@
+from pathfinding import WEIGHT_CALLBACKS, DEFAULT_PROFILE
+
+import networkx as nx
+import pytest
+import os
+
+# pairs share edges in the synthetic data, the single country and the distant pair do not
+COUNTRY_SETS = [['FRA', 'BEL'], ['BEL', 'NLD', 'LUX'], ['CHE'], ['DEU', 'NLD']]
+
+def edge_set(graph) -> set:
+    return {frozenset(edge) for edge in graph.edges}
+
+@pytest.mark.parametrize("iso3_lst", COUNTRY_SETS)
+def test_nets_have_the_nodes_and_edges_of_the_countries(manager, iso3_lst):
+    copy = manager.get_nets(iso3_lst, recalculate_centrality=False)
+    nodes = set()
+    edges = set()
+    for iso3 in iso3_lst:
+        compact = manager.compact_nets[iso3]
+        points = compact.points()
+        nodes.update(points)
+        edges.update(frozenset((points[u], points[v])) for u, v in zip(compact.src.tolist(), compact.dst.tolist()))
+    assert set(copy.nodes) == nodes
+    assert edge_set(copy) == edges
+
+def test_custom_weight_routes_on_the_copy(manager):
+    from railwaynet import PathEdgePoint
+
+    func = WEIGHT_CALLBACKS[DEFAULT_PROFILE]
+    copy = manager.get_nets(['BEL', 'NLD'], recalculate_centrality=False)
+    component = copy.subgraph(max(nx.connected_components(copy), key=len))
+    start, finish = (
+        min((node for node, node_iso3 in component.nodes(data='iso3') if node_iso3 == iso3), key=lambda node: node.coord)
+            for iso3 in ('BEL', 'NLD')
+        )
+    manager.start_node = PathEdgePoint(start, 'BEL')
+    manager.finish_node = PathEdgePoint(finish, 'NLD')
+    paths = [None, None]
+    try:
+        manager.find_path(paths, func_d=func)
+    finally:
+        manager.start_node = None
+        manager.finish_node = None
+
+    assert len(paths[0]) == 2
+    assert paths[1] == nx.dijkstra_path(copy, start, finish, func)
+
+def test_same_country_query_loads_only_its_shard(workdir, graph_data, countries_data, country_ends):
+    from railwaynet import RailwayNetManager
+    from conftest import SEED
+
+    # a second manager over the session's cache, nothing of the world is loaded yet
+    fresh = RailwayNetManager(graph_data, countries_data, seed=SEED, workers=1)
+    fresh.start_node, fresh.finish_node = country_ends('LUX')
+    paths = [None, None]
+    fresh.find_path(paths)
+    assert paths[1][0] == fresh.start_node.node and paths[1][-1] == fresh.finish_node.node
+    assert fresh._RailwayNetManager__full_compact is None
+
+def test_warm_start_does_not_read_the_trails(graph_data, countries_data, tmp_path, monkeypatch):
+    from railwaynet import RailwayNetManager
+    from conftest import SEED
+
+    # a cache of its own, the session's is keyed by the frames
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("cached")
+    reads = []
+
+    def read_trains():
+        reads.append(True)
+        return graph_data
+
+    built = RailwayNetManager(read_trains, countries_data, seed=SEED, workers=1, data_key="trains")
+    warm = RailwayNetManager(read_trains, countries_data, seed=SEED, workers=1, data_key="trains")
+    assert len(reads) == 1
+    assert warm.countries_sorted == built.countries_sorted
+    assert warm.get_net('LUX').number_of_edges() == built.get_net('LUX').number_of_edges()
+
+def test_nets_are_evicted_over_budget(workdir, graph_data, countries_data):
+    from railwaynet import RailwayNetManager
+    from conftest import SEED
+
+    fresh = RailwayNetManager(graph_data, countries_data, seed=SEED, workers=1)
+    fra = fresh.get_net('FRA')
+    # room for one country net only
+    fresh.nets.budget = fresh.nets.nbytes
+    assert fresh.get_net('FRA') is fra
+    fresh.get_net('DEU')
+    assert fresh['FRA'] is None and fresh['DEU'] is not None
+    assert fresh.nets.evictions == 1
+    assert fresh.get_net('FRA') is not fra
+
+def test_hierarchy_self_check(manager):
+    import random
+
+    # zero centrality edges around capitals weigh inf, networkx must not divide by zero on them
+    if manager.get_hierarchy(DEFAULT_PROFILE) is None:
+        manager.prepare_hierarchies((DEFAULT_PROFILE, ))
+    random.seed(0)
+    assert manager.test_hierarchy(DEFAULT_PROFILE, queries=20) == 0
+
+def test_efficiency_runs_every_mode(manager):
+    from pathfinding import SEARCH_MODES
+    from railwaynet import CONTRACTION_HIERARCHY
+
+    if manager.get_hierarchy(DEFAULT_PROFILE) is None:
+        manager.prepare_hierarchies((DEFAULT_PROFILE, ))
+    modes = SEARCH_MODES + (CONTRACTION_HIERARCHY, )
+    efficiency = manager.test_efficiency(modes, queries=10, seed=0, profile=DEFAULT_PROFILE)
+    counts = {mode: len(efficiency[mode]['time']) for mode in modes + ('networkx', )}
+    assert len(set(counts.values())) == 1 and counts['networkx'] > 0
+
+def test_route_matrix_reuses_the_weight_matrix(manager, country_ends, monkeypatch):
+    import pathfinding
+
+    ends = [node.node for node in country_ends('BEL')]
+    costs, _ = manager.route_matrix(ends, ends, workers=1)
+    # a second request builds nothing, and the inline search leaves no matrix in the module global
+    monkeypatch.setattr(pathfinding, 'weight_matrix', None)
+    assert manager.route_matrix(ends, ends, workers=1)[0].tolist() == costs.tolist()
+    assert manager.get_matrix() is manager.matrices[DEFAULT_PROFILE]
+    assert pathfinding._route_matrix is None
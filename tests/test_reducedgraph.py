@@ -0,0 +1,57 @@
+from reducedgraph import ReducedGraph
+from pathfinding import ShortestPathEngine, DEFAULT_PROFILE, SEARCH_MODES
+from compactgraph import CompactGraph
+from networkx import NetworkXNoPath
+
+import numpy as np
+import pytest
+
+QUERIES = 30
+
+@pytest.fixture(scope="module")
+def compact(manager) -> CompactGraph:
+    return manager.compact_nets['NLD']
+
+@pytest.fixture(scope="module")
+def reduced(compact) -> ReducedGraph:
+    return ReducedGraph.build(compact)
+
+def line(centrality: list[float]) -> CompactGraph:
+    # 0 - 1 - 2 - 3 - 4, a single chain between two dead ends
+    n = len(centrality) + 1
+    return CompactGraph(
+        np.zeros(n), np.arange(n, dtype=np.float64), np.zeros(n), np.arange(n - 1), np.arange(1, n), np.zeros(n - 1), ['AAA'],
+        distance=np.ones(n - 1), speed=np.full(n - 1, 100.0), centrality=np.array(centrality), cost=np.zeros(n - 1)
+        )
+
+def test_chains_are_collapsed(compact, reduced):
+    assert reduced.graph.number_of_nodes < compact.number_of_nodes
+    # every original edge belongs to exactly one reduced edge
+    assert sorted(reduced.members.tolist()) == list(range(compact.number_of_edges))
+
+@pytest.mark.parametrize("mode", SEARCH_MODES)
+def test_costs_match_the_original_graph(compact, reduced, mode):
+    engine = ShortestPathEngine(compact, DEFAULT_PROFILE)
+    rng = np.random.default_rng(0)
+    node_ids = compact.biggest_component_ids()
+    for source, target in (rng.choice(node_ids, 2).tolist() for _ in range(QUERIES)):
+        path = reduced.shortest_path(source, target, DEFAULT_PROFILE, mode)
+        engine.shortest_path(source, target)
+        assert path[0] == source and path[-1] == target
+        assert all(v in compact.neighbours(u) for u, v in zip(path[:-1], path[1:]))
+        assert engine.path_length(path) == pytest.approx(engine.cost)
+
+def test_ends_inside_one_chain():
+    reduced = ReducedGraph.build(line([1.0, 1.0, 1.0, 1.0]))
+    assert reduced.graph.number_of_nodes == 2
+    assert reduced.shortest_path(1, 3) == [1, 2, 3]
+    assert reduced.shortest_path(3, 1) == [3, 2, 1]
+    assert reduced.shortest_path(0, 2) == [0, 1, 2]
+
+def test_an_infinite_edge_only_blocks_paths_through_it():
+    # zero centrality gives the first edge an infinite default weight, chain sums after it must stay finite
+    reduced = ReducedGraph.build(line([0.0, 1.0, 1.0, 1.0]))
+    assert reduced.shortest_path(2, 3) == [2, 3]
+    assert reduced.shortest_path(1, 4) == [1, 2, 3, 4]
+    with pytest.raises(NetworkXNoPath):
+        reduced.shortest_path(0, 3)
@@ -0,0 +1,56 @@
+from routingmetrics import RoutingMetrics, Histogram, summary, SEARCH, TOTAL, SETTLED
+from concurrent.futures import ProcessPoolExecutor
+
+import multiprocessing
+import json
+import os
+import pytest
+
+_metrics = None
+
+def _record(records: int) -> int:
+    for _ in range(records):
+        _metrics.record(**{SEARCH: 0.001, TOTAL: 0.002, SETTLED: 10})
+    return os.getpid()
+
+def read(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_histogram_percentiles():
+    histogram = Histogram(1e-3, 1e3)
+    for value in range(1, 101):
+        histogram.record(value)
+    assert histogram.count == 100
+    assert histogram.percentile(50) == pytest.approx(50, rel=0.15)
+    assert histogram.percentile(100) == 100
+    assert Histogram(1, 10).percentile(50) is None
+
+def test_raw_summary():
+    assert summary([]) == {'count': 0}
+    assert summary([1.0, 2.0, 3.0])['median'] == 2.0
+
+def test_records_reach_the_file(tmp_path):
+    metrics = RoutingMetrics(str(tmp_path / "metrics.jsonl"))
+    metrics.record(**{SEARCH: 0.5, TOTAL: 1.0})
+    metrics.flush()
+    assert read(metrics.path) == [{SEARCH: 0.5, TOTAL: 1.0}]
+    assert metrics.summary()[SEARCH]['count'] == 1
+    metrics.close()
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_forked_workers_send_records_to_the_owner(tmp_path):
+    global _metrics
+    _metrics = RoutingMetrics(str(tmp_path / "metrics.jsonl"))
+    _metrics.record(**{TOTAL: 1.0})
+
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('fork')) as executor:
+        pids = set(executor.map(_record, [10] * 4))
+
+    # pool workers leave through os._exit, their records were written to the pipe before they returned
+    assert os.getpid() not in pids
+    _metrics.flush()
+    assert len(read(_metrics.path)) == 41
+    assert _metrics.summary()[TOTAL]['count'] == 41
+    assert list(tmp_path.iterdir()) == [tmp_path / "metrics.jsonl"]
+    _metrics.close()
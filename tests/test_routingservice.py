@@ -0,0 +1,99 @@
+from routingservice import RoutingService, ROUTE, SNAP, MATRIX, _init_service_worker, _serve_batch
+from http import HTTPStatus
+
+import asyncio
+import socket
+import json
+import pytest
+
+def route_payload(start, finish, **extra) -> dict:
+    return {
+        'frm_lat': start.node.lat, 'frm_lon': start.node.lon, 'frm_iso3': start.iso3,
+        'to_lat': finish.node.lat, 'to_lon': finish.node.lon, 'to_iso3': finish.iso3,
+        **extra
+        }
+
+@pytest.fixture(scope="module")
+def worker(manager):
+    _init_service_worker(manager)
+
+def test_batch_statuses(worker, country_ends):
+    start, finish = country_ends('BEL')
+    node = start.node
+    results = _serve_batch([
+        (ROUTE, route_payload(start, finish)),
+        (ROUTE, route_payload(start, finish, profile="unknown")),
+        (ROUTE, route_payload(start, finish, mode="unknown")),
+        (SNAP, {'lat': node.lat, 'lon': node.lon, 'k': 2}),
+        (SNAP, {'lat': node.lat, 'lon': node.lon, 'k': 0}),
+        (SNAP, {'lat': node.lat}),
+        (MATRIX, {'origins': [[node.lat, node.lon]], 'destinations': [[node.lat, node.lon]], 'profile': "unknown"}),
+        ])
+    assert [status for status, _ in results] == [
+        HTTPStatus.OK, HTTPStatus.BAD_REQUEST, HTTPStatus.BAD_REQUEST,
+        HTTPStatus.OK, HTTPStatus.BAD_REQUEST, HTTPStatus.BAD_REQUEST, HTTPStatus.BAD_REQUEST
+        ]
+    assert results[0][1]['status'] == "ok"
+    assert tuple(results[3][1]['nodes'][0]) == tuple(node.coord_reverse)
+    assert "profile" in results[1][1]['error']
+
+def test_unexpected_error_is_isolated(worker, country_ends, monkeypatch):
+    import routingservice
+
+    def fail(payload):
+        raise RuntimeError("broken")
+
+    monkeypatch.setitem(routingservice._SERVE, MATRIX, fail)
+    start, finish = country_ends('BEL')
+    results = _serve_batch([(MATRIX, {}), (ROUTE, route_payload(start, finish))])
+    assert [status for status, _ in results] == [HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.OK]
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def request(port: int, method: str, path: str, body: dict = None) -> tuple[int, dict]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    while await reader.readline() not in (b'\r\n', b''):
+        pass
+    response = json.loads(await reader.read())
+    writer.close()
+    return status, response
+
+def test_live_service(manager, country_ends):
+    service = RoutingService(manager, workers=1)
+    port = free_port()
+    start, finish = country_ends('NLD')
+
+    async def run():
+        server = asyncio.create_task(service.serve("127.0.0.1", port))
+        try:
+            for _ in range(100):
+                try:
+                    await request(port, "GET", "/health")
+                    break
+                except ConnectionError:
+                    await asyncio.sleep(0.05)
+            return await asyncio.gather(
+                request(port, "GET", "/health"),
+                request(port, "POST", "/route", route_payload(start, finish)),
+                request(port, "POST", "/route", route_payload(start, finish, profile="unknown")),
+                request(port, "POST", "/snap", {'lat': 0, 'lon': 0, 'k': -1}),
+                request(port, "GET", "/route"),
+                request(port, "POST", "/nowhere", {}),
+                )
+        finally:
+            server.cancel()
+
+    try:
+        responses = asyncio.run(run())
+    finally:
+        service.executor.shutdown(cancel_futures=True)
+    assert [status for status, _ in responses] == [200, 200, 400, 400, 405, 404]
+    assert responses[0][1]['workers'] == 1
+    assert responses[1][1]['status'] == "ok"
@@ -0,0 +1,85 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from routingmetrics import TOTAL
+from time import perf_counter, sleep
+
+import pygame as pg
+import pytest
+
+# searches with this profile take longer than any test waits
+SLOW = "slow"
+TIMEOUT = 10.0
+
+@pytest.fixture
+def worker(manager, monkeypatch):
+    import routingworker
+
+    route = routingworker._route
+
+    def slow_route(manager, task):
+        if task[2] == SLOW:
+            sleep(10 * TIMEOUT)
+        return route(manager, task)
+
+    # patched before the fork, so the worker process runs it
+    monkeypatch.setattr(routingworker, "_route", slow_route)
+    pg.display.init()
+    worker = routingworker.RoutingWorker(manager)
+    yield worker
+    worker.close()
+    pg.display.quit()
+
+def next_event(worker, timeout: float = TIMEOUT):
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline:
+        events = pg.event.get(worker.event_type)
+        if events:
+            return events
+        sleep(0.01)
+    return []
+
+def test_result_is_posted(worker, country_ends):
+    request = worker.submit(*country_ends('FRA'))
+    events = next_event(worker)
+    assert [event.request for event in events] == [request]
+    assert events[0].error is None
+    assert len(events[0].paths[1]) > 1
+
+def test_error_is_posted(worker, country_ends):
+    request = worker.submit(*country_ends('FRA'), mode="unknown")
+    events = next_event(worker)
+    assert [event.request for event in events] == [request]
+    assert isinstance(events[0].error, ValueError)
+
+def test_running_search_does_not_block_the_next(worker, country_ends):
+    worker.submit(*country_ends('DEU'), profile=SLOW)
+    # gives the worker time to start the slow search
+    sleep(0.2)
+    request = worker.submit(*country_ends('FRA'))
+    events = next_event(worker)
+    assert [event.request for event in events] == [request]
+    # the slow search is gone with its process, nothing else arrives
+    assert next_event(worker, 0.5) == []
+
+def test_cancelled_search_is_not_posted(worker, country_ends):
+    worker.submit(*country_ends('FRA'))
+    worker.cancel()
+    assert next_event(worker, 1.0) == []
+    request = worker.submit(*country_ends('BEL'))
+    assert [event.request for event in next_event(worker)] == [request]
+
+def test_restarted_worker_records_to_the_owner(worker, country_ends):
+    import glob
+
+    metrics = worker.manager.metrics
+    metrics.flush()
+    before = metrics.summary()[TOTAL]['count']
+    worker.submit(*country_ends('DEU'), profile=SLOW)
+    sleep(0.2)
+    # the slow search is killed, its replacement is a new process with a new pid
+    request = worker.submit(*country_ends('FRA'))
+    assert [event.request for event in next_event(worker)] == [request]
+    metrics.flush()
+    assert metrics.summary()[TOTAL]['count'] == before + 1
+    assert glob.glob(os.path.join(os.path.dirname(metrics.path), "metrics.*.jsonl")) == []
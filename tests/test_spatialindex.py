@@ -0,0 +1,61 @@
+from spatialindex import SpatialIndex
+from geograph import distances, HAVERSINE
+
+import numpy as np
+import pytest
+
+K = 5
+
+@pytest.fixture(scope="module")
+def nodes():
+    rng = np.random.default_rng(0)
+    # across the antimeridian too, where planar indexes go wrong
+    return rng.uniform(-60, 60, 2000), rng.uniform(-180, 180, 2000)
+
+@pytest.fixture(scope="module")
+def index(nodes):
+    return SpatialIndex(*nodes)
+
+def brute_force(nodes, lat: float, lon: float) -> np.ndarray:
+    return distances(lat, lon, nodes[0], nodes[1], HAVERSINE)
+
+def test_nearest_matches_brute_force(nodes, index):
+    rng = np.random.default_rng(1)
+    lat, lon = rng.uniform(-60, 60, 50), rng.uniform(-180, 180, 50)
+    node_ids, km = index.nearest(lat, lon, K)
+    assert node_ids.shape == (50, K)
+    for i in range(50):
+        expected = brute_force(nodes, lat[i], lon[i])
+        assert node_ids[i].tolist() == np.argsort(expected)[:K].tolist()
+        assert km[i] == pytest.approx(np.sort(expected)[:K], rel=1e-6)
+
+def test_nearest_across_the_antimeridian():
+    index = SpatialIndex([0.0, 0.0], [179.9, 170.0])
+    node_ids, _ = index.nearest(0.0, -179.9)
+    assert node_ids[0].tolist() == [0]
+
+def test_lookup_is_exact(nodes, index):
+    assert index.lookup(nodes[0][7], nodes[1][7]) == 7
+    assert index.lookup(nodes[0][7] + 1e-9, nodes[1][7]) is None
+
+def test_within(nodes, index):
+    lat, lon = nodes[0][3], nodes[1][3]
+    found = index.within(lat, lon, 500.0)
+    expected = brute_force(nodes, lat, lon)
+    assert sorted(found.tolist()) == np.flatnonzero(expected < 500.0).tolist()
+    assert found[0] == 3
+
+def test_restrict_keeps_graph_ids(nodes, index):
+    subset = np.arange(0, 2000, 3)
+    restricted = index.restrict(subset)
+    node_ids, _ = restricted.nearest(nodes[0][4], nodes[1][4])
+    assert node_ids[0][0] in subset
+    assert restricted.lookup(nodes[0][6], nodes[1][6]) == 6
+    assert index.restrict(np.empty(0, dtype=np.int64)).nearest(0.0, 0.0)[0].shape == (1, 0)
+
+def test_save_and_load(nodes, index, tmp_path):
+    path = str(tmp_path / "index.pickle")
+    index.save(path)
+    loaded = SpatialIndex.load(path)
+    assert loaded.nearest(10.0, 20.0, K)[0].tolist() == index.nearest(10.0, 20.0, K)[0].tolist()
+    assert list(tmp_path.iterdir()) == [tmp_path / "index.pickle"]